@@ -0,0 +1,88 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""Compares the training step time of the eager and the compiled ClimaX encoder on CPU.
+
+Example:
+    python benchmarks/benchmark_compile.py --num_vars 8 --embed_dim 128 --depth 4
+"""
+
+import argparse
+import time
+
+import torch
+
+from climax.arch import ClimaX
+from climax.utils.metrics import lat_weighted_mse
+
+
+def build_model(args):
+    variables = tuple(f"var_{i}" for i in range(args.num_vars))
+    model = ClimaX(
+        variables,
+        img_size=args.img_size,
+        patch_size=args.patch_size,
+        embed_dim=args.embed_dim,
+        depth=args.depth,
+        decoder_depth=1,
+        num_heads=args.num_heads,
+        parallel_patch_embed=True,
+    )
+    return model, variables
+
+
+def time_steps(model, variables, args):
+    optimizer = torch.optim.AdamW(model.parameters(), lr=1e-4)
+    x = torch.randn(args.batch_size, len(variables), *args.img_size)
+    y = torch.randn(args.batch_size, len(variables), *args.img_size)
+    lead_times = torch.rand(args.batch_size)
+    lat = torch.linspace(-90, 90, args.img_size[0]).numpy()
+
+    def step():
+        loss_dict, _ = model.forward(x, y, lead_times, variables, variables, [lat_weighted_mse], lat=lat)
+        loss = loss_dict[0]["loss"]
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+
+    # the first steps include tracing and compilation
+    for _ in range(args.warmup_steps):
+        step()
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        step()
+    return (time.perf_counter() - start) / args.steps
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--img_size", type=int, nargs=2, default=[32, 64])
+    parser.add_argument("--patch_size", type=int, default=4)
+    parser.add_argument("--num_vars", type=int, default=8)
+    parser.add_argument("--embed_dim", type=int, default=128)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--num_heads", type=int, default=4)
+    parser.add_argument("--batch_size", type=int, default=4)
+    parser.add_argument("--warmup_steps", type=int, default=3)
+    parser.add_argument("--steps", type=int, default=10)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    model, variables = build_model(args)
+    var_ids = model.get_var_ids(variables, torch.device("cpu"))
+    lead_times = torch.rand(args.batch_size)
+    x = torch.randn(args.batch_size, len(variables), *args.img_size)
+    explanation = torch._dynamo.explain(model.forward_encoder)(x, lead_times, var_ids)
+    print(f"encoder graphs: {explanation.graph_count}, graph breaks: {explanation.graph_break_count}")
+
+    eager_time = time_steps(model, variables, args)
+    model.compile_encoder()
+    compiled_time = time_steps(model, variables, args)
+
+    print(f"eager:    {eager_time * 1000:.1f} ms/step")
+    print(f"compiled: {compiled_time * 1000:.1f} ms/step")
+    print(f"speedup:  {eager_time / compiled_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""Compares the training step time and peak memory of full and local attention in the ClimaX backbone.
+
+Each configuration runs in a separate process, so that the peak memory on CPU is the maximum resident
+set size of that process. Configurations that run out of memory are reported as such.
+
+Example:
+    python benchmarks/benchmark_local_attention.py --grids 32x64 128x256 256x512 --patch_size 4
+"""
+
+import argparse
+import multiprocessing as mp
+import resource
+import time
+
+import torch
+
+from climax.arch import ClimaX
+from climax.utils.metrics import lat_weighted_mse
+
+
+def run(img_size, local, args):
+    variables = tuple(f"var_{i}" for i in range(args.num_vars))
+    model = ClimaX(
+        variables,
+        img_size=img_size,
+        patch_size=args.patch_size,
+        embed_dim=args.embed_dim,
+        depth=args.depth,
+        decoder_depth=1,
+        num_heads=args.num_heads,
+        parallel_patch_embed=True,
+        local_attn_blocks=list(range(args.depth)) if local else None,
+        local_attn_window=args.window,
+        num_global_tokens=args.num_global_tokens if local else 0,
+    ).to(args.device)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=1e-4)
+    x = torch.randn(args.batch_size, len(variables), *img_size, device=args.device)
+    y = torch.randn(args.batch_size, len(variables), *img_size, device=args.device)
+    lead_times = torch.rand(args.batch_size, device=args.device)
+    lat = torch.linspace(-90, 90, img_size[0]).numpy()
+
+    def step():
+        loss_dict, _ = model.forward(x, y, lead_times, variables, variables, [lat_weighted_mse], lat=lat)
+        optimizer.zero_grad()
+        loss_dict[0]["loss"].backward()
+        optimizer.step()
+
+    step()
+    if args.device == "cuda":
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        step()
+    if args.device == "cuda":
+        torch.cuda.synchronize()
+        peak_memory = torch.cuda.max_memory_allocated() / 2**20
+    else:
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+    return (time.perf_counter() - start) / args.steps, peak_memory
+
+
+def worker(queue, img_size, local, args):
+    try:
+        queue.put(run(img_size, local, args))
+    except (RuntimeError, MemoryError):  # out of memory
+        queue.put(None)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--grids", nargs="+", default=["32x64", "128x256", "256x512"])
+    parser.add_argument("--patch_size", type=int, default=4)
+    parser.add_argument("--window", type=int, nargs=2, default=[3, 5])
+    parser.add_argument("--num_global_tokens", type=int, default=4)
+    parser.add_argument("--num_vars", type=int, default=4)
+    parser.add_argument("--embed_dim", type=int, default=128)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--num_heads", type=int, default=4)
+    parser.add_argument("--batch_size", type=int, default=1)
+    parser.add_argument("--steps", type=int, default=3)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    print(f"{'grid':>10} {'tokens':>7} {'attention':>9} {'ms/step':>10} {'peak MiB':>10}")
+    for grid in args.grids:
+        img_size = [int(s) for s in grid.split("x")]
+        num_tokens = img_size[0] * img_size[1] // args.patch_size**2
+        for local in (False, True):
+            queue = ctx.Queue()
+            process = ctx.Process(target=worker, args=(queue, img_size, local, args))
+            process.start()
+            process.join()
+            result = queue.get() if process.exitcode == 0 else None
+            name = "local" if local else "full"
+            if result is None:
+                print(f"{grid:>10} {num_tokens:>7} {name:>9} {'OOM':>10} {'OOM':>10}")
+            else:
+                print(f"{grid:>10} {num_tokens:>7} {name:>9} {result[0] * 1000:>10.1f} {result[1]:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
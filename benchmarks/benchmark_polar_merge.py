@@ -0,0 +1,100 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""Measures the throughput gain and the accuracy cost of merging polar tokens.
+
+Trains ClimaX with and without `merge_polar_tokens` on synthetic smooth fields advected in longitude
+by the lead time, then reports the number of tokens, the training step time and `lat_weighted_rmse` on
+held-out samples.
+
+Example:
+    python benchmarks/benchmark_polar_merge.py --img_size 32 64 --patch_size 2 --steps 200
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from climax.arch import ClimaX
+from climax.utils.metrics import lat_weighted_mse, lat_weighted_rmse
+
+
+def sample(batch_size, num_vars, img_size, generator):
+    # sums of low order waves on the sphere, the target is the input rotated eastwards by the lead time
+    h, w = img_size
+    lat = torch.deg2rad(-90 + (torch.arange(h) + 0.5) * 180 / h).view(h, 1)
+    lon = torch.linspace(0, 2 * np.pi, w + 1)[:w].view(1, w)
+    lead_times = torch.rand(batch_size, generator=generator)
+    x = torch.zeros(batch_size, num_vars, h, w)
+    y = torch.zeros(batch_size, num_vars, h, w)
+    for k in range(1, 5):
+        amp, phase, lat_phase = torch.randn(3, batch_size, num_vars, 1, 1, generator=generator)
+        shift = lead_times.view(-1, 1, 1, 1)
+        x += amp * torch.cos(k * lon + phase) * torch.cos(lat) * torch.cos(k * lat + lat_phase)
+        y += amp * torch.cos(k * (lon - shift) + phase) * torch.cos(lat) * torch.cos(k * lat + lat_phase)
+    return x, y, lead_times
+
+
+def train_and_evaluate(merge_polar_tokens, args):
+    torch.manual_seed(0)
+    generator = torch.Generator().manual_seed(0)
+    variables = tuple(f"var_{i}" for i in range(args.num_vars))
+    model = ClimaX(
+        variables,
+        img_size=args.img_size,
+        patch_size=args.patch_size,
+        embed_dim=args.embed_dim,
+        depth=args.depth,
+        decoder_depth=1,
+        num_heads=args.num_heads,
+        drop_path=0,
+        drop_rate=0,
+        parallel_patch_embed=True,
+        merge_polar_tokens=merge_polar_tokens,
+    )
+    num_tokens = len(model.merge_counts) if merge_polar_tokens else model.num_patches
+    optimizer = torch.optim.AdamW(model.parameters(), lr=args.lr)
+    lat = (-90 + (np.arange(args.img_size[0]) + 0.5) * 180 / args.img_size[0]).astype(np.float32)
+
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        x, y, lead_times = sample(args.batch_size, args.num_vars, args.img_size, generator)
+        loss_dict, _ = model.forward(x, y, lead_times, variables, variables, [lat_weighted_mse], lat=lat)
+        optimizer.zero_grad()
+        loss_dict[0]["loss"].backward()
+        optimizer.step()
+    step_time = (time.perf_counter() - start) / args.steps
+
+    model.eval()
+    generator.manual_seed(1)
+    x, y, lead_times = sample(args.eval_batch_size, args.num_vars, args.img_size, generator)
+    with torch.no_grad():
+        _, preds = model.forward(x, y, lead_times, variables, variables, None, lat=lat)
+        rmse = lat_weighted_rmse(preds, y, lambda t: t, variables, lat, None, "eval")["w_rmse"]
+    return num_tokens, step_time, rmse
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--img_size", type=int, nargs=2, default=[32, 64])
+    parser.add_argument("--patch_size", type=int, default=2)
+    parser.add_argument("--num_vars", type=int, default=2)
+    parser.add_argument("--embed_dim", type=int, default=64)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--num_heads", type=int, default=4)
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--eval_batch_size", type=int, default=32)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--steps", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'merge':>6} {'tokens':>7} {'ms/step':>9} {'w_rmse':>8}")
+    for merge_polar_tokens in (False, True):
+        num_tokens, step_time, rmse = train_and_evaluate(merge_polar_tokens, args)
+        print(f"{str(merge_polar_tokens):>6} {num_tokens:>7} {step_time * 1000:>9.1f} {rmse:>8.4f}")
+
+
+if __name__ == "__main__":
+    main()
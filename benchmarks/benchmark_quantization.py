@@ -0,0 +1,79 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""Measures the CPU latency and the accuracy cost of int8 dynamic quantization of ClimaX.
+
+Runs single forecasts with the fp32 model and its quantized copy, see `climax.export.quantize_net`, and reports
+the latencies and `lat_weighted_rmse` of the quantized predictions against the fp32 ones, in normalized units.
+A trained model can be given as a weights file of `climax-export`, a random one of the given size is used
+otherwise.
+
+Example:
+    python benchmarks/benchmark_quantization.py --embed_dim 1024 --depth 8 --num_heads 16
+    python benchmarks/benchmark_quantization.py --weights climax.pt
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from climax.arch import ClimaX
+from climax.export import load_net, quantize_net
+from climax.utils.metrics import lat_weighted_rmse
+
+
+def measure(model, x, lead_times, variables, steps):
+    with torch.inference_mode():
+        model(x, None, lead_times, variables, variables, None, None)
+        start = time.perf_counter()
+        for _ in range(steps):
+            _, preds = model(x, None, lead_times, variables, variables, None, None)
+    return (time.perf_counter() - start) / steps, preds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--weights", type=str, default=None, help="Weights file of climax-export.")
+    parser.add_argument("--img_size", type=int, nargs=2, default=[32, 64])
+    parser.add_argument("--patch_size", type=int, default=2)
+    parser.add_argument("--num_vars", type=int, default=48)
+    parser.add_argument("--embed_dim", type=int, default=512)
+    parser.add_argument("--depth", type=int, default=8)
+    parser.add_argument("--num_heads", type=int, default=8)
+    parser.add_argument("--batch_size", type=int, default=1)
+    parser.add_argument("--steps", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.weights is not None:
+        model = load_net(args.weights).float()
+    else:
+        variables = tuple(f"var_{i}" for i in range(args.num_vars))
+        model = ClimaX(
+            variables,
+            img_size=args.img_size,
+            patch_size=args.patch_size,
+            embed_dim=args.embed_dim,
+            depth=args.depth,
+            num_heads=args.num_heads,
+        ).eval()
+    variables = tuple(model.default_vars)
+    quantized = quantize_net(model)
+
+    torch.manual_seed(0)
+    h, w = model.img_size
+    x = torch.randn(args.batch_size, len(variables), h, w)
+    lead_times = torch.full((args.batch_size,), 0.72)
+    lat = -90 + (np.arange(h) + 0.5) * 180 / h
+
+    fp32_time, ref = measure(model, x, lead_times, variables, args.steps)
+    int8_time, preds = measure(quantized, x, lead_times, variables, args.steps)
+    rmse = lat_weighted_rmse(preds, ref, lambda t: t, variables, lat, None, "")["w_rmse"]
+    print(f"threads: {torch.get_num_threads()}, batch size: {args.batch_size}")
+    print(f"fp32: {fp32_time * 1000:.1f} ms, int8: {int8_time * 1000:.1f} ms, speedup: {fp32_time / int8_time:.2f}x")
+    print(f"w_rmse of int8 against fp32: {rmse:.4f} (std of fp32 predictions: {ref.std():.4f})")
+
+
+if __name__ == "__main__":
+    main()
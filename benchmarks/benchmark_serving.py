@@ -0,0 +1,82 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""Measures the latency and the throughput of `ForecastServer` under a synthetic load.
+
+Requests of single initial conditions with random lead times arrive as a Poisson process, the benchmark
+reports the p50/p99 latencies and the throughput with micro-batching and without (`max_batch_size=1`).
+
+Example:
+    python benchmarks/benchmark_serving.py --rate 150 --num_requests 1000 --max_batch_size 16
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+import numpy as np
+import torch
+
+from climax.arch import ClimaX
+from climax.serving import ForecastServer
+
+
+async def generate_load(server, variables, args):
+    x = torch.rand(len(variables), *args.img_size)
+    latencies = []
+
+    async def request():
+        start = time.perf_counter()
+        await server.predict(x, random.random(), variables, variables)
+        latencies.append(time.perf_counter() - start)
+
+    tasks = []
+    start = time.perf_counter()
+    for _ in range(args.num_requests):
+        tasks.append(asyncio.create_task(request()))
+        await asyncio.sleep(random.expovariate(args.rate))
+    await asyncio.gather(*tasks)
+    return np.array(latencies), args.num_requests / (time.perf_counter() - start)
+
+
+async def benchmark(model, variables, max_batch_size, args):
+    random.seed(0)
+    async with ForecastServer(model, max_batch_size=max_batch_size, max_latency=args.max_latency) as server:
+        await server.warmup(variables, variables)
+        return await generate_load(server, variables, args)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--img_size", type=int, nargs=2, default=[32, 64])
+    parser.add_argument("--patch_size", type=int, default=4)
+    parser.add_argument("--num_vars", type=int, default=4)
+    parser.add_argument("--embed_dim", type=int, default=128)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--num_heads", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=150, help="Requests per second.")
+    parser.add_argument("--num_requests", type=int, default=1000)
+    parser.add_argument("--max_batch_size", type=int, default=16)
+    parser.add_argument("--max_latency", type=float, default=0.01, help="Seconds.")
+    args = parser.parse_args()
+
+    variables = tuple(f"var_{i}" for i in range(args.num_vars))
+    model = ClimaX(
+        variables,
+        img_size=args.img_size,
+        patch_size=args.patch_size,
+        embed_dim=args.embed_dim,
+        depth=args.depth,
+        num_heads=args.num_heads,
+    ).eval()
+
+    print(f"{'batch':>6} {'p50 ms':>8} {'p99 ms':>8} {'req/s':>8}")
+    for max_batch_size in (1, args.max_batch_size):
+        latencies, throughput = asyncio.run(benchmark(model, variables, max_batch_size, args))
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        print(f"{max_batch_size:>6} {p50:>8.1f} {p99:>8.1f} {throughput:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,26 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
-from functools import lru_cache
+from collections import OrderedDict
 
 import numpy as np
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
+from timm.models.layers import DropPath
 from timm.models.vision_transformer import Block, PatchEmbed, trunc_normal_
 
+from climax.utils.metrics import EnsembleStats, MetricsContext
 from climax.utils.pos_embed import (
     get_1d_sincos_pos_embed_from_grid,
     get_2d_sincos_pos_embed,
 )
 
+from .attention import get_local_attn_index, local_block_forward, masked_block_forward
 from .parallelpatchembed import ParallelVarPatchEmbed
+from .sequence_parallel import get_sequence_shard, sequence_parallel_block_forward
+from .token_merge import get_polar_merge_ids, merge_tokens, unmerge_tokens
+from .variable_parallel import get_variable_shard, variable_parallel_attention
 
 
 class ClimaX(nn.Module):
@@ -32,6 +39,17 @@ class ClimaX(nn.Module):
         drop_path (float): stochastic depth rate
         drop_rate (float): dropout rate
         parallel_patch_embed (bool): whether to use parallel patch embedding
+        static_vars (list): variables that are constant across samples and time (e.g. land_sea_mask),
+            their token embeddings are computed once and broadcast to the batch
+        var_ids_cache_size (int): maximum number of variable tuples whose ids are cached, see `get_var_ids`
+        local_attn_blocks (list): indices of the transformer blocks in which tokens only attend to their
+            neighborhood on the patch grid and to the global tokens, the others use full attention
+        local_attn_window (list): odd size of the neighborhood along latitude and longitude, in patches
+        num_global_tokens (int): number of learnable tokens prepended to the sequence, attending to and
+            attended by all tokens in local attention blocks
+        merge_polar_tokens (bool): whether to merge longitudinally adjacent tokens towards the poles before
+            the transformer blocks and to copy them back before the prediction head, see
+            `climax.token_merge.get_polar_merge_ids`. Applies to global grids only.
     """
 
     def __init__(
@@ -47,6 +65,12 @@ class ClimaX(nn.Module):
         drop_path=0.1,
         drop_rate=0.1,
         parallel_patch_embed=False,
+        static_vars=None,
+        var_ids_cache_size=32,
+        local_attn_blocks=None,
+        local_attn_window=[3, 5],
+        num_global_tokens=0,
+        merge_polar_tokens=False,
     ):
         super().__init__()
 
@@ -55,6 +79,20 @@ class ClimaX(nn.Module):
         self.patch_size = patch_size
         self.default_vars = default_vars
         self.parallel_patch_embed = parallel_patch_embed
+        self.static_vars = tuple(static_vars) if static_vars is not None else ()
+        # (variables, device, dtype, autocast) --> (weights version, token embeddings of static variables)
+        self._static_embeds_cache = {}
+        # variables --> name of the non-persistent buffer holding their ids, in least recently used order
+        self.var_ids_cache_size = var_ids_cache_size
+        self._var_ids_cache = OrderedDict()
+        # set by `compile_encoder`, compiled from the class so that it does not hold a reference to this instance
+        self._compiled_forward_encoder = None
+        self.local_attn_blocks = frozenset(local_attn_blocks) if local_attn_blocks is not None else frozenset()
+        self.local_attn_window = tuple(local_attn_window)
+        self.num_global_tokens = num_global_tokens
+        self.merge_polar_tokens = merge_polar_tokens
+        if merge_polar_tokens and self.local_attn_blocks:
+            raise ValueError("Local attention requires the full patch grid, it cannot be used with merge_polar_tokens.")
         # variable tokenization: separate embedding layer for each input variable
         if self.parallel_patch_embed:
             self.token_embeds = ParallelVarPatchEmbed(len(default_vars), img_size, patch_size, embed_dim)
@@ -72,10 +110,14 @@ class ClimaX(nn.Module):
         # variable aggregation: a learnable query and a single-layer cross attention
         self.var_query = nn.Parameter(torch.zeros(1, 1, embed_dim), requires_grad=True)
         self.var_agg = nn.MultiheadAttention(embed_dim, num_heads, batch_first=True)
+        # int8 key and value projections of `var_agg`, set by `climax.export.quantize_net`
+        self.var_agg_kv = None
 
         # positional embedding and lead time embedding
         self.pos_embed = nn.Parameter(torch.zeros(1, self.num_patches, embed_dim), requires_grad=True)
         self.lead_time_embed = nn.Linear(1, embed_dim)
+        if num_global_tokens > 0:
+            self.global_tokens = nn.Parameter(torch.zeros(1, num_global_tokens, embed_dim), requires_grad=True)
 
         # --------------------------------------------------------------------------
 
@@ -97,6 +139,17 @@ class ClimaX(nn.Module):
             ]
         )
         self.norm = nn.LayerNorm(embed_dim)
+        if self.local_attn_blocks:
+            # neighborhoods of the global patch grid, other grids (e.g. regions) are looked up on the fly
+            neighbor_ids, neighbor_mask = get_local_attn_index(
+                (img_size[0] // patch_size, img_size[1] // patch_size), self.local_attn_window
+            )
+            self.register_buffer("neighbor_ids", neighbor_ids, persistent=False)
+            self.register_buffer("neighbor_mask", neighbor_mask, persistent=False)
+        if merge_polar_tokens:
+            merge_ids, merge_counts = get_polar_merge_ids((img_size[0] // patch_size, img_size[1] // patch_size))
+            self.register_buffer("merge_ids", merge_ids, persistent=False)
+            self.register_buffer("merge_counts", merge_counts, persistent=False)
 
         # --------------------------------------------------------------------------
 
@@ -125,6 +178,9 @@ class ClimaX(nn.Module):
         var_embed = get_1d_sincos_pos_embed_from_grid(self.var_embed.shape[-1], np.arange(len(self.default_vars)))
         self.var_embed.data.copy_(torch.from_numpy(var_embed).float().unsqueeze(0))
 
+        if self.num_global_tokens > 0:
+            trunc_normal_(self.global_tokens, std=0.02)
+
         # token embedding layer
         if self.parallel_patch_embed:
             for i in range(len(self.token_embeds.proj_weights)):
@@ -157,12 +213,50 @@ class ClimaX(nn.Module):
             idx += 1
         return var_embed, var_map
 
-    @lru_cache(maxsize=None)
     def get_var_ids(self, vars, device):
-        ids = np.array([self.var_map[var] for var in vars])
-        return torch.from_numpy(ids).to(device)
+        """Ids of the variables in `default_vars`.
+
+        The ids are cached per instance in non-persistent buffers, so that they move with the model
+        across devices. The cache holds at most `var_ids_cache_size` variable tuples and is cleared when
+        loading a state dict.
+
+        Args:
+            vars (tuple): variable names
+            device (torch.device): device of the ids
+        """
+        name = self._var_ids_cache.get(vars)
+        if name is None:
+            if len(self._var_ids_cache) >= self.var_ids_cache_size:
+                # reuse the buffer of the least recently used variables
+                _, name = self._var_ids_cache.popitem(last=False)
+            else:
+                name = f"var_ids_{len(self._var_ids_cache)}"
+            ids = np.array([self.var_map[var] for var in vars])
+            self.register_buffer(name, torch.from_numpy(ids).to(device), persistent=False)
+            self._var_ids_cache[vars] = name
+        else:
+            self._var_ids_cache.move_to_end(vars)
+
+        ids = self._buffers[name]
+        if ids.device != device:
+            ids = ids.to(device)
+            self._buffers[name] = ids
+        return ids
+
+    def clear_caches(self):
+        """Clears the cached variable ids and static variable embeddings."""
+        for name in self._var_ids_cache.values():
+            del self._buffers[name]
+        self._var_ids_cache.clear()
+        self._static_embeds_cache.clear()
+
+    def _load_from_state_dict(self, *args, **kwargs):
+        self.clear_caches()
+        super()._load_from_state_dict(*args, **kwargs)
 
     def get_var_emb(self, var_emb, vars):
+        if isinstance(vars, torch.Tensor):
+            return var_emb[:, vars, :]
         ids = self.get_var_ids(vars, var_emb.device)
         return var_emb[:, ids, :]
 
@@ -172,7 +266,7 @@ class ClimaX(nn.Module):
         return imgs: (B, V, H, W)
         """
         p = self.patch_size
-        c = len(self.default_vars)
+        c = x.shape[-1] // p**2
         h = self.img_size[0] // p if h is None else h // p
         w = self.img_size[1] // p if w is None else w // p
         assert h * w == x.shape[1]
@@ -182,49 +276,224 @@ class ClimaX(nn.Module):
         imgs = x.reshape(shape=(x.shape[0], c, h * p, w * p))
         return imgs
 
-    def aggregate_variables(self, x: torch.Tensor):
+    def get_head_ids(self, out_var_ids: torch.Tensor):
+        """Rows of the last head layer that predict the given variables.
+
+        The output channels of the head are ordered as (p, p, V), see `unpatchify`.
+        """
+        p = self.patch_size
+        offsets = torch.arange(p**2, device=out_var_ids.device) * len(self.default_vars)
+        return (offsets.unsqueeze(1) + out_var_ids.unsqueeze(0)).flatten()  # p*p*Vo
+
+    def decode(self, x: torch.Tensor, out_variables, h=None, w=None):
+        """Prediction head and unpatchify, restricted to the requested output variables.
+
+        Only the rows of the last head layer belonging to `out_variables` are used, which gives the same
+        result as predicting all `default_vars` and selecting `out_variables` afterwards.
+
+        x: B, L, D
+        out_variables: tuple of variable names or `[Vo]` tensor of variable ids
+        return: B, Vo, H, W
+        """
+        if isinstance(out_variables, torch.Tensor):
+            out_var_ids = out_variables
+        else:
+            out_var_ids = self.get_var_ids(tuple(out_variables), x.device)
+        head_ids = self.get_head_ids(out_var_ids)
+
+        for layer in self.head[:-1]:
+            x = layer(x)
+        last = self.head[-1]
+        x = F.linear(x, last.weight[head_ids], last.bias[head_ids])  # B, L, Vo*p*p
+        return self.unpatchify(x, h, w)
+
+    def tokenize(self, x: torch.Tensor, var_ids):
+        """
+        x: B, V, H, W, with H and W multiples of the patch size, but not necessarily equal to `img_size`
+        return: B, V, L, D
+        """
+        if self.parallel_patch_embed:
+            return self.token_embeds(x, var_ids)  # B, V, L, D
+
+        embeds = []
+        for i in range(len(var_ids)):
+            id = var_ids[i]
+            # same as PatchEmbed.forward, without its check that the input covers `img_size`
+            embed = self.token_embeds[id]
+            embeds.append(embed.norm(embed.proj(x[:, i : i + 1]).flatten(2).transpose(1, 2)))
+        return torch.stack(embeds, dim=1)  # B, V, L, D
+
+    def _static_weights_version(self):
+        # optimizer steps and load_state_dict update the parameters in-place, which bumps their version counter
+        return (self.var_embed._version,) + tuple(p._version for p in self.token_embeds.parameters())
+
+    def get_static_embeds(self, x: torch.Tensor, variables, extent=None):
+        """Token embeddings of static variables, including their variable embedding.
+
+        As static variables are identical for all samples, only the first sample of the batch is embedded.
+        Without gradients (validation, inference) the result is cached per device and is reused until the
+        weights of `token_embeds` or `var_embed` change, e.g. after an optimizer step.
+
+        x: B, Vs, H, W
+        extent: `(min_h, max_h, min_w, max_w)` grid cells covered by `x`, bounds included, if it is not the global
+            grid
+        return: 1, Vs, L, D
+        """
+        var_ids = self.get_var_ids(variables, x.device)
+        if torch.is_grad_enabled():
+            # the embeddings are part of the autograd graph and cannot be shared across steps
+            return self.tokenize(x[:1], var_ids) + self.get_var_emb(self.var_embed, variables).unsqueeze(2)
+
+        key = (variables, extent, x.device, x.dtype, torch.is_autocast_enabled())
+        version = self._static_weights_version()
+        cached = self._static_embeds_cache.get(key)
+        if cached is None or cached[0] != version:
+            embeds = self.tokenize(x[:1], var_ids) + self.get_var_emb(self.var_embed, variables).unsqueeze(2)
+            cached = (version, embeds)
+            self._static_embeds_cache[key] = cached
+        return cached[1]
+
+    def split_static_vars(self, variables):
+        """Indices of the dynamic and of the static variables among `variables`."""
+        dynamic_idx = [i for i, var in enumerate(variables) if var not in self.static_vars]
+        static_idx = [i for i, var in enumerate(variables) if var in self.static_vars]
+        return dynamic_idx, static_idx
+
+    def embed_variables(self, x: torch.Tensor, variables, extent=None, static_embeds=None):
+        """Tokenizes each variable separately and adds the variable embedding.
+
+        Static variables are embedded once and broadcast to the batch. They are placed after the
+        dynamic variables, which does not affect `aggregate_variables` as it is invariant to the order
+        of the variables.
+
+        x: B, V, H, W
+        variables: tuple of variable names or `[V]` tensor of variable ids, see `get_var_ids`
+        extent: hashable description of the part of the grid covered by `x`, see `get_static_embeds`
+        static_embeds: 1, Vs, L, D, embeddings of static variables appended to those of `x`, only with ids
+        return: B, V, L, D
+        """
+        if isinstance(variables, torch.Tensor):
+            # variables are already resolved to ids, e.g. when the encoder is compiled, and static variables are
+            # either embedded by the caller or tokenized as dynamic ones
+            x = self.tokenize(x, variables)
+            x = x + self.get_var_emb(self.var_embed, variables).unsqueeze(2)
+            if static_embeds is None:
+                return x
+            return torch.cat([x, static_embeds.expand(x.shape[0], -1, -1, -1)], dim=1)
+
+        dynamic_idx, static_idx = self.split_static_vars(variables)
+        if len(static_idx) == 0:
+            var_ids = self.get_var_ids(variables, x.device)
+            x = self.tokenize(x, var_ids)
+            var_embed = self.get_var_emb(self.var_embed, variables)
+            return x + var_embed.unsqueeze(2)  # B, V, L, D
+
+        static_vars = tuple(variables[i] for i in static_idx)
+        static_embeds = self.get_static_embeds(x[:, static_idx], static_vars, extent)  # 1, Vs, L, D
+        static_embeds = static_embeds.expand(x.shape[0], -1, -1, -1)
+        if len(dynamic_idx) == 0:
+            return static_embeds
+
+        dynamic_vars = tuple(variables[i] for i in dynamic_idx)
+        var_ids = self.get_var_ids(dynamic_vars, x.device)
+        dynamic_embeds = self.tokenize(x[:, dynamic_idx], var_ids)
+        dynamic_embeds = dynamic_embeds + self.get_var_emb(self.var_embed, dynamic_vars).unsqueeze(2)
+        return torch.cat([dynamic_embeds, static_embeds], dim=1)  # B, V, L, D
+
+    def aggregate_variables(self, x: torch.Tensor, variable_group=None):
         """
         x: B, V, L, D
+        variable_group: process group sharing the variables, x being the variables of the rank, see
+            `forward_variable_parallel`
+        return: B, L, D
         """
         b, _, l, _ = x.shape
+        dtype = x.dtype
         x = torch.einsum("bvld->blvd", x)
         x = x.flatten(0, 1)  # BxL, V, D
 
-        var_query = self.var_query.repeat_interleave(x.shape[0], dim=0)
-        x, _ = self.var_agg(var_query, x, x)  # BxL, D
+        # the attention softmax over variables overflows in fp16, so aggregation runs in the dtype of the weights,
+        # which are kept in float32 by mixed precision training and by half precision exports, see `climax.export`
+        with torch.autocast(device_type=x.device.type, enabled=False):
+            x = x.to(self.var_query.dtype)
+            if variable_group is not None:
+                x = variable_parallel_attention(self.var_agg, self.var_query, x, variable_group)  # BxL, D
+            elif self.var_agg_kv is not None:
+                x = self.quantized_var_agg(x)  # BxL, D
+            else:
+                var_query = self.var_query.repeat_interleave(x.shape[0], dim=0)
+                x, _ = self.var_agg(var_query, x, x)  # BxL, D
         x = x.squeeze()
 
         x = x.unflatten(dim=0, sizes=(b, l))  # B, L, D
-        return x
+        return x.to(dtype)
 
-    def forward_encoder(self, x: torch.Tensor, lead_times: torch.Tensor, variables):
-        # x: `[B, V, H, W]` shape.
+    def quantized_var_agg(self, x: torch.Tensor):
+        """Same as `var_agg` with the int8 key and value projections of `climax.export.quantize_net`, which are
+        applied to all the variables of all tokens.
 
+        x: BxL, V, D
+        return: BxL, D
+        """
+        n, v, d = x.shape
+        h = self.var_agg.num_heads
+        w_q, b_q = self.var_agg.in_proj_weight[:d], self.var_agg.in_proj_bias[:d]
+        q = F.linear(self.var_query.reshape(1, d), w_q, b_q).reshape(h, d // h) * (d // h) ** -0.5  # H, Dh
+        k, values = self.var_agg_kv(x).reshape(n, v, 2, h, d // h).unbind(2)  # BxL, V, H, Dh
+        attn = torch.einsum("hc,nvhc->nhv", q, k).softmax(dim=-1)
+        out = torch.einsum("nhv,nvhc->nhc", attn, values)  # BxL, H, Dh
+        return self.var_agg.out_proj(out.reshape(n, d))
+
+    def encode_variables(self, x: torch.Tensor, variables, variable_group=None, static_embeds=None):
+        """Lead time independent part of the encoder: tokenization, variable aggregation and
+        positional embedding.
+
+        x: B, V, H, W
+        variable_group: process group sharing the variables, only the variables of the rank are tokenized
+        static_embeds: embeddings of static variables, with variable ids, see `embed_variables`
+        return: B, L, D
+        """
         if isinstance(variables, list):
             variables = tuple(variables)
+        if variable_group is not None:
+            shard = get_variable_shard(len(variables), variable_group)
+            x, variables = x[:, shard], variables[shard]
 
-        # tokenize each variable separately
-        embeds = []
-        var_ids = self.get_var_ids(variables, x.device)
-
-        if self.parallel_patch_embed:
-            x = self.token_embeds(x, var_ids)  # B, V, L, D
-        else:
-            for i in range(len(var_ids)):
-                id = var_ids[i]
-                embeds.append(self.token_embeds[id](x[:, i : i + 1]))
-            x = torch.stack(embeds, dim=1)  # B, V, L, D
-
-        # add variable embedding
-        var_embed = self.get_var_emb(self.var_embed, variables)
-        x = x + var_embed.unsqueeze(2)  # B, V, L, D
+        # tokenize each variable separately and add variable embedding
+        x = self.embed_variables(x, variables, static_embeds=static_embeds)  # B, V, L, D
 
         # variable aggregation
-        x = self.aggregate_variables(x)  # B, L, D
+        x = self.aggregate_variables(x, variable_group)  # B, L, D
 
         # add pos embedding
         x = x + self.pos_embed
+        return x
+
+    def get_local_attn_index(self, grid_size, device):
+        """Neighborhoods of the tokens for local attention blocks, see `climax.attention.get_local_attn_index`.
 
+        grid_size: number of patches along latitude and longitude, None for the global grid
+        """
+        if grid_size is None:
+            return self.neighbor_ids, self.neighbor_mask
+        grid_size = tuple(grid_size)
+        # only a grid spanning all longitudes wraps around
+        wrap_lon = grid_size[1] == self.img_size[1] // self.patch_size
+        neighbor_ids, neighbor_mask = get_local_attn_index(grid_size, self.local_attn_window, wrap_lon)
+        return neighbor_ids.to(device), neighbor_mask.to(device)
+
+    def forward_blocks(
+        self, x: torch.Tensor, lead_times: torch.Tensor, token_mask=None, grid_size=None, sequence_group=None
+    ):
+        """
+        x: B, L, D
+        lead_times: B
+        token_mask: B, L, optional mask of valid tokens for padded sequences
+        grid_size: number of patches along latitude and longitude if not the global grid, for local attention
+        sequence_group: process group sharing the sequence, x being the tokens of the rank, see
+            `forward_sequence_parallel`
+        return: B, L, D
+        """
         # add lead time embedding
         lead_time_emb = self.lead_time_embed(lead_times.unsqueeze(-1))  # B, D
         lead_time_emb = lead_time_emb.unsqueeze(1)
@@ -232,13 +501,189 @@ class ClimaX(nn.Module):
 
         x = self.pos_drop(x)
 
+        g = self.num_global_tokens
+        if g > 0:
+            x = torch.cat([self.global_tokens.expand(x.shape[0], -1, -1), x], dim=1)  # B, G + L, D
+            if token_mask is not None:
+                token_mask = torch.cat([token_mask.new_ones(token_mask.shape[0], g), token_mask], dim=1)
+        if self.local_attn_blocks:
+            neighbor_ids, neighbor_mask = self.get_local_attn_index(grid_size, x.device)
+
         # apply Transformer blocks
-        for blk in self.blocks:
-            x = blk(x)
-        x = self.norm(x)
+        for i, blk in enumerate(self.blocks):
+            if sequence_group is not None:
+                x = sequence_parallel_block_forward(blk, x, sequence_group)
+            elif i in self.local_attn_blocks:
+                x = local_block_forward(blk, x, neighbor_ids, neighbor_mask, g, token_mask)
+            elif token_mask is None:
+                x = blk(x)
+            else:
+                x = masked_block_forward(blk, x, token_mask)
+        x = self.norm(x[:, g:])
 
         return x
 
+    def forward_encoder(
+        self, x: torch.Tensor, lead_times: torch.Tensor, variables, variable_group=None, static_embeds=None
+    ):
+        # x: `[B, V, H, W]` shape.
+        x = self.encode_variables(x, variables, variable_group, static_embeds)  # B, L, D
+        if self.merge_polar_tokens:
+            x = merge_tokens(x, self.merge_ids, self.merge_counts)  # B, L', D
+            x = self.forward_blocks(x, lead_times)
+            return unmerge_tokens(x, self.merge_ids)  # B, L, D
+        return self.forward_blocks(x, lead_times)
+
+    def forward_encoder_multi_lead(self, x: torch.Tensor, lead_times: torch.Tensor, variables):
+        """Encodes the same initial conditions for multiple lead times.
+
+        Tokenization and variable aggregation are shared across lead times, only the transformer
+        blocks are run for each lead time, all in a single batch.
+
+        x: B, V, H, W
+        lead_times: T or B, T
+        return: B, T, L, D
+        """
+        b = x.shape[0]
+        if lead_times.dim() == 1:
+            lead_times = lead_times.unsqueeze(0).expand(b, -1)
+        t = lead_times.shape[1]
+
+        x = self.encode_variables(x, variables)  # B, L, D
+        if self.merge_polar_tokens:
+            x = merge_tokens(x, self.merge_ids, self.merge_counts)  # B, L', D
+        x = x.unsqueeze(1).expand(-1, t, -1, -1).flatten(0, 1)  # BxT, L, D
+        x = self.forward_blocks(x, lead_times.flatten())  # BxT, L, D
+        if self.merge_polar_tokens:
+            x = unmerge_tokens(x, self.merge_ids)
+        return x.unflatten(0, sizes=(b, t))  # B, T, L, D
+
+    def predict_multi_lead(self, x: torch.Tensor, lead_times: torch.Tensor, variables, out_variables):
+        """Forecasts the same initial conditions at multiple lead times.
+
+        Args:
+            x: `[B, Vi, H, W]` shape. Input weather/climate variables
+            lead_times: `[T]` or `[B, T]` shape. Forecasting lead times.
+
+        Returns:
+            preds (torch.Tensor): `[B, T, Vo, H, W]` shape. Predicted weather/climate variables.
+        """
+        out_transformers = self.forward_encoder_multi_lead(x, lead_times, variables)  # B, T, L, D
+        b, t = out_transformers.shape[:2]
+        preds = self.decode(out_transformers.flatten(0, 1), out_variables)  # BxT, Vo, H, W
+        return preds.unflatten(0, sizes=(b, t))  # B, T, Vo, H, W
+
+    def predict_ensemble(
+        self,
+        x: torch.Tensor,
+        lead_times: torch.Tensor,
+        variables,
+        out_variables,
+        num_members,
+        perturbation_std=0.0,
+        mc_dropout=False,
+        y=None,
+        member_batch_size=None,
+        generator=None,
+    ):
+        """Ensemble forecast of the same initial conditions.
+
+        Members differ by Gaussian perturbations of the initial conditions and, with `mc_dropout`, by the
+        dropout and stochastic depth of the model (`drop_rate` and `drop_path`). They are generated on the
+        device and run `member_batch_size` at a time, as a single batch by default, and only their statistics
+        are kept, see `climax.utils.metrics.EnsembleStats`.
+
+        Args:
+            x: `[B, Vi, H, W]` shape. Normalized input weather/climate variables
+            lead_times: `[B]` shape. Forecasting lead times.
+            num_members (int): number of members
+            perturbation_std (float or torch.Tensor): scalar or `[Vi]` standard deviation of the perturbations,
+                in normalized units, i.e. physical standard deviations divided by the normalization std. Static
+                variables are never perturbed.
+            mc_dropout (bool): whether to sample dropout and stochastic depth
+            y: `[B, Vo, H, W]` shape, optional. Targets, for the CRPS of the ensemble
+            member_batch_size (int, optional): number of members run at once, at least 2 with `y` for the CRPS
+            generator (torch.Generator, optional): generator of the perturbations
+
+        Returns:
+            EnsembleStats: mean, spread and CRPS of the `[B, Vo, H, W]` predictions.
+        """
+        b = x.shape[0]
+        member_batch_size = member_batch_size or num_members
+        if y is not None and num_members > 1 and member_batch_size < 2:
+            raise ValueError("The CRPS of the ensemble requires a member_batch_size of at least 2.")
+        perturbation_std = torch.as_tensor(perturbation_std, dtype=x.dtype, device=x.device)
+        perturbation_std = perturbation_std.reshape(-1).expand(x.shape[1]).clone()
+        # static variables are embedded once for all members and cached, see `get_static_embeds`
+        if isinstance(variables, torch.Tensor):
+            static_ids = [self.var_map[var] for var in self.static_vars]
+            static = [i for i, id in enumerate(variables.tolist()) if id in static_ids]
+        else:
+            static = [i for i, var in enumerate(variables) if var in self.static_vars]
+        perturbation_std[static] = 0.0
+        perturbation_std = perturbation_std.reshape(-1, 1, 1)
+        stats = EnsembleStats()
+
+        dropout_modules = [m for m in self.modules() if isinstance(m, (nn.Dropout, DropPath))] if mc_dropout else []
+        training = [m.training for m in dropout_modules]
+        for m in dropout_modules:
+            m.train()
+        try:
+            for start in range(0, num_members, member_batch_size):
+                n = min(member_batch_size, num_members - start)
+                members = x.unsqueeze(1).expand(-1, n, -1, -1, -1)  # B, N, Vi, H, W
+                if perturbation_std.any():
+                    noise = torch.randn(members.shape, generator=generator, dtype=x.dtype, device=x.device)
+                    members = members + noise * perturbation_std
+                _, preds = self.forward(
+                    members.flatten(0, 1), None, lead_times.repeat_interleave(n), variables, out_variables, None, None
+                )
+                stats.update(preds.unflatten(0, (b, n)), y)  # B, N, Vo, H, W
+        finally:
+            for m, mode in zip(dropout_modules, training):
+                m.train(mode)
+        return stats
+
+    def compile_encoder(self, **kwargs):
+        """Compiles `forward_encoder` with `torch.compile`.
+
+        Variable names are resolved to cached device index tensors outside of the compiled region, so
+        that the encoder is captured as a single graph without host synchronizations. This requires
+        `parallel_patch_embed`, as the serial tokenizer selects an embedding layer per variable id. Static
+        variables are embedded outside of the compiled region as well, so that their embeddings are cached.
+        `forward` dispatches to the compiled encoder, `forward_encoder` itself is left unchanged.
+
+        Args:
+            kwargs: Keyword arguments passed to `torch.compile`.
+        """
+        if not self.parallel_patch_embed:
+            raise ValueError("Compiling the encoder requires parallel_patch_embed=True.")
+        self._compiled_forward_encoder = torch.compile(type(self).forward_encoder, **kwargs)
+
+    @property
+    def encoder_compiled(self):
+        return self._compiled_forward_encoder is not None
+
+    def compiled_forward_encoder(self, x: torch.Tensor, lead_times: torch.Tensor, variables):
+        """`forward_encoder` with the compiled encoder, see `compile_encoder`."""
+        if isinstance(variables, torch.Tensor):
+            return self._compiled_forward_encoder(self, x, lead_times, variables)
+
+        variables = tuple(variables)
+        dynamic_idx, static_idx = self.split_static_vars(variables)
+        static_embeds = None
+        if len(static_idx) > 0:
+            static_embeds = self.get_static_embeds(x[:, static_idx], tuple(variables[i] for i in static_idx))
+            x, variables = x[:, dynamic_idx], tuple(variables[i] for i in dynamic_idx)
+        var_ids = self.get_var_ids(variables, x.device)
+        return self._compiled_forward_encoder(self, x, lead_times, var_ids, static_embeds=static_embeds)
+
+    @staticmethod
+    def full_precision(x: torch.Tensor):
+        """Disables autocast, so that losses and metrics of predictions cast to fp32 are reduced in fp32 under
+        mixed precision."""
+        return torch.autocast(device_type=x.device.type, enabled=False)
+
     def forward(self, x, y, lead_times, variables, out_variables, metric, lat):
         """Forward pass through the model.
 
@@ -251,20 +696,99 @@ class ClimaX(nn.Module):
             loss (list): Different metrics.
             preds (torch.Tensor): `[B, Vo, H, W]` shape. Predicted weather/climate variables.
         """
-        out_transformers = self.forward_encoder(x, lead_times, variables)  # B, L, D
-        preds = self.head(out_transformers)  # B, L, V*p*p
+        if self.encoder_compiled:
+            out_transformers = self.compiled_forward_encoder(x, lead_times, variables)  # B, L, D
+        else:
+            out_transformers = self.forward_encoder(x, lead_times, variables)  # B, L, D
+        preds = self.decode(out_transformers, out_variables)  # B, Vo, H, W
+
+        if metric is None:
+            loss = None
+        else:
+            with self.full_precision(preds):
+                loss = [m(preds.float(), y.float(), out_variables, lat) for m in metric]
+
+        return loss, preds
+
+    def forward_sequence_parallel(self, x, y, lead_times, variables, out_variables, metric, lat, group=None):
+        """Forward pass with the tokens sharded across the ranks of `group`, see `climax.sequence_parallel`.
+
+        Each rank tokenizes, transforms and decodes the patch rows of its latitude band only. All ranks take the
+        same inputs, the number of patch rows and the number of heads must be multiples of the size of the group.
+        Only full attention blocks are supported.
+
+        Args:
+            x: `[B, Vi, H, W]` shape. Input weather/climate variables
+            y: `[B, Vo, H, W]` shape. Target weather/climate variables
+            lead_times: `[B]` shape. Forecasting lead times of each element of the batch.
+            group (torch.distributed.ProcessGroup, optional): ranks sharing the sequence, all ranks by default
+
+        Returns:
+            loss (list): Different metrics of the rows of the rank, whose mean across the ranks is the metric of
+                the whole grid.
+            preds (torch.Tensor): `[B, Vo, H / P, W]` shape. Predictions of the rows of the rank, see
+                `climax.sequence_parallel.gather_rows`.
+        """
+        if self.local_attn_blocks or self.num_global_tokens > 0 or self.merge_polar_tokens:
+            raise ValueError("Sequence parallelism only supports full attention blocks.")
+        group = group if group is not None else torch.distributed.group.WORLD
+        p = self.patch_size
+        grid_w = x.shape[-1] // p
+        rows = get_sequence_shard(x.shape[-2] // p, group)  # patch rows of the rank
+        pixel_rows = slice(rows.start * p, rows.stop * p)
+
+        variables = tuple(variables)
+        # in grid cells, as the regions of `RegionalClimaX`
+        extent = (pixel_rows.start, pixel_rows.stop - 1, 0, x.shape[-1] - 1)
+        x = self.embed_variables(x[..., pixel_rows, :], variables, extent)  # B, V, L / P, D
+        x = self.aggregate_variables(x)  # B, L / P, D
+        x = x + self.pos_embed[:, rows.start * grid_w : rows.stop * grid_w]
+        x = self.forward_blocks(x, lead_times, sequence_group=group)
+        preds = self.decode(x, out_variables, h=pixel_rows.stop - pixel_rows.start, w=grid_w * p)
+
+        if metric is None:
+            loss = None
+        else:
+            if not isinstance(lat, MetricsContext):
+                lat = MetricsContext(lat)
+            y = y[..., pixel_rows, :]
+            with self.full_precision(preds):
+                loss = [m(preds.float(), y.float(), out_variables, lat.shard(pixel_rows)) for m in metric]
 
-        preds = self.unpatchify(preds)
-        out_var_ids = self.get_var_ids(tuple(out_variables), preds.device)
-        preds = preds[:, out_var_ids]
+        return loss, preds
+
+    def forward_variable_parallel(self, x, y, lead_times, variables, out_variables, metric, lat, group=None):
+        """Forward pass with the input variables sharded across the ranks of `group`, see
+        `climax.variable_parallel`.
+
+        Each rank tokenizes its own variables only and the variable aggregation is computed across the ranks.
+        All ranks take the same inputs and return the same predictions and losses. Averaging gradients across the
+        group, as data parallel training does, gives the gradients of `forward`; ranks have no gradients for the
+        token embeddings of the variables of other ranks.
+
+        Args:
+            x: `[B, Vi, H, W]` shape. Input weather/climate variables
+            y: `[B, Vo, H, W]` shape. Target weather/climate variables
+            lead_times: `[B]` shape. Forecasting lead times of each element of the batch.
+            group (torch.distributed.ProcessGroup, optional): ranks sharing the variables, all ranks by default
+
+        Returns:
+            loss (list): Different metrics.
+            preds (torch.Tensor): `[B, Vo, H, W]` shape. Predicted weather/climate variables.
+        """
+        group = group if group is not None else torch.distributed.group.WORLD
+        out_transformers = self.forward_encoder(x, lead_times, tuple(variables), variable_group=group)  # B, L, D
+        preds = self.decode(out_transformers, out_variables)  # B, Vo, H, W
 
         if metric is None:
             loss = None
         else:
-            loss = [m(preds, y, out_variables, lat) for m in metric]
+            with self.full_precision(preds):
+                loss = [m(preds.float(), y.float(), out_variables, lat) for m in metric]
 
         return loss, preds
 
     def evaluate(self, x, y, lead_times, variables, out_variables, transform, metrics, lat, clim, log_postfix):
         _, preds = self.forward(x, y, lead_times, variables, out_variables, metric=None, lat=lat)
-        return [m(preds, y, transform, out_variables, lat, clim, log_postfix) for m in metrics]
+        with self.full_precision(preds):
+            return [m(preds.float(), y.float(), transform, out_variables, lat, clim, log_postfix) for m in metrics]
@@ -0,0 +1,123 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+from functools import lru_cache
+
+import torch
+
+
+def masked_block_forward(blk, x: torch.Tensor, token_mask: torch.Tensor):
+    """Forward pass of a timm `Block` in which padding tokens are not attended to.
+
+    Uses the weights of the block as is, so that it is equivalent to `blk(x)` when no token is masked.
+
+    Args:
+        blk (timm.models.vision_transformer.Block): transformer block
+        x: `[B, L, D]` shape. Tokens
+        token_mask: `[B, L]` shape. True for valid tokens, False for padding
+
+    Returns:
+        torch.Tensor: `[B, L, D]` shape.
+    """
+    attn = blk.attn
+    b, n, c = x.shape
+    qkv = attn.qkv(blk.norm1(x)).reshape(b, n, 3, attn.num_heads, c // attn.num_heads).permute(2, 0, 3, 1, 4)
+    q, k, v = qkv.unbind(0)  # B, num_heads, L, D / num_heads
+
+    scores = (q @ k.transpose(-2, -1)) * attn.scale
+    scores = scores.masked_fill(~token_mask[:, None, None, :], float("-inf"))
+    scores = attn.attn_drop(scores.softmax(dim=-1))
+
+    out = (scores @ v).transpose(1, 2).reshape(b, n, c)
+    out = attn.proj_drop(attn.proj(out))
+
+    x = x + blk.drop_path1(blk.ls1(out))
+    x = x + blk.drop_path2(blk.ls2(blk.mlp(blk.norm2(x))))
+    return x
+
+
+@lru_cache(maxsize=16)
+def get_local_attn_index(grid_size, window_size, wrap_lon=True):
+    """Neighborhoods of the tokens of a lat/lon patch grid.
+
+    Args:
+        grid_size (tuple): number of patches along latitude and longitude
+        window_size (tuple): odd size of the neighborhood along latitude and longitude, in patches
+        wrap_lon (bool): whether neighborhoods wrap around in longitude, as on a global grid
+
+    Returns:
+        neighbor_ids (torch.Tensor): `[L, K]` shape. Token ids of the neighbors of each token
+        neighbor_mask (torch.Tensor): `[L, K]` shape. False for neighbors that lie outside of the grid
+    """
+    grid_h, grid_w = grid_size
+    r_h, r_w = window_size[0] // 2, window_size[1] // 2
+    if wrap_lon:
+        # do not visit the same column twice on narrow grids
+        r_w = min(r_w, (grid_w - 1) // 2)
+
+    offsets_h, offsets_w = torch.meshgrid(torch.arange(-r_h, r_h + 1), torch.arange(-r_w, r_w + 1), indexing="ij")
+    rows, cols = torch.meshgrid(torch.arange(grid_h), torch.arange(grid_w), indexing="ij")
+    rows = rows.reshape(-1, 1) + offsets_h.reshape(1, -1)  # L, K
+    cols = cols.reshape(-1, 1) + offsets_w.reshape(1, -1)  # L, K
+
+    neighbor_mask = (rows >= 0) & (rows < grid_h)
+    if wrap_lon:
+        cols = cols % grid_w
+    else:
+        neighbor_mask &= (cols >= 0) & (cols < grid_w)
+    neighbor_ids = rows.clamp(0, grid_h - 1) * grid_w + cols.clamp(0, grid_w - 1)
+    return neighbor_ids, neighbor_mask
+
+
+def local_block_forward(blk, x: torch.Tensor, neighbor_ids, neighbor_mask, num_global_tokens=0, token_mask=None):
+    """Forward pass of a timm `Block` in which tokens only attend to their neighborhood and to global tokens.
+
+    Global tokens are the first `num_global_tokens` tokens of the sequence, they attend to all tokens. The
+    weights of the block are used as is, so that pretrained blocks can switch to local attention.
+
+    Args:
+        blk (timm.models.vision_transformer.Block): transformer block
+        x: `[B, G + L, D]` shape. Global tokens followed by the tokens of the patch grid
+        neighbor_ids: `[L, K]` shape. See `get_local_attn_index`
+        neighbor_mask: `[L, K]` shape. See `get_local_attn_index`
+        num_global_tokens (int): number of global tokens
+        token_mask: `[B, G + L]` shape, optional. True for valid tokens, False for padding
+
+    Returns:
+        torch.Tensor: `[B, G + L, D]` shape.
+    """
+    attn = blk.attn
+    b, n, c = x.shape
+    g = num_global_tokens
+    qkv = attn.qkv(blk.norm1(x)).reshape(b, n, 3, attn.num_heads, c // attn.num_heads).permute(2, 0, 3, 1, 4)
+    q, k, v = qkv.unbind(0)  # B, num_heads, G + L, D / num_heads
+
+    # patch tokens: keys of the neighborhood gathered per query, memory is linear in L
+    local_mask = neighbor_mask.unsqueeze(0)  # 1, L, K
+    if token_mask is not None:
+        # padding is not attended to, but every token attends to itself so that no row is fully masked
+        is_self = neighbor_ids == torch.arange(neighbor_ids.shape[0], device=neighbor_ids.device).unsqueeze(-1)
+        local_mask = (local_mask & token_mask[:, g:][:, neighbor_ids]) | is_self
+    k_local, v_local = k[:, :, g:][:, :, neighbor_ids], v[:, :, g:][:, :, neighbor_ids]  # B, num_heads, L, K, Dh
+    scores = torch.einsum("bhld,bhlkd->bhlk", q[:, :, g:], k_local) * attn.scale
+    scores = scores.masked_fill(~local_mask.unsqueeze(1), float("-inf"))
+    if g > 0:
+        scores = torch.cat([(q[:, :, g:] @ k[:, :, :g].transpose(-2, -1)) * attn.scale, scores], dim=-1)
+    scores = attn.attn_drop(scores.softmax(dim=-1))
+    out = torch.einsum("bhlk,bhlkd->bhld", scores[..., g:], v_local)
+    if g > 0:
+        out = out + scores[..., :g] @ v[:, :, :g]
+
+        # global tokens: full attention
+        global_scores = (q[:, :, :g] @ k.transpose(-2, -1)) * attn.scale
+        if token_mask is not None:
+            global_scores = global_scores.masked_fill(~token_mask[:, None, None, :], float("-inf"))
+        global_scores = attn.attn_drop(global_scores.softmax(dim=-1))
+        out = torch.cat([global_scores @ v, out], dim=2)
+
+    out = out.transpose(1, 2).reshape(b, n, c)
+    out = attn.proj_drop(attn.proj(out))
+
+    x = x + blk.drop_path1(blk.ls1(out))
+    x = x + blk.drop_path2(blk.ls2(blk.mlp(blk.norm2(x))))
+    return x
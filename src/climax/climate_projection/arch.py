@@ -32,6 +32,7 @@ class ClimaXClimateBench(ClimaX):
         drop_rate=0.1,
         parallel_patch_embed=False,
         freeze_encoder=False,
+        static_vars=None,
     ):
         assert out_vars is not None
 
@@ -46,7 +47,8 @@ class ClimaXClimateBench(ClimaX):
             mlp_ratio,
             drop_path,
             drop_rate,
-            parallel_patch_embed
+            parallel_patch_embed,
+            static_vars,
         )
 
         self.out_vars = out_vars
@@ -84,21 +86,8 @@ class ClimaXClimateBench(ClimaX):
         b, t, _, _, _ = x.shape
         x = x.flatten(0, 1)  # BxT, V, H, W
         
-        # tokenize each variable separately
-        embeds = []
-        var_ids = self.get_var_ids(variables, x.device)
-
-        if self.parallel_patch_embed:
-            x = self.token_embeds(x, var_ids)  # BxT, V, L, D
-        else:
-            for i in range(len(var_ids)):
-                id = var_ids[i]
-                embeds.append(self.token_embeds[id](x[:, i : i + 1]))
-            x = torch.stack(embeds, dim=1)  # BxT, V, L, D
-
-        # add variable embedding
-        var_embed = self.get_var_emb(self.var_embed, variables)
-        x = x + var_embed.unsqueeze(2)  # BxT, V, L, D
+        # tokenize each variable separately and add variable embedding
+        x = self.embed_variables(x, variables)  # BxT, V, L, D
 
         # variable aggregation
         x = self.aggregate_variables(x)  # BxT, L, D
@@ -140,5 +129,6 @@ class ClimaXClimateBench(ClimaX):
         if metric is None:
             loss = None
         else:
-            loss = [m(preds, y, out_variables, lat) for m in metric]
+            with self.full_precision(preds):
+                loss = [m(preds.float(), y.float(), out_variables, lat) for m in metric]
         return loss, preds
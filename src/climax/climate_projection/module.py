@@ -6,6 +6,7 @@ from pytorch_lightning import LightningModule
 from climax.climate_projection.arch import ClimaXClimateBench
 from climax.utils.lr_scheduler import LinearWarmupCosineAnnealingLR
 from climax.utils.metrics import (
+    MetricsContext,
     mse,
     lat_weighted_mse_val,
     lat_weighted_nrmse,
@@ -92,6 +93,7 @@ class ClimateProjectionModule(LightningModule):
     def set_lat_lon(self, lat, lon):
         self.lat = lat
         self.lon = lon
+        self.metrics_context = MetricsContext(lat)
 
     def set_pred_range(self, r):
         self.pred_range = r
@@ -105,7 +107,7 @@ class ClimateProjectionModule(LightningModule):
     def training_step(self, batch: Any, batch_idx: int):
         x, y, lead_times, variables, out_variables = batch
 
-        loss_dict, _ = self.net.forward(x, y, lead_times, variables, out_variables, [mse], lat=self.lat)
+        loss_dict, _ = self.net.forward(x, y, lead_times, variables, out_variables, [mse], lat=self.metrics_context)
         loss_dict = loss_dict[0]
         for var in loss_dict.keys():
             self.log(
@@ -130,7 +132,7 @@ class ClimateProjectionModule(LightningModule):
             out_variables,
             transform=self.denormalization,
             metrics=[lat_weighted_mse_val, lat_weighted_rmse],
-            lat=self.lat,
+            lat=self.metrics_context,
             clim=self.val_clim,
             log_postfix=None
         )
@@ -162,7 +164,7 @@ class ClimateProjectionModule(LightningModule):
             out_variables,
             transform=self.denormalization,
             metrics=[lat_weighted_mse_val, lat_weighted_rmse, lat_weighted_nrmse],
-            lat=self.lat,
+            lat=self.metrics_context,
             clim=self.test_clim,
             log_postfix=None
         )
@@ -0,0 +1,282 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""Exports trained ClimaX models for inference.
+
+An exported weights file only holds the state dict of the network, already converted to the network and cast
+to the chosen dtype, except for the variable aggregation which stays in float32, and the config of the network (`class_path` and `init_args`, e.g. `default_vars`,
+`img_size` and `patch_size`). It is memory-mapped when loaded, so that only the weights which are used are read
+from disk.
+
+Models can also be exported to TorchScript or ONNX for fixed input and output variables, see `FrozenClimaX`.
+
+Example:
+    climax-export --config configs/global_forecast_climax.yaml --checkpoint best.ckpt --output climax.pt \\
+        --dtype bfloat16
+    climax-export --config configs/global_forecast_climax.yaml --checkpoint best.ckpt --output climax.onnx \\
+        --format onnx
+"""
+
+import copy
+import importlib
+import importlib.util
+
+import click
+import torch
+import torch.nn as nn
+import yaml
+from torch.ao.nn.quantized.dynamic import Linear as DynamicQuantizedLinear
+from torch.ao.quantization import per_channel_dynamic_qconfig, quantize_dynamic
+
+from climax.utils.pos_embed import interpolate_pos_embed
+
+WEIGHTS_FORMAT = "climax-weights"
+WEIGHTS_VERSION = 1
+DTYPES = {"float32": torch.float32, "float16": torch.float16, "bfloat16": torch.bfloat16}
+# the attention softmax over variables overflows in half precision, see `ClimaX.aggregate_variables`
+FP32_WEIGHTS = ("var_query", "var_agg.")
+
+
+def instantiate_net(net_config):
+    """Instantiates the network of a config, e.g. `model.net` of `configs/global_forecast_climax.yaml`."""
+    module_name, class_name = net_config["class_path"].rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), class_name)(**net_config.get("init_args", {}))
+
+
+def convert_checkpoint(net, checkpoint_model):
+    """Converts the state dict of a Lightning checkpoint to the state dict of `net`.
+
+    Interpolates the positional embedding to the image size of `net`, renames the `channel` keys of older
+    checkpoints to `var` and strips the `net.` prefix of the Lightning module.
+
+    Raises:
+        ValueError: if a weight of `net` is missing from the checkpoint or does not have the same shape
+    """
+    checkpoint_model = dict(checkpoint_model)
+    interpolate_pos_embed(net, checkpoint_model, new_size=net.img_size)
+    state_dict = {}
+    for k, v in checkpoint_model.items():
+        if k.startswith("net."):
+            state_dict[k[len("net.") :].replace("channel", "var")] = v
+
+    expected = net.state_dict()
+    mismatched = [k for k in expected if k not in state_dict or state_dict[k].shape != expected[k].shape]
+    if len(mismatched) > 0:
+        raise ValueError(f"Checkpoint does not match the network, missing or mismatched weights: {mismatched}")
+    return {k: state_dict[k] for k in expected}
+
+
+def export_weights(net_config, checkpoint_path, output_path, dtype=None):
+    """Exports the network of a Lightning checkpoint to a weights file.
+
+    Args:
+        net_config (dict): `class_path` and `init_args` of the network
+        checkpoint_path (str): Lightning checkpoint, optimizer states and other training states are dropped
+        output_path (str): path of the weights file
+        dtype (torch.dtype, optional): dtype of the floating point weights, unchanged by default, the weights of the
+            variable aggregation are kept in float32
+    """
+    net = instantiate_net(net_config)
+    checkpoint = torch.load(checkpoint_path, map_location=torch.device("cpu"), mmap=True, weights_only=False)
+    state_dict = convert_checkpoint(net, checkpoint["state_dict"])
+    if dtype is not None:
+        state_dict = {
+            k: v.to(dtype) if v.is_floating_point() and not k.startswith(FP32_WEIGHTS) else v
+            for k, v in state_dict.items()
+        }
+    # contiguous copies, so that views of larger tensors do not save their whole storage
+    state_dict = {k: v.contiguous().clone() for k, v in state_dict.items()}
+    torch.save(
+        {
+            "format": WEIGHTS_FORMAT,
+            "version": WEIGHTS_VERSION,
+            "class_path": net_config["class_path"],
+            "init_args": net_config.get("init_args", {}),
+            "state_dict": state_dict,
+        },
+        output_path,
+    )
+
+
+def quantize_net(net):
+    """Quantizes the linear layers of a copy of a network to int8 for inference on CPU.
+
+    Weights are quantized ahead of time per output channel and activations on the fly (dynamic quantization).
+    The last layer of the prediction head stays in fp32 since `ClimaX.decode` selects the rows of its weight.
+    The `nn.MultiheadAttention` of the variable aggregation is not dynamically quantizable, so its key and value
+    projections, which are applied to every variable of every token, are quantized separately, see
+    `ClimaX.quantized_var_agg`. The network itself is left unchanged.
+    """
+    net = copy.deepcopy(net).float().cpu().eval()
+    last_head = f"head.{len(net.head) - 1}"
+    qconfig_spec = {
+        name: per_channel_dynamic_qconfig
+        for name, m in net.named_modules()
+        if type(m) is nn.Linear and name != last_head
+    }
+    net = quantize_dynamic(net, qconfig_spec, dtype=torch.qint8, inplace=True)
+
+    d = net.var_agg.embed_dim
+    kv = nn.Linear(d, 2 * d)
+    with torch.no_grad():
+        kv.weight.copy_(net.var_agg.in_proj_weight[d:])
+        kv.bias.copy_(net.var_agg.in_proj_bias[d:])
+    kv.qconfig = per_channel_dynamic_qconfig
+    net.var_agg_kv = DynamicQuantizedLinear.from_float(kv)
+    return net
+
+
+def load_net(path, net_config=None, device="cpu", quantize=False):
+    """Loads a network for inference from a weights file, see `export_weights`, or from a Lightning checkpoint.
+
+    Weights files are memory-mapped and their weights are assigned to the network without copies, the network
+    keeps the dtype of the file, except for the variable aggregation which always runs in float32.
+
+    Args:
+        path (str): weights file or Lightning checkpoint
+        net_config (dict, optional): `class_path` and `init_args` of the network, required for Lightning
+            checkpoints, weights files embed their own
+        device (str or torch.device): device of the network
+        quantize (bool): whether to quantize the network to int8 for inference on CPU, see `quantize_net`
+    """
+    if quantize and torch.device(device).type != "cpu":
+        raise ValueError("Quantized networks run on CPU only.")
+    checkpoint = torch.load(path, map_location=torch.device("cpu"), mmap=True, weights_only=True)
+    if checkpoint.get("format") == WEIGHTS_FORMAT:
+        if checkpoint["version"] > WEIGHTS_VERSION:
+            raise ValueError(f"Unsupported weights version {checkpoint['version']}, please update ClimaX.")
+        net = instantiate_net(checkpoint)
+        net.load_state_dict(checkpoint["state_dict"], assign=True)
+        # half precision weights files of version 1 may hold a half precision aggregation
+        net.var_agg.float()
+        net.var_query.data = net.var_query.data.float()
+    else:
+        if net_config is None:
+            raise ValueError("Loading a Lightning checkpoint requires the config of the network.")
+        net = instantiate_net(net_config)
+        net.load_state_dict(convert_checkpoint(net, checkpoint["state_dict"]))
+    if quantize:
+        return quantize_net(net)
+    return net.to(device).eval()
+
+
+class FrozenClimaX(nn.Module):
+    """Tensor-only forward of a ClimaX model for fixed input and output variables, for TorchScript and ONNX.
+
+    The variables are resolved to index buffers once, so that the forward pass only takes and returns tensors.
+
+    Args:
+        net (ClimaX): model
+        variables (list): input variables
+        out_variables (list): output variables
+    """
+
+    def __init__(self, net, variables, out_variables):
+        super().__init__()
+        if net.encoder_compiled:
+            raise ValueError("Compiled encoders cannot be exported.")
+        self.net = net
+        self.variables = tuple(variables)
+        self.out_variables = tuple(out_variables)
+        device = net.pos_embed.device
+        self.register_buffer("var_ids", net.get_var_ids(self.variables, device).clone())
+        self.register_buffer("out_var_ids", net.get_var_ids(self.out_variables, device).clone())
+        self.eval()
+
+    def forward(self, x: torch.Tensor, lead_times: torch.Tensor):
+        """
+        x: B, Vi, H, W
+        lead_times: B
+        return: B, Vo, H, W
+        """
+        x = self.net.forward_encoder(x, lead_times, self.var_ids)  # B, L, D
+        return self.net.decode(x, self.out_var_ids)
+
+    def example_inputs(self, batch_size=2):
+        h, w = self.net.img_size
+        dtype, device = self.net.pos_embed.dtype, self.net.pos_embed.device
+        x = torch.randn(batch_size, len(self.variables), h, w, dtype=dtype, device=device)
+        return x, torch.rand(batch_size, dtype=dtype, device=device)
+
+
+def export_torchscript(module: FrozenClimaX, path):
+    """Traces the module to TorchScript, the batch size is dynamic."""
+    with torch.no_grad():
+        torch.jit.trace(module, module.example_inputs()).save(path)
+
+
+def export_onnx(module: FrozenClimaX, path, opset_version=17):
+    """Exports the module to ONNX with a dynamic batch size, inputs `x` and `lead_times` and output `preds`."""
+    with torch.no_grad():
+        torch.onnx.export(
+            module,
+            module.example_inputs(),
+            path,
+            input_names=["x", "lead_times"],
+            output_names=["preds"],
+            dynamic_axes={"x": {0: "batch"}, "lead_times": {0: "batch"}, "preds": {0: "batch"}},
+            opset_version=opset_version,
+            dynamo=False,
+        )
+
+
+def validate_export(module: FrozenClimaX, path, export_format, batch_size=3):
+    """Maximum absolute difference between the exported and the eager module on CPU, on a batch size which
+    differs from the one of the export. ONNX models are run with onnxruntime."""
+    module = module.cpu()
+    x, lead_times = module.example_inputs(batch_size)
+    with torch.no_grad():
+        ref = module(x, lead_times)
+        if export_format == "torchscript":
+            preds = torch.jit.load(path, map_location="cpu")(x, lead_times)
+        else:
+            import onnxruntime
+
+            session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+            preds = session.run(None, {"x": x.numpy(), "lead_times": lead_times.numpy()})[0]
+            preds = torch.from_numpy(preds)
+    return (preds - ref).abs().max().item()
+
+
+@click.command()
+@click.option("--config", type=click.Path(exists=True), required=True, help="Training config of the model.")
+@click.option(
+    "--checkpoint", type=click.Path(exists=True), required=True, help="Lightning checkpoint or exported weights."
+)
+@click.option("--output", type=str, required=True, help="Path of the exported model.")
+@click.option("--dtype", type=click.Choice(list(DTYPES)), default=None, help="Dtype of the weights.")
+@click.option(
+    "--format",
+    "export_format",
+    type=click.Choice(["weights", "torchscript", "onnx"]),
+    default="weights",
+    help="TorchScript and ONNX models take and return tensors, for the data.variables and data.out_variables "
+    "of the config.",
+)
+def main(config, checkpoint, output, dtype, export_format):
+    with open(config) as f:
+        config = yaml.safe_load(f)
+    if export_format == "weights":
+        export_weights(config["model"]["net"], checkpoint, output, dtype=DTYPES.get(dtype))
+        return
+
+    net = load_net(checkpoint, config["model"]["net"])
+    if dtype is not None:
+        net = net.to(DTYPES[dtype])
+    variables = config["data"]["variables"]
+    module = FrozenClimaX(net, variables, config["data"].get("out_variables") or variables)
+    if export_format == "torchscript":
+        export_torchscript(module, output)
+    else:
+        export_onnx(module, output)
+    if dtype not in (None, "float32"):
+        # half precision kernels are not all available on CPU
+        return
+    if export_format == "onnx" and importlib.util.find_spec("onnxruntime") is None:
+        print("Install onnxruntime to validate the exported model.")
+        return
+    print(f"Maximum absolute difference with the eager model: {validate_export(module, output, export_format)}")
+
+
+if __name__ == "__main__":
+    main()
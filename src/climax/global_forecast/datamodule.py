@@ -2,7 +2,7 @@
 # Licensed under the MIT license.
 
 import os
-from typing import Optional
+from typing import List, Optional
 
 import numpy as np
 import torch
@@ -15,6 +15,7 @@ from climax.pretrain.datamodule import collate_fn
 from climax.pretrain.dataset import (
     Forecast,
     IndividualForecastDataIter,
+    MultiLeadForecast,
     NpyReader,
     ShuffleIterableDataset,
 )
@@ -29,6 +30,10 @@ class GlobalForecastDataModule(LightningDataModule):
         buffer_size (int): Buffer size for shuffling.
         out_variables (list, optional): List of output variables.
         predict_range (int, optional): Predict range.
+        eval_predict_ranges (list, optional): Predict ranges evaluated at once in validation and test, reading each
+            initial condition only once. All ranges are scored on the initial conditions which have a target at the
+            longest range, i.e. fewer than with `predict_range` set to a shorter range. Defaults to `predict_range`
+            only.
         hrs_each_step (int, optional): Hours each step.
         batch_size (int, optional): Batch size.
         num_workers (int, optional): Number of workers.
@@ -42,6 +47,7 @@ class GlobalForecastDataModule(LightningDataModule):
         buffer_size,
         out_variables=None,
         predict_range: int = 6,
+        eval_predict_ranges: Optional[List[int]] = None,
         hrs_each_step: int = 1,
         batch_size: int = 64,
         num_workers: int = 0,
@@ -103,6 +109,29 @@ class GlobalForecastDataModule(LightningDataModule):
         clim = torch.from_numpy(clim)
         return clim
 
+    def get_eval_forecast(self, file_list):
+        reader = NpyReader(
+            file_list=file_list,
+            start_idx=0,
+            end_idx=1,
+            variables=self.hparams.variables,
+            out_variables=self.hparams.out_variables,
+            shuffle=False,
+            multi_dataset_training=False,
+        )
+        if self.hparams.eval_predict_ranges is not None:
+            return MultiLeadForecast(
+                reader,
+                predict_ranges=self.hparams.eval_predict_ranges,
+                hrs_each_step=self.hparams.hrs_each_step,
+            )
+        return Forecast(
+            reader,
+            max_predict_range=self.hparams.predict_range,
+            random_lead_time=False,
+            hrs_each_step=self.hparams.hrs_each_step,
+        )
+
     def setup(self, stage: Optional[str] = None):
         # load datasets only if they're not loaded already
         if not self.data_train and not self.data_val and not self.data_test:
@@ -129,39 +158,13 @@ class GlobalForecastDataModule(LightningDataModule):
             )
 
             self.data_val = IndividualForecastDataIter(
-                Forecast(
-                    NpyReader(
-                        file_list=self.lister_val,
-                        start_idx=0,
-                        end_idx=1,
-                        variables=self.hparams.variables,
-                        out_variables=self.hparams.out_variables,
-                        shuffle=False,
-                        multi_dataset_training=False,
-                    ),
-                    max_predict_range=self.hparams.predict_range,
-                    random_lead_time=False,
-                    hrs_each_step=self.hparams.hrs_each_step,
-                ),
+                self.get_eval_forecast(self.lister_val),
                 transforms=self.transforms,
                 output_transforms=self.output_transforms,
             )
 
             self.data_test = IndividualForecastDataIter(
-                Forecast(
-                    NpyReader(
-                        file_list=self.lister_test,
-                        start_idx=0,
-                        end_idx=1,
-                        variables=self.hparams.variables,
-                        out_variables=self.hparams.out_variables,
-                        shuffle=False,
-                        multi_dataset_training=False,
-                    ),
-                    max_predict_range=self.hparams.predict_range,
-                    random_lead_time=False,
-                    hrs_each_step=self.hparams.hrs_each_step,
-                ),
+                self.get_eval_forecast(self.lister_test),
                 transforms=self.transforms,
                 output_transforms=self.output_transforms,
             )
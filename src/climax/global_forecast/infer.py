@@ -0,0 +1,194 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""Writes the forecasts of a trained ClimaX model to a chunked Zarr store.
+
+Initial conditions between `--start` and `--end` are streamed from the sharded data in batches, forecast for
+all lead times at once, denormalized on the device and appended to the store by a background thread, so that
+writes to disk overlap with the model.
+
+Example:
+    climax-infer --config configs/global_forecast_climax.yaml --checkpoint best.ckpt --output forecasts.zarr \\
+        --start 2017-01-01 --end 2017-02-01 -p 6 -p 72 -p 120
+"""
+
+import os
+import queue
+import threading
+from datetime import datetime, timedelta
+
+import click
+import numpy as np
+import torch
+import yaml
+import zarr
+from torchvision.transforms import transforms
+
+from climax.export import load_net
+from climax.global_forecast.datamodule import GlobalForecastDataModule
+
+
+def get_shard_key(path):
+    # shards are named {year}_{shard_id}.npz, see `data_preprocessing/nc2np_equally_era5.py`
+    year, shard_id = os.path.splitext(os.path.basename(path))[0].split("_")
+    return int(year), int(shard_id)
+
+
+def iter_initial_conditions(file_list, variables, start, end, hrs_each_step=1):
+    """Yields the time and the `[V, H, W]` fields of each initial condition in `[start, end)`.
+
+    Shards of a year hold consecutive samples from the first hour of the year, all shards having the same length.
+    """
+    file_list = sorted([f for f in file_list if "climatology" not in f], key=get_shard_key)
+    for path in file_list:
+        year, shard_id = get_shard_key(path)
+        if year < start.year or year > end.year:
+            continue
+        data = np.load(path)
+        x = np.concatenate([data[k].astype(np.float32) for k in variables], axis=1)  # N, V, H, W
+        shard_start = datetime(year, 1, 1) + timedelta(hours=shard_id * x.shape[0] * hrs_each_step)
+        for i in range(x.shape[0]):
+            time = shard_start + timedelta(hours=i * hrs_each_step)
+            if start <= time < end:
+                yield time, x[i]
+
+
+def iter_batches(samples, batch_size):
+    times, xs = [], []
+    for time, x in samples:
+        times.append(time)
+        xs.append(x)
+        if len(xs) == batch_size:
+            yield times, torch.from_numpy(np.stack(xs))
+            times, xs = [], []
+    if len(xs) > 0:
+        yield times, torch.from_numpy(np.stack(xs))
+
+
+class ZarrWriter:
+    """Appends forecasts to a Zarr store from a background thread.
+
+    The store holds `forecast` of dimensions `(time, lead_time, variable, lat, lon)`, chunked by initial time,
+    lead time and variable, and the coordinates of each dimension, readable with `xarray.open_zarr`.
+
+    Args:
+        path (str): path of the store, overwritten
+        variables (list): names of the forecast variables
+        lead_times (list): lead times in hours
+        lat (np.ndarray): latitudes of the grid
+        lon (np.ndarray): longitudes of the grid
+        max_queue_size (int): maximum number of batches waiting to be written
+    """
+
+    def __init__(self, path, variables, lead_times, lat, lon, max_queue_size=4):
+        root = zarr.open_group(path, mode="w")
+        h, w = len(lat), len(lon)
+        self.forecast = root.create_dataset(
+            "forecast", shape=(0, len(lead_times), len(variables), h, w), chunks=(1, 1, 1, h, w), dtype="f4"
+        )
+        self.forecast.attrs["_ARRAY_DIMENSIONS"] = ["time", "lead_time", "variable", "lat", "lon"]
+        self.time = root.create_dataset("time", shape=(0,), chunks=(1024,), dtype="i8")
+        self.time.attrs.update({"_ARRAY_DIMENSIONS": ["time"], "units": "hours since 1970-01-01"})
+        for name, values, attrs in [
+            ("lead_time", np.asarray(lead_times), {"units": "hours"}),
+            ("variable", np.asarray(variables), {}),
+            ("lat", np.asarray(lat), {}),
+            ("lon", np.asarray(lon), {}),
+        ]:
+            array = root.array(name, values)
+            array.attrs.update({"_ARRAY_DIMENSIONS": [name], **attrs})
+
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, times, preds: torch.Tensor):
+        """Queues `[B, T, V, H, W]` forecasts of the initial times `times`, blocks if the queue is full."""
+        if self.error is not None:
+            raise self.error
+        event = None
+        if preds.is_cuda:
+            # copy to pinned memory without waiting, the writer thread waits for the copy instead
+            host_preds = torch.empty(preds.shape, dtype=torch.float32, pin_memory=True)
+            host_preds.copy_(preds, non_blocking=True)
+            event = torch.cuda.Event()
+            event.record()
+            preds = host_preds
+        self.queue.put((times, preds, event))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                continue
+            times, preds, event = item
+            try:
+                if event is not None:
+                    event.synchronize()
+                hours = [(time - datetime(1970, 1, 1)) // timedelta(hours=1) for time in times]
+                self.forecast.append(preds.float().numpy(), axis=0)
+                self.time.append(np.asarray(hours, dtype=np.int64))
+            except Exception as e:
+                self.error = e
+
+    def close(self):
+        """Waits for all queued forecasts to be written."""
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+@click.command()
+@click.option("--config", type=click.Path(exists=True), required=True, help="Training config of the model.")
+@click.option(
+    "--checkpoint", type=click.Path(exists=True), required=True, help="Lightning checkpoint or exported weights."
+)
+@click.option("--output", type=str, required=True, help="Path of the Zarr store.")
+@click.option("--start", type=click.DateTime(), required=True, help="First initial time.")
+@click.option("--end", type=click.DateTime(), required=True, help="End of the initial times, excluded.")
+@click.option("--root_dir", type=str, default=None, help="Overrides data.root_dir of the config.")
+@click.option("--partition", type=click.Choice(["train", "val", "test"]), default="test")
+@click.option("--predict_ranges", "-p", type=int, multiple=True, help="Predict ranges, defaults to data.predict_range.")
+@click.option("--batch_size", type=int, default=16)
+@click.option("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+@click.option("--quantize", is_flag=True, help="Quantizes the model to int8, on CPU only.")
+def main(config, checkpoint, output, start, end, root_dir, partition, predict_ranges, batch_size, device, quantize):
+    with open(config) as f:
+        config = yaml.safe_load(f)
+    data_config = config["data"]
+    variables = data_config["variables"]
+    out_variables = data_config.get("out_variables") or variables
+    hrs_each_step = data_config.get("hrs_each_step", 1)
+    predict_ranges = list(predict_ranges) or [data_config["predict_range"]]
+
+    datamodule = GlobalForecastDataModule(
+        root_dir or data_config["root_dir"], variables, buffer_size=1, out_variables=out_variables
+    )
+    normalization = datamodule.output_transforms
+    mean_norm, std_norm = normalization.mean, normalization.std
+    denormalization = transforms.Normalize(-mean_norm / std_norm, 1 / std_norm)
+    lat, lon = datamodule.get_lat_lon()
+
+    net = load_net(checkpoint, config["model"]["net"], device=device, quantize=quantize)
+    # exported weights may be in half precision
+    dtype = net.pos_embed.dtype
+    lead_times = (torch.tensor(predict_ranges, device=device) * hrs_each_step / 100).to(dtype)
+
+    samples = iter_initial_conditions(getattr(datamodule, f"lister_{partition}"), variables, start, end, hrs_each_step)
+    writer = ZarrWriter(output, out_variables, [r * hrs_each_step for r in predict_ranges], lat, lon)
+    try:
+        with torch.inference_mode():
+            for times, x in iter_batches(samples, batch_size):
+                x = datamodule.transforms(x.to(device, non_blocking=True)).to(dtype)
+                preds = net.predict_multi_lead(x, lead_times, variables, out_variables)  # B, T, Vo, H, W
+                writer.put(times, denormalization(preds.float()))
+    finally:
+        writer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,19 +2,19 @@
 # Licensed under the MIT license.
 
 # credits: https://github.com/ashleve/lightning-hydra-template/blob/main/src/models/mnist_module.py
-from typing import Any
+from typing import Any, Optional
 
 import torch
 from pytorch_lightning import LightningModule
 from torchvision.transforms import transforms
 
 from climax.arch import ClimaX
+from climax.utils.checkpoint import map_pretrained_vars
 from climax.utils.lr_scheduler import LinearWarmupCosineAnnealingLR
 from climax.utils.metrics import (
-    lat_weighted_acc,
+    ForecastMetricsAccumulator,
+    MetricsContext,
     lat_weighted_mse,
-    lat_weighted_mse_val,
-    lat_weighted_rmse,
 )
 from climax.utils.pos_embed import interpolate_pos_embed
 
@@ -33,6 +33,9 @@ class GlobalForecastModule(LightningModule):
         max_epochs (int, optional): Number of total epochs.
         warmup_start_lr (float, optional): Starting learning rate for warmup.
         eta_min (float, optional): Minimum learning rate.
+        compile_encoder (bool, optional): Whether to compile the encoder of the model with `torch.compile`.
+        pretrained_vars (list, optional): `default_vars` of the pre-trained model. If set, the per-variable weights
+            of the checkpoint are mapped onto `net.default_vars` by name, see `map_pretrained_vars`.
     """
 
     def __init__(
@@ -47,14 +50,22 @@ class GlobalForecastModule(LightningModule):
         max_epochs: int = 200000,
         warmup_start_lr: float = 1e-8,
         eta_min: float = 1e-8,
+        compile_encoder: bool = False,
+        pretrained_vars: Optional[list] = None,
     ):
         super().__init__()
         self.save_hyperparameters(logger=False, ignore=["net"])
         self.net = net
+        # set by `set_eval_pred_ranges` and `set_out_variables`
+        self.eval_pred_ranges = None
+        self.out_variables = None
+        self.create_metrics()
         if len(pretrained_path) > 0:
-            self.load_pretrained_weights(pretrained_path)
+            self.load_pretrained_weights(pretrained_path, pretrained_vars)
+        if compile_encoder:
+            self.net.compile_encoder()
 
-    def load_pretrained_weights(self, pretrained_path):
+    def load_pretrained_weights(self, pretrained_path, pretrained_vars=None):
         if pretrained_path.startswith("http"):
             checkpoint = torch.hub.load_state_dict_from_url(pretrained_path)
         else:
@@ -66,7 +77,7 @@ class GlobalForecastModule(LightningModule):
 
         state_dict = self.state_dict()
         if self.net.parallel_patch_embed:
-            if "token_embeds.proj_weights" not in checkpoint_model.keys():
+            if "net.token_embeds.proj_weights" not in checkpoint_model.keys():
                 raise ValueError(
                     "Pretrained checkpoint does not have token_embeds.proj_weights for parallel processing. Please convert the checkpoints first or disable parallel patch_embed tokenization."
                 )
@@ -76,6 +87,8 @@ class GlobalForecastModule(LightningModule):
             if "channel" in k:
                 checkpoint_model[k.replace("channel", "var")] = checkpoint_model[k]
                 del checkpoint_model[k]
+        if pretrained_vars is not None:
+            map_pretrained_vars(self.net, checkpoint_model, pretrained_vars)
         for k in list(checkpoint_model.keys()):
             if k not in state_dict.keys() or checkpoint_model[k].shape != state_dict[k].shape:
                 print(f"Removing key {k} from pretrained checkpoint")
@@ -91,10 +104,28 @@ class GlobalForecastModule(LightningModule):
     def set_lat_lon(self, lat, lon):
         self.lat = lat
         self.lon = lon
+        self.metrics_context = MetricsContext(lat)
 
     def set_pred_range(self, r):
         self.pred_range = r
 
+    def set_eval_pred_ranges(self, ranges):
+        """Evaluates several predict ranges at once, see `eval_predict_ranges` of `GlobalForecastDataModule`."""
+        self.eval_pred_ranges = list(ranges)
+        self.create_metrics()
+
+    def set_out_variables(self, out_variables):
+        """Output variables, so that ranks without validation or test batches still take part in the reduction
+        of the scores."""
+        self.out_variables = list(out_variables)
+        self.create_metrics()
+
+    def create_metrics(self):
+        # epoch-level scores, see `ForecastMetricsAccumulator`
+        num_lead_times = len(self.eval_pred_ranges) if self.eval_pred_ranges is not None else 1
+        self.val_metrics = ForecastMetricsAccumulator(num_lead_times, self.out_variables)
+        self.test_metrics = ForecastMetricsAccumulator(num_lead_times, self.out_variables)
+
     def set_val_clim(self, clim):
         self.val_clim = clim
 
@@ -104,7 +135,9 @@ class GlobalForecastModule(LightningModule):
     def training_step(self, batch: Any, batch_idx: int):
         x, y, lead_times, variables, out_variables = batch
 
-        loss_dict, _ = self.net.forward(x, y, lead_times, variables, out_variables, [lat_weighted_mse], lat=self.lat)
+        loss_dict, _ = self.net.forward(
+            x, y, lead_times, variables, out_variables, [lat_weighted_mse], lat=self.metrics_context
+        )
         loss_dict = loss_dict[0]
         for var in loss_dict.keys():
             self.log(
@@ -118,81 +151,61 @@ class GlobalForecastModule(LightningModule):
 
         return loss
 
-    def validation_step(self, batch: Any, batch_idx: int):
-        x, y, lead_times, variables, out_variables = batch
+    def get_log_postfix(self, pred_range):
+        if pred_range < 24:
+            return f"{pred_range}_hours"
+        days = int(pred_range / 24)
+        return f"{days}_days"
 
-        if self.pred_range < 24:
-            log_postfix = f"{self.pred_range}_hours"
-        else:
-            days = int(self.pred_range / 24)
-            log_postfix = f"{days}_days"
-
-        all_loss_dicts = self.net.evaluate(
-            x,
-            y,
-            lead_times,
-            variables,
-            out_variables,
-            transform=self.denormalization,
-            metrics=[lat_weighted_mse_val, lat_weighted_rmse, lat_weighted_acc],
-            lat=self.lat,
-            clim=self.val_clim,
-            log_postfix=log_postfix,
-        )
-
-        loss_dict = {}
-        for d in all_loss_dicts:
-            for k in d.keys():
-                loss_dict[k] = d[k]
+    def evaluation_step(self, batch: Any, metrics: ForecastMetricsAccumulator, clim):
+        x, y, lead_times, variables, out_variables = batch
 
+        if y.dim() == 5:
+            # targets at several lead times, all predicted in one batched pass
+            preds = self.net.predict_multi_lead(x, lead_times, variables, out_variables)  # B, T, Vo, H, W
+            with self.net.full_precision(preds):
+                for t in range(preds.shape[1]):
+                    metrics.update(
+                        preds[:, t], y[:, t], self.denormalization, out_variables, self.metrics_context, clim, t
+                    )
+            return
+
+        _, preds = self.net.forward(x, y, lead_times, variables, out_variables, metric=None, lat=self.metrics_context)
+        with self.net.full_precision(preds):
+            metrics.update(preds, y, self.denormalization, out_variables, self.metrics_context, clim)
+
+    def log_evaluation(self, metrics: ForecastMetricsAccumulator, prefix):
+        # scores are exact over the epoch and already reduced across ranks
+        pred_ranges = self.eval_pred_ranges if self.eval_pred_ranges is not None else [self.pred_range]
+        loss_dict = metrics.compute([self.get_log_postfix(pred_range) for pred_range in pred_ranges], self.device)
         for var in loss_dict.keys():
             self.log(
-                "val/" + var,
+                prefix + var,
                 loss_dict[var],
                 on_step=False,
                 on_epoch=True,
                 prog_bar=False,
-                sync_dist=True,
             )
+        metrics.reset()
         return loss_dict
 
-    def test_step(self, batch: Any, batch_idx: int):
-        x, y, lead_times, variables, out_variables = batch
+    def on_validation_epoch_start(self):
+        self.val_metrics.reset()
 
-        if self.pred_range < 24:
-            log_postfix = f"{self.pred_range}_hours"
-        else:
-            days = int(self.pred_range / 24)
-            log_postfix = f"{days}_days"
-
-        all_loss_dicts = self.net.evaluate(
-            x,
-            y,
-            lead_times,
-            variables,
-            out_variables,
-            transform=self.denormalization,
-            metrics=[lat_weighted_mse_val, lat_weighted_rmse, lat_weighted_acc],
-            lat=self.lat,
-            clim=self.test_clim,
-            log_postfix=log_postfix,
-        )
+    def validation_step(self, batch: Any, batch_idx: int):
+        self.evaluation_step(batch, self.val_metrics, self.val_clim)
 
-        loss_dict = {}
-        for d in all_loss_dicts:
-            for k in d.keys():
-                loss_dict[k] = d[k]
+    def on_validation_epoch_end(self):
+        self.log_evaluation(self.val_metrics, "val/")
 
-        for var in loss_dict.keys():
-            self.log(
-                "test/" + var,
-                loss_dict[var],
-                on_step=False,
-                on_epoch=True,
-                prog_bar=False,
-                sync_dist=True,
-            )
-        return loss_dict
+    def on_test_epoch_start(self):
+        self.test_metrics.reset()
+
+    def test_step(self, batch: Any, batch_idx: int):
+        self.evaluation_step(batch, self.test_metrics, self.test_clim)
+
+    def on_test_epoch_end(self):
+        self.log_evaluation(self.test_metrics, "test/")
 
     def configure_optimizers(self):
         decay = []
@@ -27,6 +27,9 @@ def main():
     cli.model.set_denormalization(mean_denorm, std_denorm)
     cli.model.set_lat_lon(*cli.datamodule.get_lat_lon())
     cli.model.set_pred_range(cli.datamodule.hparams.predict_range)
+    if cli.datamodule.hparams.eval_predict_ranges is not None:
+        cli.model.set_eval_pred_ranges(cli.datamodule.hparams.eval_predict_ranges)
+    cli.model.set_out_variables(cli.datamodule.hparams.out_variables or cli.datamodule.hparams.variables)
     cli.model.set_val_clim(cli.datamodule.val_clim)
     cli.model.set_test_clim(cli.datamodule.test_clim)
 
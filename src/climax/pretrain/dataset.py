@@ -9,6 +9,8 @@ import numpy as np
 import torch
 from torch.utils.data import IterableDataset
 
+from climax.utils.data_utils import crop_region
+
 
 class NpyReader(IterableDataset):
     def __init__(
@@ -95,6 +97,40 @@ class Forecast(IterableDataset):
             yield inputs, outputs, lead_times, variables, out_variables
 
 
+class MultiLeadForecast(IterableDataset):
+    """Pairs each initial condition with its targets at several lead times, read from the same shard.
+
+    Yields outputs of shape `[N, T, V, H, W]` and lead times of shape `[N, T]`. All lead times share the initial
+    conditions which have a target at the longest lead time, so shorter lead times are paired with fewer initial
+    conditions than with `Forecast(max_predict_range=...)`: the last `max(predict_ranges) - predict_range` ones
+    of each shard are left out.
+    """
+
+    def __init__(self, dataset: NpyReader, predict_ranges, hrs_each_step: int = 1) -> None:
+        super().__init__()
+        self.dataset = dataset
+        self.predict_ranges = list(predict_ranges)
+        self.hrs_each_step = hrs_each_step
+
+    def __iter__(self):
+        max_predict_range = max(self.predict_ranges)
+        for data, variables, out_variables in self.dataset:
+            x = np.concatenate([data[k].astype(np.float32) for k in data.keys()], axis=1)
+            x = torch.from_numpy(x)
+            y = np.concatenate([data[k].astype(np.float32) for k in out_variables], axis=1)
+            y = torch.from_numpy(y)
+
+            inputs = x[:-max_predict_range]  # N, C, H, W
+
+            predict_ranges = torch.tensor(self.predict_ranges).unsqueeze(0).expand(inputs.shape[0], -1)  # N, T
+            lead_times = self.hrs_each_step * predict_ranges / 100
+            lead_times = lead_times.to(inputs.dtype)
+            output_ids = torch.arange(inputs.shape[0]).unsqueeze(-1) + predict_ranges
+            outputs = y[output_ids]  # N, T, C, H, W
+
+            yield inputs, outputs, lead_times, variables, out_variables
+
+
 class IndividualForecastDataIter(IterableDataset):
     def __init__(self, dataset, transforms: torch.nn.Module, output_transforms: torch.nn.Module, region_info = None):
         super().__init__()
@@ -104,14 +140,32 @@ class IndividualForecastDataIter(IterableDataset):
         self.region_info = region_info
 
     def __iter__(self):
+        if isinstance(self.region_info, list):
+            yield from self.iter_regions()
+            return
+
         for (inp, out, lead_times, variables, out_variables) in self.dataset:
             assert inp.shape[0] == out.shape[0]
+            if self.region_info is not None:
+                # only ship the region to the model
+                inp = crop_region(inp, self.region_info)
+                out = crop_region(out, self.region_info)
             for i in range(inp.shape[0]):
                 if self.region_info is not None:
                     yield self.transforms(inp[i]), self.output_transforms(out[i]), lead_times[i], variables, out_variables, self.region_info
                 else:
                     yield self.transforms(inp[i]), self.output_transforms(out[i]), lead_times[i], variables, out_variables
 
+    def iter_regions(self):
+        # each sample is yielded once for every region, cropped to that region
+        for (inp, out, lead_times, variables, out_variables) in self.dataset:
+            assert inp.shape[0] == out.shape[0]
+            for i in range(inp.shape[0]):
+                for region_info in self.region_info:
+                    x = self.transforms(crop_region(inp[i], region_info))
+                    y = self.output_transforms(crop_region(out[i], region_info))
+                    yield x, y, lead_times[i], variables, out_variables, region_info
+
 
 class ShuffleIterableDataset(IterableDataset):
     def __init__(self, dataset, buffer_size: int) -> None:
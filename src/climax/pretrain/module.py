@@ -8,7 +8,7 @@ from pytorch_lightning import LightningModule
 
 from climax.arch import ClimaX
 from climax.utils.lr_scheduler import LinearWarmupCosineAnnealingLR
-from climax.utils.metrics import lat_weighted_mse
+from climax.utils.metrics import MetricsContext, lat_weighted_mse
 
 
 class PretrainModule(LightningModule):
@@ -24,6 +24,7 @@ class PretrainModule(LightningModule):
         max_steps (int, optional): Number of total steps.
         warmup_start_lr (float, optional): Starting learning rate for warmup.
         eta_min (float, optional): Minimum learning rate.
+        compile_encoder (bool, optional): Whether to compile the encoder of the model with `torch.compile`.
     """
 
     def __init__(
@@ -37,19 +38,25 @@ class PretrainModule(LightningModule):
         max_steps: int = 200000,
         warmup_start_lr: float = 1e-8,
         eta_min: float = 1e-8,
+        compile_encoder: bool = False,
     ):
         super().__init__()
         self.save_hyperparameters(logger=False, ignore=["net"])
         self.net = net
+        if compile_encoder:
+            self.net.compile_encoder()
 
     def set_lat_lon(self, lat, lon):
         self.lat = lat
         self.lon = lon
+        self.metrics_context = MetricsContext(lat)
 
     def training_step(self, batch: Any, batch_idx: int):
         x, y, lead_times, variables, out_variables = batch
 
-        loss_dict, _ = self.net.forward(x, y, lead_times, variables, out_variables, [lat_weighted_mse], lat=self.lat)
+        loss_dict, _ = self.net.forward(
+            x, y, lead_times, variables, out_variables, [lat_weighted_mse], lat=self.metrics_context
+        )
         loss_dict = loss_dict[0]
         for var in loss_dict.keys():
             self.log(
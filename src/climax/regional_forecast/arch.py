@@ -3,59 +3,78 @@
 
 import torch
 from climax.arch import ClimaX
+from climax.utils.data_utils import crop_region
+from climax.utils.metrics import MetricsContext, PackedMetricsContext
 
 class RegionalClimaX(ClimaX):
-    def __init__(self, default_vars, img_size=..., patch_size=2, embed_dim=1024, depth=8, decoder_depth=2, num_heads=16, mlp_ratio=4, drop_path=0.1, drop_rate=0.1):
-        super().__init__(default_vars, img_size, patch_size, embed_dim, depth, decoder_depth, num_heads, mlp_ratio, drop_path, drop_rate)
+    def __init__(self, default_vars, img_size=..., patch_size=2, embed_dim=1024, depth=8, decoder_depth=2, num_heads=16, mlp_ratio=4, drop_path=0.1, drop_rate=0.1, parallel_patch_embed=False, static_vars=None):
+        super().__init__(default_vars, img_size, patch_size, embed_dim, depth, decoder_depth, num_heads, mlp_ratio, drop_path, drop_rate, parallel_patch_embed, static_vars)
+
+    def is_global(self, x: torch.Tensor):
+        return tuple(x.shape[-2:]) == tuple(self.img_size)
+
+    @staticmethod
+    def is_packed(region_info):
+        # batch mixing several regions, see `climax.regional_forecast.datamodule.pack_regions`
+        return 'token_mask' in region_info
+
+    def get_region_pos_embed(self, region_info):
+        if self.is_packed(region_info):
+            return self.pos_embed[0][region_info['pos_ids']]  # B, L, D
+
+        # the region is a rectangle of patches, so its positional embeddings are a crop of the global ones
+        p = self.patch_size
+        pos_embed = self.pos_embed.unflatten(1, sizes=(self.img_size[0] // p, self.img_size[1] // p))
+        h_from, h_to = region_info['min_h'] // p, region_info['max_h'] // p + 1
+        w_from, w_to = region_info['min_w'] // p, region_info['max_w'] // p + 1
+        pos_embed = pos_embed[:, h_from:h_to, w_from:w_to]
+        return pos_embed.flatten(1, 2)  # 1, L, D
+
+    @staticmethod
+    def get_packed_lat(lat, region_info):
+        # per-sample latitude weights of the regions, zero for padding
+        if not isinstance(lat, MetricsContext):
+            lat = MetricsContext(lat)
+        h = region_info['mask'].shape[1]
+        return PackedMetricsContext([lat[info['min_h']:info['max_h']+1] for info in region_info['regions']], h)
 
     def forward_encoder(self, x: torch.Tensor, lead_times: torch.Tensor, variables, region_info):
-        # x: `[B, V, H, W]` shape.
+        # x: `[B, V, H, W]` shape, either global, already cropped to the region or packed.
 
         if isinstance(variables, list):
             variables = tuple(variables)
 
-        # tokenize each variable separately
-        embeds = []
-        var_ids = self.get_var_ids(variables, x.device)
-        for i in range(len(var_ids)):
-            id = var_ids[i]
-            embeds.append(self.token_embeds[id](x[:, i : i + 1]))
-        x = torch.stack(embeds, dim=1)  # B, V, L, D
+        if self.is_packed(region_info):
+            # static variables differ between the regions of the batch, so they are embedded like all others
+            grid_size = (x.shape[-2] // self.patch_size, x.shape[-1] // self.patch_size)
+            x = self.embed_variables(x, self.get_var_ids(variables, x.device))  # B, V, L, D
+            x = self.aggregate_variables(x)  # B, L, D
+            x = x + self.get_region_pos_embed(region_info)
+            return self.forward_blocks(x, lead_times, token_mask=region_info['token_mask'], grid_size=grid_size)
 
-        # add variable embedding
-        var_embed = self.get_var_emb(self.var_embed, variables)
-        x = x + var_embed.unsqueeze(2)  # B, V, L, D
+        # only tokenize the patches of the region
+        if self.is_global(x):
+            x = crop_region(x, region_info)
+        grid_size = (x.shape[-2] // self.patch_size, x.shape[-1] // self.patch_size)
+        extent = (region_info['min_h'], region_info['max_h'], region_info['min_w'], region_info['max_w'])
 
-        # get the patch ids corresponding to the region
-        region_patch_ids = region_info['patch_ids']
-        x = x[:, :, region_patch_ids, :]
+        # tokenize each variable separately and add variable embedding
+        x = self.embed_variables(x, variables, extent)  # B, V, L, D
 
         # variable aggregation
         x = self.aggregate_variables(x)  # B, L, D
 
         # add pos embedding
-        x = x + self.pos_embed[:, region_patch_ids, :]
+        x = x + self.get_region_pos_embed(region_info)
 
-        # add lead time embedding
-        lead_time_emb = self.lead_time_embed(lead_times.unsqueeze(-1))  # B, D
-        lead_time_emb = lead_time_emb.unsqueeze(1)
-        x = x + lead_time_emb  # B, L, D
-
-        x = self.pos_drop(x)
-
-        # apply Transformer blocks
-        for blk in self.blocks:
-            x = blk(x)
-        x = self.norm(x)
-
-        return x
+        return self.forward_blocks(x, lead_times, grid_size=grid_size)
 
     def forward(self, x, y, lead_times, variables, out_variables, metric, lat, region_info):
         """Forward pass through the model.
 
         Args:
-            x: `[B, Vi, H, W]` shape. Input weather/climate variables
-            y: `[B, Vo, H, W]` shape. Target weather/climate variables
+            x: `[B, Vi, H, W]` shape. Input weather/climate variables, global, cropped to the region or packed
+            y: `[B, Vo, H, W]` shape. Target weather/climate variables, global, cropped to the region or packed
             lead_times: `[B]` shape. Forecasting lead times of each element of the batch.
             region_info: Containing the region's information
 
@@ -64,31 +83,73 @@ class RegionalClimaX(ClimaX):
             preds (torch.Tensor): `[B, Vo, H, W]` shape. Predicted weather/climate variables.
         """
         out_transformers = self.forward_encoder(x, lead_times, variables, region_info)  # B, L, D
-        preds = self.head(out_transformers)  # B, L, V*p*p
+
+        if self.is_packed(region_info):
+            # padded grid cells are excluded from the loss
+            preds = self.decode(out_transformers, out_variables, h=x.shape[-2], w=x.shape[-1])  # B, Vo, H, W
+            if metric is None:
+                loss = None
+            else:
+                lat = self.get_packed_lat(lat, region_info)
+                with self.full_precision(preds):
+                    loss = [m(preds.float(), y.float(), out_variables, lat, mask=region_info['mask']) for m in metric]
+            return loss, preds
 
         min_h, max_h = region_info['min_h'], region_info['max_h']
         min_w, max_w = region_info['min_w'], region_info['max_w']
-        preds = self.unpatchify(preds, h = max_h - min_h + 1, w = max_w - min_w + 1)
-        out_var_ids = self.get_var_ids(tuple(out_variables), preds.device)
-        preds = preds[:, out_var_ids]
+        preds = self.decode(out_transformers, out_variables, h = max_h - min_h + 1, w = max_w - min_w + 1)  # B, Vo, H, W
 
-        y = y[:, :, min_h:max_h+1, min_w:max_w+1]
-        lat = lat[min_h:max_h+1]
+        if y is not None and self.is_global(y):
+            y = crop_region(y, region_info)
+        if lat is not None:
+            lat = lat[min_h:max_h+1]
 
         if metric is None:
             loss = None
         else:
-            loss = [m(preds, y, out_variables, lat) for m in metric]
+            with self.full_precision(preds):
+                loss = [m(preds.float(), y.float(), out_variables, lat) for m in metric]
 
         return loss, preds
 
     def evaluate(self, x, y, lead_times, variables, out_variables, transform, metrics, lat, clim, log_postfix, region_info):
         _, preds = self.forward(x, y, lead_times, variables, out_variables, metric=None, lat=lat, region_info=region_info)
 
+        if self.is_packed(region_info):
+            return [self.evaluate_packed(preds, y, out_variables, transform, metrics, lat, clim, log_postfix, region_info)]
+
         min_h, max_h = region_info['min_h'], region_info['max_h']
-        min_w, max_w = region_info['min_w'], region_info['max_w']
-        y = y[:, :, min_h:max_h+1, min_w:max_w+1]
+        if self.is_global(y):
+            y = crop_region(y, region_info)
         lat = lat[min_h:max_h+1]
-        clim = clim[:, min_h:max_h+1, min_w:max_w+1]
-
-        return [m(preds, y, transform, out_variables, lat, clim, log_postfix) for m in metrics]
\ No newline at end of file
+        clim = crop_region(clim, region_info)
+
+        with self.full_precision(preds):
+            return [m(preds.float(), y.float(), transform, out_variables, lat, clim, log_postfix) for m in metrics]
+
+    def evaluate_packed(self, preds, y, out_variables, transform, metrics, lat, clim, log_postfix, region_info):
+        # evaluate each region separately, per-variable metrics are reported per region and
+        # aggregated metrics are a macro average over the regions of the batch: each region counts
+        # equally, whatever its size and its number of samples in the batch
+        names = [info['name'] for info in region_info['regions']]
+        loss_dict = {}
+        aggregated = {}
+        for name in dict.fromkeys(names):
+            ids = [i for i in range(len(names)) if names[i] == name]
+            info = region_info['regions'][ids[0]]
+            h, w = info['max_h'] - info['min_h'] + 1, info['max_w'] - info['min_w'] + 1
+            region_postfix = f"{log_postfix}_{name}"
+            region_preds, region_y = preds[ids, :, :h, :w].float(), y[ids, :, :h, :w].float()
+            region_lat = lat[info['min_h']:info['max_h']+1]
+            region_clim = crop_region(clim, info)
+            for m in metrics:
+                with self.full_precision(preds):
+                    d = m(region_preds, region_y, transform, out_variables, region_lat, region_clim, region_postfix)
+                for k in d.keys():
+                    if region_postfix in k:
+                        loss_dict[k] = d[k]
+                    else:
+                        aggregated.setdefault(k, []).append(d[k])
+        for k in aggregated.keys():
+            loss_dict[k] = torch.stack(aggregated[k]).mean()
+        return loss_dict
@@ -2,7 +2,8 @@
 # Licensed under the MIT license.
 
 import os
-from typing import Optional
+from functools import partial
+from typing import Dict, List, Optional, Union
 
 import numpy as np
 import torch
@@ -17,16 +18,56 @@ from climax.pretrain.dataset import (
     NpyReader,
     ShuffleIterableDataset,
 )
-from climax.utils.data_utils import get_region_info
+from climax.utils.data_utils import get_region_info, get_regions_info
 
 
-def collate_fn_regional(batch):
-    inp = torch.stack([batch[i][0] for i in range(len(batch))])
-    out = torch.stack([batch[i][1] for i in range(len(batch))])
+def pack_regions(batch):
+    """Pads samples of different regions to a common size.
+
+    Returns the padded inputs and outputs, and a packed region info holding the descriptors of the
+    samples' regions, the mask of valid grid cells, the mask of valid tokens and the global patch id of
+    each token, which `RegionalClimaX` uses to gather the positional embeddings.
+    """
+    region_infos = [batch[i][5] for i in range(len(batch))]
+    p = region_infos[0]["patch_size"]
+    h = max(batch[i][0].shape[-2] for i in range(len(batch)))
+    w = max(batch[i][0].shape[-1] for i in range(len(batch)))
+
+    inp = batch[0][0].new_zeros(len(batch), batch[0][0].shape[0], h, w)
+    out = batch[0][1].new_zeros(len(batch), batch[0][1].shape[0], h, w)
+    mask = torch.zeros(len(batch), h, w, dtype=torch.bool)
+    pos_ids = torch.zeros(len(batch), h // p, w // p, dtype=torch.long)
+    for i in range(len(batch)):
+        h_i, w_i = batch[i][0].shape[-2:]
+        inp[i, :, :h_i, :w_i] = batch[i][0]
+        out[i, :, :h_i, :w_i] = batch[i][1]
+        mask[i, :h_i, :w_i] = True
+        pos_ids[i, : h_i // p, : w_i // p] = torch.tensor(region_infos[i]["patch_ids"]).view(h_i // p, w_i // p)
+
+    region_info = {
+        "regions": region_infos,
+        "mask": mask,  # B, H, W
+        "token_mask": mask[:, ::p, ::p].flatten(1),  # B, L
+        "pos_ids": pos_ids.flatten(1),  # B, L
+    }
+    return inp, out, region_info
+
+
+def collate_fn_regional(batch, packed=False):
+    """Collates samples of a single region, or packs them with `pack_regions` when training on several regions.
+
+    Batches of several regions are always packed, even when they happen to hold a single region, so that all
+    their batches are evaluated and logged alike.
+    """
+    if packed:
+        inp, out, region_info = pack_regions(batch)
+    else:
+        inp = torch.stack([batch[i][0] for i in range(len(batch))])
+        out = torch.stack([batch[i][1] for i in range(len(batch))])
+        region_info = batch[0][5]
     lead_times = torch.stack([batch[i][2] for i in range(len(batch))])
     variables = batch[0][3]
     out_variables = batch[0][4]
-    region_info = batch[0][5]
     return (
         inp,
         out,
@@ -45,7 +86,7 @@ class RegionalForecastDataModule(LightningDataModule):
         variables (list): List of input variables.
         buffer_size (int): Buffer size for shuffling.
         out_variables (list, optional): List of output variables.
-        region (str, optional): The name of the region to finetune ClimaX on.
+        region (str or Dict or List, optional): The name of the region to finetune ClimaX on, or a bounding box given as a dict with `lat_range` and `lon_range`. A list of regions trains on all of them at once, with batches mixing samples of different regions.
         predict_range (int, optional): Predict range.
         hrs_each_step (int, optional): Hours each step.
         batch_size (int, optional): Batch size.
@@ -59,7 +100,7 @@ class RegionalForecastDataModule(LightningDataModule):
         variables,
         buffer_size,
         out_variables=None,
-        region: str = 'NorthAmerica',
+        region: Union[str, Dict, List] = 'NorthAmerica',
         predict_range: int = 6,
         hrs_each_step: int = 1,
         batch_size: int = 64,
@@ -121,9 +162,15 @@ class RegionalForecastDataModule(LightningDataModule):
     def set_patch_size(self, p):
         self.patch_size = p
 
+    def get_collate_fn(self):
+        return partial(collate_fn_regional, packed=isinstance(self.hparams.region, list))
+
     def setup(self, stage: Optional[str] = None):
         lat, lon = self.get_lat_lon()
-        region_info = get_region_info(self.hparams.region, lat, lon, self.patch_size)
+        if isinstance(self.hparams.region, list):
+            region_info = get_regions_info(self.hparams.region, lat, lon, self.patch_size)
+        else:
+            region_info = get_region_info(self.hparams.region, lat, lon, self.patch_size)
         # load datasets only if they're not loaded already
         if not self.data_train and not self.data_val and not self.data_test:
             self.data_train = ShuffleIterableDataset(
@@ -196,7 +243,7 @@ class RegionalForecastDataModule(LightningDataModule):
             drop_last=False,
             num_workers=self.hparams.num_workers,
             pin_memory=self.hparams.pin_memory,
-            collate_fn=collate_fn_regional,
+            collate_fn=self.get_collate_fn(),
         )
 
     def val_dataloader(self):
@@ -207,7 +254,7 @@ class RegionalForecastDataModule(LightningDataModule):
             drop_last=False,
             num_workers=self.hparams.num_workers,
             pin_memory=self.hparams.pin_memory,
-            collate_fn=collate_fn_regional,
+            collate_fn=self.get_collate_fn(),
         )
 
     def test_dataloader(self):
@@ -218,5 +265,5 @@ class RegionalForecastDataModule(LightningDataModule):
             drop_last=False,
             num_workers=self.hparams.num_workers,
             pin_memory=self.hparams.pin_memory,
-            collate_fn=collate_fn_regional,
+            collate_fn=self.get_collate_fn(),
         )
@@ -2,15 +2,17 @@
 # Licensed under the MIT license.
 
 # credits: https://github.com/ashleve/lightning-hydra-template/blob/main/src/models/mnist_module.py
-from typing import Any
+from typing import Any, Optional
 
 import torch
 from pytorch_lightning import LightningModule
 from torchvision.transforms import transforms
 
 from climax.regional_forecast.arch import RegionalClimaX
+from climax.utils.checkpoint import map_pretrained_vars
 from climax.utils.lr_scheduler import LinearWarmupCosineAnnealingLR
 from climax.utils.metrics import (
+    MetricsContext,
     lat_weighted_acc,
     lat_weighted_mse,
     lat_weighted_mse_val,
@@ -33,6 +35,8 @@ class RegionalForecastModule(LightningModule):
         max_epochs (int, optional): Number of total epochs.
         warmup_start_lr (float, optional): Starting learning rate for warmup.
         eta_min (float, optional): Minimum learning rate.
+        pretrained_vars (list, optional): `default_vars` of the pre-trained model. If set, the per-variable weights
+            of the checkpoint are mapped onto `net.default_vars` by name, see `map_pretrained_vars`.
     """
 
     def __init__(
@@ -47,14 +51,15 @@ class RegionalForecastModule(LightningModule):
         max_epochs: int = 200000,
         warmup_start_lr: float = 1e-8,
         eta_min: float = 1e-8,
+        pretrained_vars: Optional[list] = None,
     ):
         super().__init__()
         self.save_hyperparameters(logger=False, ignore=["net"])
         self.net = net
         if len(pretrained_path) > 0:
-            self.load_pretrained_weights(pretrained_path)
+            self.load_pretrained_weights(pretrained_path, pretrained_vars)
 
-    def load_pretrained_weights(self, pretrained_path):
+    def load_pretrained_weights(self, pretrained_path, pretrained_vars=None):
         if pretrained_path.startswith("http"):
             checkpoint = torch.hub.load_state_dict_from_url(pretrained_path)
         else:
@@ -67,7 +72,7 @@ class RegionalForecastModule(LightningModule):
 
         state_dict = self.state_dict()
         if self.net.parallel_patch_embed:
-            if "token_embeds.proj_weights" not in checkpoint_model.keys():
+            if "net.token_embeds.proj_weights" not in checkpoint_model.keys():
                 raise ValueError(
                     "Pretrained checkpoint does not have token_embeds.proj_weights for parallel processing. Please convert the checkpoints first or disable parallel patch_embed tokenization."
                 )
@@ -77,6 +82,8 @@ class RegionalForecastModule(LightningModule):
             if "channel" in k:
                 checkpoint_model[k.replace("channel", "var")] = checkpoint_model[k]
                 del checkpoint_model[k]
+        if pretrained_vars is not None:
+            map_pretrained_vars(self.net, checkpoint_model, pretrained_vars)
         for k in list(checkpoint_model.keys()):
             if k not in state_dict.keys() or checkpoint_model[k].shape != state_dict[k].shape:
                 print(f"Removing key {k} from pretrained checkpoint")
@@ -92,6 +99,7 @@ class RegionalForecastModule(LightningModule):
     def set_lat_lon(self, lat, lon):
         self.lat = lat
         self.lon = lon
+        self.metrics_context = MetricsContext(lat)
 
     def set_pred_range(self, r):
         self.pred_range = r
@@ -109,7 +117,14 @@ class RegionalForecastModule(LightningModule):
         x, y, lead_times, variables, out_variables, region_info = batch
 
         loss_dict, _ = self.net.forward(
-            x, y, lead_times, variables, out_variables, [lat_weighted_mse], lat=self.lat, region_info=region_info
+            x,
+            y,
+            lead_times,
+            variables,
+            out_variables,
+            [lat_weighted_mse],
+            lat=self.metrics_context,
+            region_info=region_info,
         )
         loss_dict = loss_dict[0]
         for var in loss_dict.keys():
@@ -141,7 +156,7 @@ class RegionalForecastModule(LightningModule):
             out_variables,
             transform=self.denormalization,
             metrics=[lat_weighted_mse_val, lat_weighted_rmse, lat_weighted_acc],
-            lat=self.lat,
+            lat=self.metrics_context,
             clim=self.val_clim,
             log_postfix=log_postfix,
             region_info=region_info,
@@ -180,7 +195,7 @@ class RegionalForecastModule(LightningModule):
             out_variables,
             transform=self.denormalization,
             metrics=[lat_weighted_mse_val, lat_weighted_rmse, lat_weighted_acc],
-            lat=self.lat,
+            lat=self.metrics_context,
             clim=self.test_clim,
             log_postfix=log_postfix,
             region_info=region_info,
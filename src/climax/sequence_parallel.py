@@ -0,0 +1,94 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""Sequence parallelism: the tokens of a sample are sharded across the ranks of a process group.
+
+Each rank holds a contiguous band of patch rows. Transformer blocks exchange their queries, keys and values
+with an all-to-all so that each rank attends over the whole sequence for `num_heads / P` heads, and exchange
+the attention outputs back to their token shards (DeepSpeed-Ulysses, https://arxiv.org/abs/2309.14509). All
+other layers are applied per token. Activations, including the attention scores, are divided by the size `P`
+of the group.
+
+See `ClimaX.forward_sequence_parallel`.
+"""
+
+import torch
+import torch.distributed as dist
+import torch.distributed.nn.functional as dist_fn
+import torch.nn.functional as F
+
+
+def get_sequence_shard(num_rows, group=None):
+    """Patch rows of the rank in `group`, a slice of `range(num_rows)`."""
+    rank, world_size = dist.get_rank(group), dist.get_world_size(group)
+    if num_rows % world_size != 0:
+        raise ValueError(f"{num_rows} patch rows cannot be sharded across {world_size} ranks.")
+    rows_per_rank = num_rows // world_size
+    return slice(rank * rows_per_rank, (rank + 1) * rows_per_rank)
+
+
+def _all_to_all(x: torch.Tensor, group):
+    # exchanges x[i] with rank i, differentiable
+    x = x.contiguous()
+    return dist_fn.all_to_all_single(torch.empty_like(x), x, group=group)
+
+
+def sequence_to_heads(x: torch.Tensor, group):
+    """
+    x: B, L / P, ..., H, Dh, tokens of the rank for all heads
+    return: B, L, ..., H / P, Dh, all tokens for the heads of the rank
+    """
+    world_size = dist.get_world_size(group)
+    h = x.shape[-2]
+    x = x.unflatten(-2, (world_size, h // world_size)).movedim(-3, 0)  # P, B, L / P, ..., H / P, Dh
+    x = _all_to_all(x, group)  # tokens of rank i for the heads of the rank
+    return x.movedim(0, 1).flatten(1, 2)
+
+
+def heads_to_sequence(x: torch.Tensor, group):
+    """
+    x: B, L, H / P, Dh, all tokens for the heads of the rank
+    return: B, L / P, H, Dh, tokens of the rank for all heads
+    """
+    world_size = dist.get_world_size(group)
+    x = x.unflatten(1, (world_size, x.shape[1] // world_size)).movedim(1, 0)  # P, B, L / P, H / P, Dh
+    x = _all_to_all(x, group)  # heads of rank i for the tokens of the rank
+    return x.movedim(0, -3).flatten(-3, -2)
+
+
+def sequence_parallel_block_forward(blk, x: torch.Tensor, group):
+    """Forward pass of a timm `Block` on the tokens of the rank, attending to the tokens of all ranks.
+
+    Uses the weights of the block as is, so that it is equivalent to `blk` on the whole sequence.
+
+    Args:
+        blk (timm.models.vision_transformer.Block): transformer block
+        x: `[B, L / P, D]` shape. Tokens of the rank
+        group (torch.distributed.ProcessGroup): ranks sharing the sequence
+
+    Returns:
+        torch.Tensor: `[B, L / P, D]` shape.
+    """
+    attn = blk.attn
+    b, n, c = x.shape
+    if attn.num_heads % dist.get_world_size(group) != 0:
+        raise ValueError(f"{attn.num_heads} heads cannot be sharded across {dist.get_world_size(group)} ranks.")
+    qkv = attn.qkv(blk.norm1(x)).reshape(b, n, 3, attn.num_heads, c // attn.num_heads)
+    qkv = sequence_to_heads(qkv, group)  # B, L, 3, num_heads / P, Dh
+    q, k, v = qkv.permute(2, 0, 3, 1, 4).unbind(0)  # B, num_heads / P, L, Dh
+
+    dropout_p = attn.attn_drop.p if attn.training else 0.0
+    out = F.scaled_dot_product_attention(q, k, v, dropout_p=dropout_p)  # B, num_heads / P, L, Dh
+    out = heads_to_sequence(out.transpose(1, 2), group)  # B, L / P, num_heads, Dh
+    out = attn.proj_drop(attn.proj(out.reshape(b, n, c)))
+
+    x = x + blk.drop_path1(blk.ls1(out))
+    x = x + blk.drop_path2(blk.ls2(blk.mlp(blk.norm2(x))))
+    return x
+
+
+def gather_rows(x: torch.Tensor, group=None):
+    """Gathers the `[..., H / P, W]` rows of the ranks into `[..., H, W]`, without gradients."""
+    shards = [torch.empty_like(x) for _ in range(dist.get_world_size(group))]
+    dist.all_gather(shards, x.contiguous(), group=group)
+    return torch.cat(shards, dim=-2)
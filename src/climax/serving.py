@@ -0,0 +1,169 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""Online serving of single forecasts with dynamic micro-batching.
+
+Requests are queued and grouped by input and output variables and grid size, a group is run as one batch
+once it holds `max_batch_size` requests or its oldest request has waited `max_latency` seconds. Lead times
+may differ within a batch since ClimaX takes a lead time per sample.
+
+Example:
+    async with ForecastServer(net, max_batch_size=16, max_latency=0.01) as server:
+        preds = await server.predict(x, lead_time, variables, out_variables)  # Vo, H, W
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import torch
+
+
+@dataclass
+class ForecastRequest:
+    x: torch.Tensor
+    lead_time: float
+    future: asyncio.Future
+    arrival: float
+
+
+class ForecastServer:
+    """Serves the forecasts of a model from an asyncio event loop.
+
+    Batches run one at a time in a worker thread, so that the event loop keeps accepting requests, which are
+    batched while the model is busy. Inputs and lead times are copied into buffers preallocated on the device
+    of the model for each group.
+
+    Args:
+        net (ClimaX): model, in eval mode
+        max_batch_size (int): maximum number of requests of a batch
+        max_latency (float): maximum time in seconds a request waits for other requests before its batch runs
+    """
+
+    def __init__(self, net, max_batch_size=16, max_latency=0.01):
+        self.net = net.eval()
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        # (variables, out_variables, H, W) --> (inputs, lead times) buffers
+        self.buffers = {}
+        self.queue = None
+        self.task = None
+        self.executor = None
+
+    @property
+    def device(self):
+        return self.net.pos_embed.device
+
+    @property
+    def dtype(self):
+        return self.net.pos_embed.dtype
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Serves the queued requests and stops."""
+        await self.queue.put(None)
+        await self.task
+        self.executor.shutdown()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.stop()
+
+    async def predict(self, x: torch.Tensor, lead_time: float, variables, out_variables):
+        """Forecast of a single initial condition.
+
+        Args:
+            x: `[Vi, H, W]` shape. Normalized input variables
+            lead_time (float): lead time, in the unit of the model (hours / 100)
+            variables (tuple): input variables
+            out_variables (tuple): output variables
+
+        Returns:
+            torch.Tensor: `[Vo, H, W]` shape, on the device of the model.
+        """
+        loop = asyncio.get_running_loop()
+        key = (tuple(variables), tuple(out_variables), *x.shape[-2:])
+        future = loop.create_future()
+        await self.queue.put((key, ForecastRequest(x, lead_time, future, loop.time())))
+        return await future
+
+    async def warmup(self, variables, out_variables, grid_size=None):
+        """Runs a full batch of a group, so that buffers are allocated and kernels are selected before serving."""
+        h, w = grid_size if grid_size is not None else self.net.img_size
+        x = torch.zeros(len(variables), h, w)
+        await asyncio.gather(*[self.predict(x, 0.0, variables, out_variables) for _ in range(self.max_batch_size)])
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        pending = {}  # key --> requests, groups in order of their oldest request
+        stopping = False
+
+        def add(item):
+            nonlocal stopping
+            if item is None:
+                stopping = True
+            else:
+                pending.setdefault(item[0], []).append(item[1])
+
+        while not (stopping and len(pending) == 0):
+            if len(pending) == 0:
+                add(await self.queue.get())
+                continue
+
+            # the group of the oldest request runs first, and not later than its deadline
+            key, requests = next(iter(pending.items()))
+            deadline = requests[0].arrival + self.max_latency
+            while len(requests) < self.max_batch_size and not stopping:
+                if not self.queue.empty():
+                    add(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    add(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            batch = requests[: self.max_batch_size]
+            del pending[key]
+            if len(requests) > len(batch):
+                # the rest of the group keeps its place in the order
+                pending = {key: requests[len(batch) :], **pending}
+            try:
+                preds = await loop.run_in_executor(self.executor, self.forward, key, batch)
+            except Exception as e:
+                for request in batch:
+                    if not request.future.cancelled():
+                        request.future.set_exception(e)
+                continue
+            for request, pred in zip(batch, preds):
+                if not request.future.cancelled():
+                    request.future.set_result(pred)
+
+    def get_buffers(self, key):
+        buffers = self.buffers.get(key)
+        if buffers is None:
+            variables, _, h, w = key
+            x = torch.empty(self.max_batch_size, len(variables), h, w, device=self.device, dtype=self.dtype)
+            lead_times = torch.empty(self.max_batch_size, device=self.device, dtype=self.dtype)
+            buffers = self.buffers[key] = (x, lead_times)
+        return buffers
+
+    def forward(self, key, batch):
+        variables, out_variables, _, _ = key
+        x, lead_times = self.get_buffers(key)
+        n = len(batch)
+        for i, request in enumerate(batch):
+            x[i].copy_(request.x, non_blocking=True)
+        lead_times[:n].copy_(torch.tensor([request.lead_time for request in batch]), non_blocking=True)
+        with torch.inference_mode():
+            _, preds = self.net.forward(x[:n], None, lead_times[:n], variables, out_variables, None, None)
+        return preds.unbind(0)
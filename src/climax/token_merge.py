@@ -0,0 +1,52 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import numpy as np
+import torch
+
+
+def get_polar_merge_ids(grid_size):
+    """Merges longitudinally adjacent tokens of an equiangular lat/lon patch grid towards the poles.
+
+    A row of patches centered at latitude `lat` merges groups of `2 ** round(log2(1 / cos(lat)))` adjacent
+    patches, so that merged tokens cover roughly the same area as equatorial ones. Group sizes are reduced
+    until they divide the number of patches of the row.
+
+    Args:
+        grid_size (tuple): number of patches along latitude and longitude
+
+    Returns:
+        merge_ids (torch.Tensor): `[L]` shape. Merged token of each token of the grid
+        merge_counts (torch.Tensor): `[L']` shape. Number of tokens merged into each merged token
+    """
+    grid_h, grid_w = grid_size
+    lat = -90 + (np.arange(grid_h) + 0.5) * 180 / grid_h
+    factors = 2 ** np.round(np.log2(1 / np.cos(np.deg2rad(lat)))).astype(int)
+    merge_ids = []
+    num_merged = 0
+    for factor in np.minimum(factors, grid_w):
+        while grid_w % factor != 0:
+            factor //= 2
+        merge_ids.append(num_merged + np.arange(grid_w) // factor)
+        num_merged += grid_w // factor
+    merge_ids = torch.from_numpy(np.concatenate(merge_ids))
+    return merge_ids, torch.bincount(merge_ids)
+
+
+def merge_tokens(x: torch.Tensor, merge_ids: torch.Tensor, merge_counts: torch.Tensor):
+    """Averages the tokens of each group.
+
+    x: B, L, D
+    return: B, L', D
+    """
+    merged = x.new_zeros(x.shape[0], merge_counts.shape[0], x.shape[-1]).index_add_(1, merge_ids, x)
+    return merged / merge_counts.to(x.dtype).unsqueeze(-1)
+
+
+def unmerge_tokens(x: torch.Tensor, merge_ids: torch.Tensor):
+    """Copies each merged token back to all tokens of its group.
+
+    x: B, L', D
+    return: B, L, D
+    """
+    return x[:, merge_ids]
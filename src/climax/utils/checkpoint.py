@@ -0,0 +1,57 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""Utilities to load pretrained checkpoints into models of different variables."""
+
+
+def map_pretrained_vars(model, checkpoint_model, pretrained_vars):
+    """Maps the per-variable weights of a pretrained checkpoint onto the variables of `model` by name.
+
+    The variable embeddings, the token embeddings and the rows of the last head layer of the variables of
+    `model.default_vars` are selected from the checkpoint, in the order of `model.default_vars`. Variables which
+    were not pretrained keep the weights of `model`.
+
+    Args:
+        model (ClimaX): model to load the checkpoint into
+        checkpoint_model (dict): state dict of the Lightning checkpoint, modified in place
+        pretrained_vars (list): `default_vars` of the pretrained model
+    """
+    pretrained_ids = {var: i for i, var in enumerate(pretrained_vars)}
+    state_dict = {"net." + k: v for k, v in model.state_dict().items()}
+
+    def select(key, dim, num_groups=1):
+        # rows of `key` along `dim` are grouped as (num_groups, V)
+        if key not in checkpoint_model:
+            return
+        expected_shape = list(state_dict[key].shape)
+        expected_shape[dim] = num_groups * len(pretrained_vars)
+        if list(checkpoint_model[key].shape) != expected_shape:
+            # left to the shape check of the caller
+            return
+        pretrained = checkpoint_model[key].unflatten(dim, (num_groups, len(pretrained_vars)))
+        rows = state_dict[key].unflatten(dim, (num_groups, len(model.default_vars))).clone()
+        for i, var in enumerate(model.default_vars):
+            if var in pretrained_ids:
+                rows.select(dim + 1, i).copy_(pretrained.select(dim + 1, pretrained_ids[var]))
+        checkpoint_model[key] = rows.flatten(dim, dim + 1)
+
+    select("net.var_embed", 1)
+    if model.parallel_patch_embed:
+        select("net.token_embeds.proj_weights", 0)
+        select("net.token_embeds.proj_biases", 0)
+    else:
+        token_embeds = {}
+        for i, var in enumerate(model.default_vars):
+            for name in ["proj.weight", "proj.bias"]:
+                key = f"net.token_embeds.{i}.{name}"
+                if var in pretrained_ids:
+                    token_embeds[key] = checkpoint_model.get(f"net.token_embeds.{pretrained_ids[var]}.{name}")
+                else:
+                    token_embeds[key] = state_dict[key]
+        for key in [k for k in checkpoint_model if k.startswith("net.token_embeds.")]:
+            del checkpoint_model[key]
+        checkpoint_model.update({k: v for k, v in token_embeds.items() if v is not None})
+    # output channels of the head are ordered as (p, p, V)
+    last = f"net.head.{len(model.head) - 1}"
+    select(f"{last}.weight", 0, model.patch_size**2)
+    select(f"{last}.bias", 0, model.patch_size**2)
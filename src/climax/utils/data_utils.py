@@ -88,36 +88,83 @@ BOUNDARIES = {
     }
 }
 
+# region bounds and grid --> region descriptor, see `get_region_info`
+_REGION_INFO_CACHE = {}
+
+
+def get_region_bounds(region):
+    """Latitude and longitude range of a region given by its name in `BOUNDARIES` or as a dict with
+    `lat_range` and `lon_range`."""
+    if isinstance(region, str):
+        region = BOUNDARIES[region]
+    return tuple(region['lat_range']), tuple(region['lon_range'])
+
+
+def get_region_name(region):
+    """Name of a region in `BOUNDARIES`, or a name derived from the bounds of a user-defined region."""
+    if isinstance(region, str):
+        return region
+    lat_range, lon_range = get_region_bounds(region)
+    return "lat_{}_{}_lon_{}_{}".format(*lat_range, *lon_range)
+
+
 def get_region_info(region, lat, lon, patch_size):
-    region = BOUNDARIES[region]
-    lat_range = region['lat_range']
-    lon_range = region['lon_range']
+    """Finds the patches of the grid that lie within a region.
+
+    Descriptors are cached per region bounds, grid and patch size. Each call returns a copy of the cached
+    descriptor, whose `patch_ids` is an immutable tuple shared by all copies.
+
+    Args:
+        region (str or dict): name of a region in `BOUNDARIES` or a user-defined bounding box given as a
+            dict with `lat_range` and `lon_range`
+        lat (np.ndarray): latitudes of the grid
+        lon (np.ndarray): longitudes of the grid
+        patch_size (int): patch size
+
+    Returns:
+        dict: ids of the patches within the region and the bounding box of these patches in grid cells
+    """
+    lat_range, lon_range = get_region_bounds(region)
+    lat, lon = np.asarray(lat), np.asarray(lon)
+    key = (lat_range, lon_range, lat.tobytes(), lon.tobytes(), patch_size)
+    if key in _REGION_INFO_CACHE:
+        return dict(_REGION_INFO_CACHE[key])
+
     lat = lat[::-1] # -90 to 90 from south (bottom) to north (top)
     h, w = len(lat), len(lon)
-    lat_matrix = np.expand_dims(lat, axis=1).repeat(w, axis=1)
-    lon_matrix = np.expand_dims(lon, axis=0).repeat(h, axis=0)
-    valid_cells = (lat_matrix >= lat_range[0]) & (lat_matrix <= lat_range[1]) & (lon_matrix >= lon_range[0]) & (lon_matrix <= lon_range[1])
-    h_ids, w_ids = np.nonzero(valid_cells)
-    h_from, h_to = h_ids[0], h_ids[-1]
-    w_from, w_to = w_ids[0], w_ids[-1]
-    patch_idx = -1
+    h_ids = np.nonzero((lat >= lat_range[0]) & (lat <= lat_range[1]))[0]
+    w_ids = np.nonzero((lon >= lon_range[0]) & (lon <= lon_range[1]))[0]
+    if len(h_ids) == 0 or len(w_ids) == 0:
+        raise ValueError(f"Region {region} does not contain any grid cells.")
+
+    # a patch is valid if all its cells are within the bounding box of the region
+    valid_cells = np.zeros((h, w), dtype=bool)
+    valid_cells[h_ids[0]:h_ids[-1]+1, w_ids[0]:w_ids[-1]+1] = True
     p = patch_size
-    valid_patch_ids = []
-    min_h, max_h = 1e5, -1e5
-    min_w, max_w = 1e5, -1e5
-    for i in range(0, h, p):
-        for j in range(0, w, p):
-            patch_idx += 1
-            if (i >= h_from) & (i + p - 1 <= h_to) & (j >= w_from) & (j + p - 1 <= w_to):
-                valid_patch_ids.append(patch_idx)
-                min_h = min(min_h, i)
-                max_h = max(max_h, i + p - 1)
-                min_w = min(min_w, j)
-                max_w = max(max_w, j + p - 1)
-    return {
-        'patch_ids': valid_patch_ids,
-        'min_h': min_h,
-        'max_h': max_h,
-        'min_w': min_w,
-        'max_w': max_w
-    }
\ No newline at end of file
+    valid_patches = valid_cells.reshape(h // p, p, w // p, p).all(axis=(1, 3))
+    patch_h, patch_w = np.nonzero(valid_patches)
+    if len(patch_h) == 0:
+        raise ValueError(f"Region {region} does not contain any patches of size {patch_size}.")
+
+    region_info = {
+        'patch_size': p,
+        'patch_ids': tuple(np.flatnonzero(valid_patches).tolist()),
+        'min_h': int(patch_h.min()) * p,
+        'max_h': int(patch_h.max()) * p + p - 1,
+        'min_w': int(patch_w.min()) * p,
+        'max_w': int(patch_w.max()) * p + p - 1,
+    }
+    _REGION_INFO_CACHE[key] = region_info
+    return dict(region_info)
+
+
+def get_regions_info(regions, lat, lon, patch_size):
+    """`get_region_info` for a list of regions, the descriptors also contain the `name` of the region."""
+    return [dict(get_region_info(region, lat, lon, patch_size), name=get_region_name(region)) for region in regions]
+
+
+def crop_region(x, region_info):
+    """Crops `[..., H, W]` global fields to the bounding box of a region, see `get_region_info`."""
+    min_h, max_h = region_info['min_h'], region_info['max_h']
+    min_w, max_w = region_info['min_w'], region_info['max_w']
+    return x[..., min_h:max_h+1, min_w:max_w+1]
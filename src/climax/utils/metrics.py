@@ -3,7 +3,97 @@
 
 import numpy as np
 import torch
-from scipy import stats
+
+
+class MetricsContext:
+    """Latitude weights of a grid, shared by all metric functions.
+
+    Created once from the latitudes of the grid by the `set_lat_lon` of the Lightning modules and passed to
+    the metrics in place of `lat`. The normalized weights are kept on the device for each dtype, so that
+    metrics do not copy them from the host at every step. Slicing rows, e.g. `context[min_h : max_h + 1]`
+    for a region, returns a context of the region that is cached as well.
+
+    Args:
+        lat: H, latitudes of the grid
+        norm_lat: latitudes whose mean weight normalizes the weights, `lat` by default, see `shard`
+    """
+
+    def __init__(self, lat, norm_lat=None):
+        self.lat = np.asarray(lat)
+        self.norm_lat = self.lat if norm_lat is None else np.asarray(norm_lat)
+        # (dtype, device) --> normalized latitude weights
+        self._lat_weights = {}
+        # row slice --> context of the rows
+        self._crops = {}
+
+    def __len__(self):
+        return len(self.lat)
+
+    def __getitem__(self, rows: slice):
+        key = rows.indices(len(self.lat))
+        if key not in self._crops:
+            self._crops[key] = MetricsContext(self.lat[rows])
+        return self._crops[key]
+
+    def shard(self, rows: slice):
+        """Context of rows whose weights keep the normalization of the whole grid, so that the mean of a metric
+        over equally sized shards of rows is the metric of the grid, e.g. for sequence parallelism."""
+        key = ("shard",) + rows.indices(len(self.lat))
+        if key not in self._crops:
+            self._crops[key] = MetricsContext(self.lat[rows], norm_lat=self.norm_lat)
+        return self._crops[key]
+
+    def lat_weights(self, dtype, device):
+        """Returns the `[H]` latitude weights, normalized to a mean of 1 over `norm_lat`."""
+        key = (dtype, device)
+        if key not in self._lat_weights:
+            w_lat = np.cos(np.deg2rad(self.lat))
+            w_lat = w_lat / np.cos(np.deg2rad(self.norm_lat)).mean()
+            # the weights may be first requested during validation, they must remain usable in training steps
+            with torch.inference_mode(False):
+                self._lat_weights[key] = torch.from_numpy(w_lat).to(dtype=dtype, device=device)
+        return self._lat_weights[key]
+
+
+class PackedMetricsContext:
+    """Latitude weights of a batch of samples from different grids padded to `h` rows, see
+    `climax.regional_forecast.datamodule.pack_regions`.
+
+    Args:
+        contexts (list): `MetricsContext` of each sample
+        h (int): number of rows of the padded samples
+    """
+
+    def __init__(self, contexts, h):
+        self.contexts = contexts
+        self.h = h
+
+    def lat_weights(self, dtype, device):
+        """Returns the `[B, H]` latitude weights of the samples, zero for padded rows."""
+        w_lat = torch.zeros(len(self.contexts), self.h, dtype=dtype, device=device)
+        for i, context in enumerate(self.contexts):
+            w_lat[i, : len(context)] = context.lat_weights(dtype, device)
+        return w_lat
+
+
+def get_lat_weights(lat, dtype, device):
+    """Latitude weights broadcastable to `[B, H, W]`.
+
+    Args:
+        lat: `MetricsContext` or `PackedMetricsContext`, or latitudes, H or [B, H] with NaN for padded rows
+
+    Returns:
+        torch.Tensor: `[1, H, 1]` shape, or `[B, H, 1]` for per-sample latitudes.
+    """
+    if isinstance(lat, (MetricsContext, PackedMetricsContext)):
+        w_lat = lat.lat_weights(dtype, device)
+    else:
+        w_lat = np.cos(np.deg2rad(lat))
+        w_lat = np.nan_to_num(w_lat / np.nanmean(w_lat, axis=-1, keepdims=True))
+        w_lat = torch.from_numpy(w_lat).to(dtype=dtype, device=device)
+    if w_lat.dim() == 1:
+        w_lat = w_lat.unsqueeze(0)
+    return w_lat.unsqueeze(-1)
 
 
 def mse(pred, y, vars, lat=None, mask=None):
@@ -17,19 +107,14 @@ def mse(pred, y, vars, lat=None, mask=None):
 
     loss = (pred - y) ** 2
 
-    loss_dict = {}
-
-    with torch.no_grad():
-        for i, var in enumerate(vars):
-            if mask is not None:
-                loss_dict[var] = (loss[:, i] * mask).sum() / mask.sum()
-            else:
-                loss_dict[var] = loss[:, i].mean()
-
+    # all variables are reduced at once
     if mask is not None:
-        loss_dict["loss"] = (loss.mean(dim=1) * mask).sum() / mask.sum()
+        loss_per_var = (loss * mask.unsqueeze(1)).sum(dim=(0, 2, 3)) / mask.sum()  # V
     else:
-        loss_dict["loss"] = loss.mean(dim=1).mean()
+        loss_per_var = loss.mean(dim=(0, 2, 3))  # V
+
+    loss_dict = dict(zip(vars, loss_per_var.detach().unbind()))
+    loss_dict["loss"] = loss_per_var.mean()
 
     return loss_dict
 
@@ -43,28 +128,24 @@ def lat_weighted_mse(pred, y, vars, lat, mask=None):
         y: [B, V, H, W]
         pred: [B, V, H, W]
         vars: list of variable names
-        lat: H
+        lat: H, or [B, H] per-sample latitudes with NaN for padded rows
+        mask: [B, H, W] valid grid cells
     """
 
     error = (pred - y) ** 2  # [N, C, H, W]
 
     # lattitude weights
-    w_lat = np.cos(np.deg2rad(lat))
-    w_lat = w_lat / w_lat.mean()  # (H, )
-    w_lat = torch.from_numpy(w_lat).unsqueeze(0).unsqueeze(-1).to(dtype=error.dtype, device=error.device)  # (1, H, 1)
-
-    loss_dict = {}
-    with torch.no_grad():
-        for i, var in enumerate(vars):
-            if mask is not None:
-                loss_dict[var] = (error[:, i] * w_lat * mask).sum() / mask.sum()
-            else:
-                loss_dict[var] = (error[:, i] * w_lat).mean()
+    w_lat = get_lat_weights(lat, error.dtype, error.device)  # (1, H, 1) or (B, H, 1)
 
+    # all variables are reduced at once
+    error = error * w_lat.unsqueeze(1)
     if mask is not None:
-        loss_dict["loss"] = ((error * w_lat.unsqueeze(1)).mean(dim=1) * mask).sum() / mask.sum()
+        loss_per_var = (error * mask.unsqueeze(1)).sum(dim=(0, 2, 3)) / mask.sum()  # V
     else:
-        loss_dict["loss"] = (error * w_lat.unsqueeze(1)).mean(dim=1).mean()
+        loss_per_var = error.mean(dim=(0, 2, 3))  # V
+
+    loss_dict = dict(zip(vars, loss_per_var.detach().unbind()))
+    loss_dict["loss"] = loss_per_var.mean()
 
     return loss_dict
 
@@ -81,16 +162,13 @@ def lat_weighted_mse_val(pred, y, transform, vars, lat, clim, log_postfix):
     error = (pred - y) ** 2  # [B, V, H, W]
 
     # lattitude weights
-    w_lat = np.cos(np.deg2rad(lat))
-    w_lat = w_lat / w_lat.mean()  # (H, )
-    w_lat = torch.from_numpy(w_lat).unsqueeze(0).unsqueeze(-1).to(dtype=error.dtype, device=error.device)  # (1, H, 1)
+    w_lat = get_lat_weights(lat, error.dtype, error.device)  # (1, H, 1)
 
-    loss_dict = {}
     with torch.no_grad():
-        for i, var in enumerate(vars):
-            loss_dict[f"w_mse_{var}_{log_postfix}"] = (error[:, i] * w_lat).mean()
+        w_mse = (error * w_lat.unsqueeze(1)).mean(dim=(0, 2, 3))  # V
+    loss_dict = dict(zip([f"w_mse_{var}_{log_postfix}" for var in vars], w_mse.unbind()))
 
-    loss_dict["w_mse"] = np.mean([loss_dict[k].cpu() for k in loss_dict.keys()])
+    loss_dict["w_mse"] = w_mse.mean()
 
     return loss_dict
 
@@ -111,18 +189,13 @@ def lat_weighted_rmse(pred, y, transform, vars, lat, clim, log_postfix):
     error = (pred - y) ** 2  # [B, V, H, W]
 
     # lattitude weights
-    w_lat = np.cos(np.deg2rad(lat))
-    w_lat = w_lat / w_lat.mean()  # (H, )
-    w_lat = torch.from_numpy(w_lat).unsqueeze(0).unsqueeze(-1).to(dtype=error.dtype, device=error.device)
+    w_lat = get_lat_weights(lat, error.dtype, error.device)  # (1, H, 1)
 
-    loss_dict = {}
     with torch.no_grad():
-        for i, var in enumerate(vars):
-            loss_dict[f"w_rmse_{var}_{log_postfix}"] = torch.mean(
-                torch.sqrt(torch.mean(error[:, i] * w_lat, dim=(-2, -1)))
-            )
+        w_rmse = torch.sqrt(torch.mean(error * w_lat.unsqueeze(1), dim=(-2, -1))).mean(dim=0)  # V
+    loss_dict = dict(zip([f"w_rmse_{var}_{log_postfix}" for var in vars], w_rmse.unbind()))
 
-    loss_dict["w_rmse"] = np.mean([loss_dict[k].cpu() for k in loss_dict.keys()])
+    loss_dict["w_rmse"] = w_rmse.mean()
 
     return loss_dict
 
@@ -139,25 +212,23 @@ def lat_weighted_acc(pred, y, transform, vars, lat, clim, log_postfix):
     y = transform(y)
 
     # lattitude weights
-    w_lat = np.cos(np.deg2rad(lat))
-    w_lat = w_lat / w_lat.mean()  # (H, )
-    w_lat = torch.from_numpy(w_lat).unsqueeze(0).unsqueeze(-1).to(dtype=pred.dtype, device=pred.device)  # [1, H, 1]
+    w_lat = get_lat_weights(lat, pred.dtype, pred.device)  # [1, H, 1]
 
     # clim = torch.mean(y, dim=(0, 1), keepdim=True)
     clim = clim.to(device=y.device).unsqueeze(0)
     pred = pred - clim
     y = y - clim
-    loss_dict = {}
 
     with torch.no_grad():
-        for i, var in enumerate(vars):
-            pred_prime = pred[:, i] - torch.mean(pred[:, i])
-            y_prime = y[:, i] - torch.mean(y[:, i])
-            loss_dict[f"acc_{var}_{log_postfix}"] = torch.sum(w_lat * pred_prime * y_prime) / torch.sqrt(
-                torch.sum(w_lat * pred_prime**2) * torch.sum(w_lat * y_prime**2)
-            )
+        w_lat = w_lat.unsqueeze(1)  # [1, 1, H, 1]
+        pred_prime = pred - torch.mean(pred, dim=(0, 2, 3), keepdim=True)
+        y_prime = y - torch.mean(y, dim=(0, 2, 3), keepdim=True)
+        acc = torch.sum(w_lat * pred_prime * y_prime, dim=(0, 2, 3)) / torch.sqrt(
+            torch.sum(w_lat * pred_prime**2, dim=(0, 2, 3)) * torch.sum(w_lat * y_prime**2, dim=(0, 2, 3))
+        )  # V
+    loss_dict = dict(zip([f"acc_{var}_{log_postfix}" for var in vars], acc.unbind()))
 
-    loss_dict["acc"] = np.mean([loss_dict[k].cpu() for k in loss_dict.keys()])
+    loss_dict["acc"] = acc.mean()
 
     return loss_dict
 
@@ -175,19 +246,14 @@ def lat_weighted_nrmses(pred, y, transform, vars, lat, clim, log_postfix):
     y_normalization = clim
 
     # lattitude weights
-    w_lat = np.cos(np.deg2rad(lat))
-    w_lat = w_lat / w_lat.mean()  # (H, )
-    w_lat = torch.from_numpy(w_lat).unsqueeze(-1).to(dtype=y.dtype, device=y.device)  # (H, 1)
+    w_lat = get_lat_weights(lat, y.dtype, y.device)[0]  # (H, 1)
 
-    loss_dict = {}
     with torch.no_grad():
-        for i, var in enumerate(vars):
-            pred_ = pred[:, i]  # B, H, W
-            y_ = y[:, i]  # B, H, W
-            error = (torch.mean(pred_, dim=0) - torch.mean(y_, dim=0)) ** 2  # H, W
-            error = torch.mean(error * w_lat)
-            loss_dict[f"w_nrmses_{var}"] = torch.sqrt(error) / y_normalization
-    
+        error = (torch.mean(pred, dim=0) - torch.mean(y, dim=0)) ** 2  # V, H, W
+        error = torch.mean(error * w_lat, dim=(-2, -1))  # V
+        nrmses = torch.sqrt(error) / y_normalization
+    loss_dict = dict(zip([f"w_nrmses_{var}" for var in vars], nrmses.unbind()))
+
     return loss_dict
 
 
@@ -204,19 +270,15 @@ def lat_weighted_nrmseg(pred, y, transform, vars, lat, clim, log_postfix):
     y_normalization = clim
 
     # lattitude weights
-    w_lat = np.cos(np.deg2rad(lat))
-    w_lat = w_lat / w_lat.mean()  # (H, )
-    w_lat = torch.from_numpy(w_lat).unsqueeze(0).unsqueeze(-1).to(dtype=y.dtype, device=y.device)  # (1, H, 1)
+    w_lat = get_lat_weights(lat, y.dtype, y.device)  # (1, H, 1)
 
-    loss_dict = {}
     with torch.no_grad():
-        for i, var in enumerate(vars):
-            pred_ = pred[:, i]  # B, H, W
-            pred_ = torch.mean(pred_ * w_lat, dim=(-2, -1))  # B
-            y_ = y[:, i]  # B, H, W
-            y_ = torch.mean(y_ * w_lat, dim=(-2, -1))  # B
-            error = torch.mean((pred_ - y_) ** 2)
-            loss_dict[f"w_nrmseg_{var}"] = torch.sqrt(error) / y_normalization
+        w_lat = w_lat.unsqueeze(1)  # (1, 1, H, 1)
+        pred_ = torch.mean(pred * w_lat, dim=(-2, -1))  # B, V
+        y_ = torch.mean(y * w_lat, dim=(-2, -1))  # B, V
+        error = torch.mean((pred_ - y_) ** 2, dim=0)  # V
+        nrmseg = torch.sqrt(error) / y_normalization
+    loss_dict = dict(zip([f"w_nrmseg_{var}" for var in vars], nrmseg.unbind()))
 
     return loss_dict
 
@@ -263,15 +325,26 @@ def pearson(pred, y, transform, vars, lat, log_steps, log_days, clim):
     pred = transform(pred)
     y = transform(y)
 
-    loss_dict = {}
     with torch.no_grad():
-        for i, var in enumerate(vars):
-            for day, step in zip(log_days, log_steps):
-                pred_, y_ = pred[:, step - 1, i].flatten(), y[:, step - 1, i].flatten()
-                pred_, y_ = remove_nans(pred_, y_)
-                loss_dict[f"pearsonr_{var}_day_{day}"] = stats.pearsonr(pred_.cpu().numpy(), y_.cpu().numpy())[0]
+        steps = [step - 1 for step in log_steps]
+        pred, y = pred[:, steps], y[:, steps]  # N, S, V, H, W
+        # NaN and inf values of either are excluded
+        valid = torch.isfinite(pred) & torch.isfinite(y)
+        num_valid = valid.sum(dim=(0, 3, 4), keepdim=True)
+        pred = torch.where(valid, pred, 0)
+        y = torch.where(valid, y, 0)
+        pred_prime = torch.where(valid, pred - pred.sum(dim=(0, 3, 4), keepdim=True) / num_valid, 0)
+        y_prime = torch.where(valid, y - y.sum(dim=(0, 3, 4), keepdim=True) / num_valid, 0)
+        pearsonr = torch.sum(pred_prime * y_prime, dim=(0, 3, 4)) / torch.sqrt(
+            torch.sum(pred_prime**2, dim=(0, 3, 4)) * torch.sum(y_prime**2, dim=(0, 3, 4))
+        )  # S, V
+
+    loss_dict = {}
+    for i, var in enumerate(vars):
+        for j, day in enumerate(log_days):
+            loss_dict[f"pearsonr_{var}_day_{day}"] = pearsonr[j, i]
 
-    loss_dict["pearsonr"] = np.mean([loss_dict[k] for k in loss_dict.keys()])
+    loss_dict["pearsonr"] = pearsonr.mean()
 
     return loss_dict
 
@@ -288,22 +361,267 @@ def lat_weighted_mean_bias(pred, y, transform, vars, lat, log_steps, log_days, c
     y = transform(y)
 
     # lattitude weights
-    w_lat = np.cos(np.deg2rad(lat))
-    w_lat = w_lat / w_lat.mean()  # (H, )
-    w_lat = torch.from_numpy(w_lat).unsqueeze(0).unsqueeze(-1).to(dtype=pred.dtype, device=pred.device)  # [1, H, 1]
+    w_lat = get_lat_weights(lat, pred.dtype, pred.device)  # [1, H, 1]
+
+    with torch.no_grad():
+        steps = [step - 1 for step in log_steps]
+        pred, y = pred[:, steps], y[:, steps]  # N, S, V, H, W
+        # NaN and inf values of either are excluded
+        valid = torch.isfinite(pred) & torch.isfinite(y)
+        pred_mean = torch.where(valid, pred, 0).sum(dim=(0, 3, 4)) / valid.sum(dim=(0, 3, 4))  # S, V
+        y_mean = torch.where(valid, y, 0).sum(dim=(0, 3, 4)) / valid.sum(dim=(0, 3, 4))  # S, V
+        mean_bias = pred_mean - y_mean
+
+        # pred_mean = torch.mean(w_lat * pred, dim=(0, 3, 4))
+        # y_mean = torch.mean(w_lat * y, dim=(0, 3, 4))
+        # mean_bias = y_mean - pred_mean
 
     loss_dict = {}
+    for i, var in enumerate(vars):
+        for j, day in enumerate(log_days):
+            loss_dict[f"mean_bias_{var}_day_{day}"] = mean_bias[j, i]
+
+    loss_dict["mean_bias"] = mean_bias.mean()
+
+    return loss_dict
+
+
+class EnsembleStats:
+    """Streaming statistics of ensemble members, updated with chunks of members which are not kept.
+
+    The mean and the spread are combined across chunks exactly (Chan et al.). CRPS is the fair ensemble CRPS,
+    E|X - y| - 1/2 E|X - X'|, where E|X - X'| is estimated from the pairs of distinct members within each chunk:
+    it is exact when all members are in a single chunk and an unbiased estimate from fewer pairs otherwise. Pairs
+    across chunks are not kept, so CRPS is undefined for multiple members updated one at a time.
+
+    Statistics are computed per grid point, in float32, for members of shape `[B, N, V, H, W]`.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+        self.abs_error = None
+        self.pair_diff = None
+        self.num_pairs = 0
+
+    def update(self, members: torch.Tensor, y: torch.Tensor = None):
+        """
+        members: B, N, V, H, W
+        y: B, V, H, W, optional, required for CRPS
+        """
+        members = members.float()
+        n = members.shape[1]
+        chunk_mean = members.mean(dim=1)
+        chunk_m2 = ((members - chunk_mean.unsqueeze(1)) ** 2).sum(dim=1)
+        if self.count == 0:
+            self.mean, self.m2 = chunk_mean, chunk_m2
+        else:
+            delta = chunk_mean - self.mean
+            total = self.count + n
+            self.mean = self.mean + delta * (n / total)
+            self.m2 = self.m2 + chunk_m2 + delta**2 * (self.count * n / total)
+        self.count += n
+
+        if y is not None:
+            abs_error = (members - y.float().unsqueeze(1)).abs().sum(dim=1)
+            self.abs_error = abs_error if self.abs_error is None else self.abs_error + abs_error
+        if n > 1:
+            # sum of |x_i - x_j| over the pairs i < j of sorted members
+            coeffs = 2 * torch.arange(n, device=members.device, dtype=members.dtype) - (n - 1)
+            pair_diff = (members.sort(dim=1).values * coeffs.view(1, n, 1, 1, 1)).sum(dim=1)
+            self.pair_diff = pair_diff if self.pair_diff is None else self.pair_diff + pair_diff
+            self.num_pairs += n * (n - 1) // 2
+
+    @property
+    def spread(self):
+        """Standard deviation of the members, `[B, V, H, W]` shape."""
+        if self.count < 2:
+            return torch.zeros_like(self.mean)
+        return torch.sqrt(self.m2 / (self.count - 1))
+
+    @property
+    def crps(self):
+        """Fair CRPS, `[B, V, H, W]` shape."""
+        if self.abs_error is None:
+            raise ValueError("CRPS requires the targets of the members.")
+        if self.count > 1 and self.num_pairs == 0:
+            raise ValueError("CRPS of multiple members requires chunks of at least two members.")
+        crps = self.abs_error / self.count
+        if self.num_pairs > 0:
+            crps = crps - 0.5 * self.pair_diff / self.num_pairs
+        return crps
+
+
+def lat_weighted_crps(pred, y, transform, vars, lat, clim, log_postfix):
+    """Latitude weighted fair CRPS of an ensemble
+
+    Args:
+        y: [B, V, H, W]
+        pred: [B, N, V, H, W] ensemble members
+        vars: list of variable names
+        lat: H
+    """
+
+    stats = EnsembleStats()
+    stats.update(transform(pred), transform(y))
+    crps = stats.crps  # [B, V, H, W]
+
+    # lattitude weights
+    w_lat = get_lat_weights(lat, crps.dtype, crps.device)  # (1, H, 1)
+
     with torch.no_grad():
-        for i, var in enumerate(vars):
-            for day, step in zip(log_days, log_steps):
-                pred_, y_ = pred[:, step - 1, i].flatten(), y[:, step - 1, i].flatten()
-                pred_, y_ = remove_nans(pred_, y_)
-                loss_dict[f"mean_bias_{var}_day_{day}"] = pred_.mean() - y_.mean()
+        w_crps = torch.mean(crps * w_lat.unsqueeze(1), dim=(0, -2, -1))  # V
+    loss_dict = dict(zip([f"w_crps_{var}_{log_postfix}" for var in vars], w_crps.unbind()))
+
+    loss_dict["w_crps"] = w_crps.mean()
+
+    return loss_dict
+
 
-                # pred_mean = torch.mean(w_lat * pred[:, step - 1, i])
-                # y_mean = torch.mean(w_lat * y[:, step - 1, i])
-                # loss_dict[f"mean_bias_{var}_day_{day}"] = y_mean - pred_mean
+def lat_weighted_spread_skill(pred, y, transform, vars, lat, clim, log_postfix):
+    """Latitude weighted spread, skill (RMSE of the ensemble mean) and spread-skill ratio of an ensemble
 
-    loss_dict["mean_bias"] = np.mean([loss_dict[k].cpu() for k in loss_dict.keys()])
+    The spread is corrected by sqrt((N + 1) / N) for the finite ensemble size (Fortin et al., 2014), so that the
+    ratio of a calibrated ensemble is 1.
+
+    Args:
+        y: [B, V, H, W]
+        pred: [B, N, V, H, W] ensemble members
+        vars: list of variable names
+        lat: H
+    """
+
+    stats = EnsembleStats()
+    stats.update(transform(pred))
+    n = pred.shape[1]
+    y = transform(y).float()
+
+    # lattitude weights
+    w_lat = get_lat_weights(lat, stats.mean.dtype, stats.mean.device).unsqueeze(1)  # (1, 1, H, 1)
+
+    with torch.no_grad():
+        w_spread = torch.sqrt(torch.mean(stats.spread**2 * w_lat, dim=(-2, -1)) * (n + 1) / n).mean(dim=0)  # V
+        w_skill = torch.sqrt(torch.mean((stats.mean - y) ** 2 * w_lat, dim=(-2, -1))).mean(dim=0)  # V
+        w_ssr = w_spread / w_skill
+    loss_dict = {}
+    for name, values in [("w_spread", w_spread), ("w_skill", w_skill), ("w_ssr", w_ssr)]:
+        loss_dict.update(zip([f"{name}_{var}_{log_postfix}" for var in vars], values.unbind()))
+        loss_dict[name] = values.mean()
 
     return loss_dict
+
+
+class ForecastMetricsAccumulator:
+    """Exact epoch-level latitude weighted MSE, RMSE and ACC, accumulated over batches.
+
+    Averaging per-batch scores over an epoch is not exact: ACC uses the anomaly means of each batch and
+    the mean of unequal batches is biased. Instead, sufficient statistics are summed in float64 for each
+    lead time and variable, and the scores are computed from them once, after a single all-reduce across
+    distributed ranks. RMSE is the mean over samples of the RMSE of each sample, as in `lat_weighted_rmse`,
+    and ACC is the correlation of the anomalies over all samples, as in `lat_weighted_acc` for one batch.
+
+    Ranks without any batch, e.g. with an empty shard of an iterable dataset, take part in the all-reduce with
+    zero statistics, which requires the variables to be known beforehand. Scores without any sample are NaN.
+
+    Args:
+        num_lead_times (int): number of lead times whose scores are accumulated separately
+        vars (list, optional): variable names, taken from the first update by default
+    """
+
+    # sufficient statistics of each lead time and variable, with a = pred - clim and b = y - clim
+    STATS = ["n", "mse", "rmse", "count", "a", "b", "w", "wa", "wb", "wab", "waa", "wbb"]
+
+    def __init__(self, num_lead_times=1, vars=None):
+        self.num_lead_times = num_lead_times
+        self.vars = list(vars) if vars is not None else None
+        self.stats = None
+
+    def reset(self):
+        self.stats = None
+
+    def update(self, pred, y, transform, vars, lat, clim, lead_time_index=0):
+        """
+        y: [B, V, H, W]
+        pred: [B, V, H, W]
+        vars: list of variable names
+        lat: H, or `MetricsContext`
+        clim: [V, H, W]
+        lead_time_index: index of the lead time of the predictions
+        """
+        if self.stats is None:
+            self.vars = list(vars)
+            self.stats = torch.zeros(
+                self.num_lead_times, len(vars), len(self.STATS), dtype=torch.float64, device=pred.device
+            )
+
+        with torch.no_grad():
+            pred = transform(pred.to(torch.float64))
+            y = transform(y.to(torch.float64))
+            w_lat = get_lat_weights(lat, torch.float64, pred.device).unsqueeze(1)  # [1, 1, H, 1]
+
+            mse = torch.mean(w_lat * (pred - y) ** 2, dim=(-2, -1))  # B, V
+            clim = clim.to(device=pred.device, dtype=torch.float64).unsqueeze(0)
+            a, b = pred - clim, y - clim
+            w = w_lat.expand_as(a)
+            dims = (0, 2, 3)
+            stats = torch.stack(
+                [
+                    torch.full_like(mse[0], mse.shape[0]),
+                    mse.sum(dim=0),
+                    mse.sqrt().sum(dim=0),
+                    torch.full_like(mse[0], a[:, 0].numel()),
+                    a.sum(dim=dims),
+                    b.sum(dim=dims),
+                    w.sum(dim=dims),
+                    (w * a).sum(dim=dims),
+                    (w * b).sum(dim=dims),
+                    (w * a * b).sum(dim=dims),
+                    (w * a * a).sum(dim=dims),
+                    (w * b * b).sum(dim=dims),
+                ],
+                dim=-1,
+            )  # V, K
+            self.stats[lead_time_index] += stats
+
+    def compute(self, log_postfixes, device=None):
+        """Scores of the accumulated predictions.
+
+        Args:
+            log_postfixes (list): postfix of the keys of each lead time, e.g. `["72_hours"]`
+            device (torch.device, optional): device of the zero statistics of a rank without any update, which
+                must be supported by the distributed backend
+
+        Returns:
+            dict: `w_mse_{var}_{postfix}`, `w_rmse_{var}_{postfix}` and `acc_{var}_{postfix}` for each variable
+            and lead time, and `w_mse`, `w_rmse` and `acc` averaged over all of them. With several lead times,
+            `w_mse_{postfix}`, `w_rmse_{postfix}` and `acc_{postfix}` are averaged over the variables.
+        """
+        if self.stats is not None:
+            stats = self.stats.clone()
+        elif self.vars is not None:
+            stats = torch.zeros(
+                self.num_lead_times, len(self.vars), len(self.STATS), dtype=torch.float64, device=device
+            )
+        else:
+            raise ValueError("Scores without any update require the variables of the accumulator.")
+        if torch.distributed.is_available() and torch.distributed.is_initialized():
+            torch.distributed.all_reduce(stats)
+        n, mse, rmse, count, a, b, w, wa, wb, wab, waa, wbb = stats.unbind(-1)  # T, V
+
+        mean_a, mean_b = a / count, b / count
+        cov = wab - mean_b * wa - mean_a * wb + mean_a * mean_b * w
+        var_a = waa - 2 * mean_a * wa + mean_a**2 * w
+        var_b = wbb - 2 * mean_b * wb + mean_b**2 * w
+        scores = {"w_mse": mse / n, "w_rmse": rmse / n, "acc": cov / torch.sqrt(var_a * var_b)}
+
+        loss_dict = {}
+        for name, score in scores.items():
+            score = score.float()
+            for t, postfix in enumerate(log_postfixes):
+                for i, var in enumerate(self.vars):
+                    loss_dict[f"{name}_{var}_{postfix}"] = score[t, i]
+                if len(log_postfixes) > 1:
+                    loss_dict[f"{name}_{postfix}"] = score[t].mean()
+            loss_dict[name] = score.mean()
+        return loss_dict
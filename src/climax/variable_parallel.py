@@ -0,0 +1,61 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""Variable parallelism: the input variables of a sample are sharded across the ranks of a process group.
+
+Each rank tokenizes a contiguous subset of the variables, so that the `[B, V, L, D]` embeddings, the largest
+activations of the network, are divided by the size `P` of the group. The variable aggregation attention is
+computed on the shards: each rank exponentiates its attention scores shifted by the maximum score of all ranks,
+and the sums of the weights and of the weighted values are all-reduced before normalizing (log-sum-exp trick).
+Only `[B, L, D]` tensors are communicated. The encoder and the decoder are replicated on all ranks.
+
+See `ClimaX.forward_variable_parallel`.
+"""
+
+import torch
+import torch.distributed as dist
+import torch.distributed.nn.functional as dist_fn
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+def get_variable_shard(num_vars, group=None):
+    """Variables of the rank in `group`, a slice of `range(num_vars)`. Shards differ by at most one variable."""
+    rank, world_size = dist.get_rank(group), dist.get_world_size(group)
+    if num_vars < world_size:
+        raise ValueError(f"{num_vars} variables cannot be sharded across {world_size} ranks.")
+    return slice(rank * num_vars // world_size, (rank + 1) * num_vars // world_size)
+
+
+def variable_parallel_attention(attn: nn.MultiheadAttention, query: torch.Tensor, x: torch.Tensor, group):
+    """Attention of a single query over the variables of all ranks, given the variables of the rank.
+
+    Uses the weights of `attn` as is, so that it is equivalent to `attn(query, x, x)` on all variables.
+
+    Args:
+        attn (torch.nn.MultiheadAttention): aggregation attention, with packed input projections
+        query: `[1, 1, D]` shape. Query shared by all tokens
+        x: `[N, V / P, D]` shape. Keys and values of the variables of the rank
+        group (torch.distributed.ProcessGroup): ranks sharing the variables
+
+    Returns:
+        torch.Tensor: `[N, D]` shape, identical on all ranks.
+    """
+    n, v, d = x.shape
+    h = attn.num_heads
+    w_q, w_k, w_v = attn.in_proj_weight.chunk(3)
+    b_q, b_k, b_v = attn.in_proj_bias.chunk(3)
+    q = F.linear(query.reshape(1, d), w_q, b_q).reshape(h, d // h) * (d // h) ** -0.5  # H, Dh
+    k = F.linear(x, w_k, b_k).reshape(n, v, h, d // h)
+    values = F.linear(x, w_v, b_v).reshape(n, v, h, d // h)
+    scores = torch.einsum("hc,nvhc->nhv", q, k)  # N, H, V / P
+
+    # the softmax is invariant to the shift, which therefore needs no gradient
+    max_score = scores.detach().amax(dim=-1, keepdim=True)
+    dist.all_reduce(max_score, op=dist.ReduceOp.MAX, group=group)
+    weights = torch.exp(scores - max_score)
+    denom = dist_fn.all_reduce(weights.sum(dim=-1), group=group)  # N, H
+    weights = F.dropout(weights, attn.dropout, attn.training)
+    out = dist_fn.all_reduce(torch.einsum("nhv,nvhc->nhc", weights, values), group=group)  # N, H, Dh
+    out = out / denom.unsqueeze(-1)
+    return attn.out_proj(out.reshape(n, d))
@@ -0,0 +1,58 @@
+import copy
+
+import torch
+
+from climax.arch import ClimaX
+
+
+def test_encoder_single_graph():
+    vars = tuple(["a", "b", "c"])
+    model = ClimaX(vars, img_size=[32, 64], patch_size=4, embed_dim=64, depth=2, num_heads=4, parallel_patch_embed=True)
+    x = torch.rand(2, len(vars), 32, 64)
+    lead_times = torch.rand(2)
+    var_ids = model.get_var_ids(vars, x.device)
+
+    explanation = torch._dynamo.explain(model.forward_encoder)(x, lead_times, var_ids)
+    assert explanation.graph_count == 1
+    assert explanation.graph_break_count == 0
+
+    model.eval()
+    with torch.no_grad():
+        _, preds = model.forward(x, None, lead_times, vars, ["c"], metric=None, lat=None)
+        model.compile_encoder(backend="eager")
+        _, compiled_preds = model.forward(x, None, lead_times, vars, ["c"], metric=None, lat=None)
+    assert torch.allclose(preds, compiled_preds, atol=1e-5)
+
+
+def test_compiled_static_vars():
+    vars = tuple(["a", "b", "c"])
+    model = ClimaX(
+        vars, img_size=[32, 64], patch_size=4, embed_dim=64, depth=2, num_heads=4, parallel_patch_embed=True
+    ).eval()
+    model.static_vars = ("b",)
+    x = torch.rand(2, len(vars), 32, 64)
+    lead_times = torch.rand(2)
+
+    with torch.no_grad():
+        _, preds = model.forward(x, None, lead_times, vars, ["c"], metric=None, lat=None)
+        model.clear_caches()
+        model.compile_encoder(backend="eager")
+        _, compiled_preds = model.forward(x, None, lead_times, vars, ["c"], metric=None, lat=None)
+        # static variables are embedded outside of the compiled region and cached
+        assert len(model._static_embeds_cache) == 1
+        assert torch.allclose(preds, compiled_preds, atol=1e-5)
+
+        # the compiled encoder is not bound to the instance, so that copies run their own weights
+        copied = copy.deepcopy(model)
+        copied.pos_embed.add_(torch.randn_like(copied.pos_embed))
+        _, copied_preds = copied.forward(x, None, lead_times, vars, ["c"], metric=None, lat=None)
+        assert copied.encoder_compiled
+        copied._compiled_forward_encoder = None
+        _, ref = copied.forward(x, None, lead_times, vars, ["c"], metric=None, lat=None)
+    assert torch.allclose(copied_preds, ref, atol=1e-5)
+    assert not torch.allclose(copied_preds, compiled_preds, atol=1e-3)
+
+
+if __name__ == "__main__":
+    test_encoder_single_graph()
+    test_compiled_static_vars()
@@ -0,0 +1,23 @@
+import torch
+
+from climax.arch import ClimaX
+
+
+def test_decode():
+    vars = tuple(["a", "b", "c", "d"])
+    model = ClimaX(vars, img_size=[32, 64], patch_size=4, embed_dim=128, depth=1)
+    x = torch.rand(2, model.num_patches, 128)
+
+    full_preds = model.unpatchify(model.head(x))
+    assert full_preds.shape == (2, len(vars), 32, 64)
+
+    test_out_vars = [["a"], ["d", "b"], ["a", "b", "c", "d"]]
+    for out_vars in test_out_vars:
+        preds = model.decode(x, out_vars)
+        out_var_ids = model.get_var_ids(tuple(out_vars), x.device)
+        assert preds.shape == (2, len(out_vars), 32, 64)
+        assert torch.allclose(preds, full_preds[:, out_var_ids], atol=1e-6)
+
+
+if __name__ == "__main__":
+    test_decode()
@@ -0,0 +1,90 @@
+import itertools
+
+import numpy as np
+import pytest
+import torch
+
+from climax.arch import ClimaX
+from climax.utils.metrics import EnsembleStats, lat_weighted_crps, lat_weighted_spread_skill
+
+
+def test_ensemble_stats():
+    members = torch.randn(2, 6, 3, 4, 8)
+    y = torch.randn(2, 3, 4, 8)
+
+    stats = EnsembleStats()
+    stats.update(members, y)
+    pairs = torch.stack([(members[:, i] - members[:, j]).abs() for i, j in itertools.combinations(range(6), 2)])
+    crps = (members - y.unsqueeze(1)).abs().mean(dim=1) - 0.5 * pairs.mean(dim=0)
+    assert torch.allclose(stats.crps, crps, atol=1e-5)
+
+    # chunks of members give the same mean and spread
+    chunked = EnsembleStats()
+    for chunk in members.split(2, dim=1):
+        chunked.update(chunk, y)
+    assert torch.allclose(chunked.mean, members.mean(dim=1), atol=1e-6)
+    assert torch.allclose(chunked.spread, members.std(dim=1), atol=1e-5)
+
+    # members one at a time give the mean and spread, but no pairs for CRPS
+    single = EnsembleStats()
+    for chunk in members.split(1, dim=1):
+        single.update(chunk, y)
+    assert torch.allclose(single.spread, members.std(dim=1), atol=1e-5)
+    with pytest.raises(ValueError):
+        single.crps
+
+    lat = np.linspace(-67.5, 67.5, 4)
+    scores = lat_weighted_crps(members, y, lambda t: t, ["a", "b", "c"], lat, None, "")
+    assert torch.allclose(scores["w_crps"], crps.mean(), rtol=0.1)
+    scores = lat_weighted_spread_skill(members, y, lambda t: t, ["a", "b", "c"], lat, None, "")
+    assert torch.allclose(scores["w_ssr"], scores["w_spread"] / scores["w_skill"], rtol=0.1)
+
+
+def test_predict_ensemble():
+    vars = ("a", "b", "c")
+    model = ClimaX(vars, img_size=[8, 16], patch_size=4, embed_dim=32, depth=2, num_heads=2, drop_rate=0.1).eval()
+    x = torch.rand(2, len(vars), 8, 16)
+    y = torch.rand(2, 2, 8, 16)
+    lead_times = torch.rand(2)
+
+    with torch.no_grad():
+        _, ref = model(x, None, lead_times, vars, ["b", "c"], None, None)
+        # without perturbations all members are the deterministic forecast
+        stats = model.predict_ensemble(x, lead_times, vars, ["b", "c"], 4, y=y)
+        assert torch.allclose(stats.mean, ref, atol=1e-5)
+        assert torch.allclose(stats.spread, torch.zeros_like(ref), atol=1e-5)
+        assert torch.allclose(stats.crps, (ref - y).abs(), atol=1e-5)
+
+        stats = model.predict_ensemble(x, lead_times, vars, ["b", "c"], 5, perturbation_std=0.1, member_batch_size=2)
+        assert stats.count == 5 and (stats.spread > 0).all()
+        stats = model.predict_ensemble(x, lead_times, vars, ["b", "c"], 4, mc_dropout=True)
+        assert (stats.spread > 0).any()
+        with pytest.raises(ValueError):
+            model.predict_ensemble(x, lead_times, vars, ["b", "c"], 4, mc_dropout=True, y=y, member_batch_size=1)
+        stats = model.predict_ensemble(x, lead_times, vars, ["b", "c"], 4, mc_dropout=True, member_batch_size=1)
+        assert (stats.spread > 0).any()
+    # dropout is disabled again afterwards
+    assert not any(m.training for m in model.modules())
+
+
+def test_predict_ensemble_static_vars():
+    vars = ("a", "b", "c")
+    model = ClimaX(vars, img_size=[8, 16], patch_size=4, embed_dim=32, depth=2, num_heads=2, static_vars=["a"])
+    model.eval()
+    x = torch.rand(2, len(vars), 8, 16)
+    lead_times = torch.rand(2)
+
+    with torch.no_grad():
+        stats = model.predict_ensemble(x, lead_times, vars, ["b", "c"], 4, perturbation_std=1.0)
+        assert (stats.spread > 0).all()
+        # static variables are not perturbed, so the embeddings they cached are those of the inputs
+        _, preds = model(x, None, lead_times, vars, ["b", "c"], None, None)
+        model.clear_caches()
+        _, ref = model(x, None, lead_times, vars, ["b", "c"], None, None)
+    assert torch.equal(preds, ref)
+
+
+if __name__ == "__main__":
+    test_ensemble_stats()
+    test_predict_ensemble()
+    test_predict_ensemble_static_vars()
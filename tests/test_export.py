@@ -0,0 +1,89 @@
+import importlib.util
+
+import torch
+import yaml
+from click.testing import CliRunner
+
+from climax.arch import ClimaX
+from climax.export import FrozenClimaX, export_onnx, export_torchscript, load_net, main, validate_export
+from climax.global_forecast.module import GlobalForecastModule
+
+
+def test_export_weights(tmp_path):
+    vars = ["a", "b", "c"]
+    net_args = dict(default_vars=vars, img_size=[8, 16], patch_size=4, embed_dim=32, depth=1, num_heads=2)
+    net = ClimaX(**net_args).eval()
+    module = GlobalForecastModule(net)
+    checkpoint = str(tmp_path / "model.ckpt")
+    optimizer_state = {k: torch.zeros_like(v) for k, v in module.state_dict().items()}
+    torch.save({"state_dict": module.state_dict(), "optimizer_states": [optimizer_state]}, checkpoint)
+    config = str(tmp_path / "config.yaml")
+    with open(config, "w") as f:
+        yaml.safe_dump({"model": {"net": {"class_path": "climax.arch.ClimaX", "init_args": net_args}}}, f)
+
+    x = torch.rand(2, len(vars), 8, 16)
+    lead_times = torch.rand(2)
+    with torch.no_grad():
+        _, ref = net(x, None, lead_times, vars, ["b"], None, None)
+
+    for dtype, atol in [("float32", 1e-6), ("float16", 1e-2), ("bfloat16", 5e-2)]:
+        weights = str(tmp_path / f"model_{dtype}.pt")
+        result = CliRunner().invoke(
+            main, ["--config", config, "--checkpoint", checkpoint, "--output", weights, "--dtype", dtype]
+        )
+        assert result.exit_code == 0, result.output
+
+        # the config is embedded in the weights file
+        exported = load_net(weights)
+        assert isinstance(exported, ClimaX) and exported.default_vars == vars
+        assert exported.pos_embed.dtype == getattr(torch, dtype)
+        assert exported.var_query.dtype == exported.var_agg.in_proj_weight.dtype == torch.float32
+        with torch.no_grad():
+            dtype = exported.pos_embed.dtype
+            _, preds = exported(x.to(dtype), None, lead_times.to(dtype), vars, ["b"], None, None)
+        assert torch.allclose(preds.float(), ref, atol=atol)
+
+    # Lightning checkpoints are loaded as well
+    with torch.no_grad():
+        _, preds = load_net(checkpoint, {"class_path": "climax.arch.ClimaX", "init_args": net_args})(
+            x, None, lead_times, vars, ["b"], None, None
+        )
+    assert torch.allclose(preds, ref)
+
+
+def test_export_frozen(tmp_path):
+    vars = ["a", "b", "c"]
+    for parallel_patch_embed in [False, True]:
+        net = ClimaX(
+            vars,
+            img_size=[8, 16],
+            patch_size=4,
+            embed_dim=32,
+            depth=1,
+            num_heads=2,
+            parallel_patch_embed=parallel_patch_embed,
+        )
+        module = FrozenClimaX(net, ["c", "a"], ["b"])
+        x, lead_times = module.example_inputs(3)
+        with torch.no_grad():
+            _, ref = net(x, None, lead_times, ["c", "a"], ["b"], None, None)
+        assert torch.allclose(module(x, lead_times), ref)
+
+        path = str(tmp_path / "model.ts")
+        export_torchscript(module, path)
+        assert validate_export(module, path, "torchscript") < 1e-6
+        # ONNX export and validation require onnx and onnxruntime
+        if importlib.util.find_spec("onnx") is not None and importlib.util.find_spec("onnxruntime") is not None:
+            path = str(tmp_path / "model.onnx")
+            export_onnx(module, path)
+            assert validate_export(module, path, "onnx") < 1e-5
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_export_weights(Path(tmp_dir))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_export_frozen(Path(tmp_dir))
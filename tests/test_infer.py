@@ -0,0 +1,75 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import torch
+import yaml
+import zarr
+from click.testing import CliRunner
+
+from climax.arch import ClimaX
+from climax.global_forecast.infer import main
+from climax.global_forecast.module import GlobalForecastModule
+
+
+def make_dataset(root_dir, variables, num_samples=6, img_size=(8, 16)):
+    for partition in ["train", "val", "test"]:
+        os.makedirs(os.path.join(root_dir, partition))
+        for shard_id in range(2):
+            data = {var: np.random.rand(num_samples, 1, *img_size).astype(np.float32) for var in variables}
+            np.savez(os.path.join(root_dir, partition, f"2017_{shard_id}.npz"), **data)
+        np.savez(
+            os.path.join(root_dir, partition, "climatology.npz"), **{var: np.zeros((1, *img_size)) for var in variables}
+        )
+    np.savez(os.path.join(root_dir, "normalize_mean.npz"), **{var: np.array([0.5]) for var in variables})
+    np.savez(os.path.join(root_dir, "normalize_std.npz"), **{var: np.array([2.0]) for var in variables})
+    np.save(os.path.join(root_dir, "lat.npy"), np.linspace(-78.75, 78.75, img_size[0]))
+    np.save(os.path.join(root_dir, "lon.npy"), np.linspace(0, 337.5, img_size[1]))
+
+
+def test_infer(tmp_path):
+    variables = ["a", "b"]
+    root_dir = str(tmp_path / "data")
+    make_dataset(root_dir, variables)
+
+    net_args = dict(default_vars=variables, img_size=[8, 16], patch_size=4, embed_dim=32, depth=1, num_heads=2)
+    net = ClimaX(**net_args).eval()
+    checkpoint = str(tmp_path / "model.ckpt")
+    torch.save({"state_dict": GlobalForecastModule(net).state_dict()}, checkpoint)
+    config = str(tmp_path / "config.yaml")
+    with open(config, "w") as f:
+        yaml.safe_dump(
+            {
+                "model": {"net": {"class_path": "climax.arch.ClimaX", "init_args": net_args}},
+                "data": {"root_dir": root_dir, "variables": variables, "out_variables": ["b"], "predict_range": 6},
+            },
+            f,
+        )
+
+    # 2017-01-01 04:00 to 2017-01-01 08:00 spans the two shards of 6 hours
+    output = str(tmp_path / "forecasts.zarr")
+    args = ["--config", config, "--checkpoint", checkpoint, "--output", output, "--batch_size", "3"]
+    args += ["--start", "2017-01-01 04:00:00", "--end", "2017-01-01 08:00:00", "-p", "6", "-p", "12"]
+    result = CliRunner().invoke(main, args)
+    assert result.exit_code == 0, result.output
+
+    store = zarr.open_group(output, mode="r")
+    assert store["forecast"].shape == (4, 2, 1, 8, 16)
+    assert list(store["lead_time"][:]) == [6, 12]
+    expected_hours = (datetime(2017, 1, 1, 4) - datetime(1970, 1, 1)).total_seconds() // 3600
+    assert list(store["time"][:]) == [expected_hours + i for i in range(4)]
+
+    # first initial condition: sample 4 of the first shard
+    x = np.concatenate([np.load(os.path.join(root_dir, "test", "2017_0.npz"))[var][4:5] for var in variables], axis=1)
+    x = (torch.from_numpy(x) - 0.5) / 2.0
+    with torch.no_grad():
+        preds = net.predict_multi_lead(x, torch.tensor([0.06, 0.12]), variables, ["b"]) * 2.0 + 0.5
+    assert np.allclose(store["forecast"][0], preds[0].numpy(), atol=1e-5)
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_infer(Path(tmp_dir))
@@ -0,0 +1,73 @@
+import torch
+
+from climax.arch import ClimaX
+from climax.attention import get_local_attn_index, local_block_forward
+
+
+def test_local_attention_full_window():
+    vars = tuple(["a", "b"])
+    model = ClimaX(vars, img_size=[16, 32], patch_size=4, embed_dim=32, depth=1, num_heads=4, drop_path=0, drop_rate=0)
+    blk = model.blocks[0].eval()
+    x = torch.rand(2, 2 + model.num_patches, 32)
+
+    # a window covering the whole grid is full attention
+    neighbor_ids, neighbor_mask = get_local_attn_index((4, 8), (7, 15), wrap_lon=False)
+    with torch.no_grad():
+        assert torch.allclose(local_block_forward(blk, x[:, 2:], neighbor_ids, neighbor_mask), blk(x[:, 2:]), atol=1e-5)
+        assert torch.allclose(local_block_forward(blk, x, neighbor_ids, neighbor_mask, 2), blk(x), atol=1e-5)
+
+
+def test_local_attention_neighborhood():
+    neighbor_ids, neighbor_mask = get_local_attn_index((4, 8), (3, 3))
+    # first patch: the row below is outside of the grid and longitude wraps around
+    assert sorted(neighbor_ids[0][neighbor_mask[0]].tolist()) == [0, 1, 7, 8, 9, 15]
+
+    vars = tuple(["a", "b"])
+    model = ClimaX(
+        vars,
+        img_size=[16, 32],
+        patch_size=4,
+        embed_dim=32,
+        depth=1,
+        num_heads=4,
+        local_attn_blocks=[0],
+        local_attn_window=[3, 3],
+    ).eval()
+    x = torch.rand(1, len(vars), 16, 32)
+    lead_times = torch.rand(1)
+    with torch.no_grad():
+        out = model.forward_encoder(x, lead_times, vars)
+        # perturb the last patch of the first row, a neighbor of the first patch through the wrap-around
+        x[..., :4, -4:] += 1
+        perturbed = model.forward_encoder(x, lead_times, vars)
+    changed = (out - perturbed).abs().amax(dim=-1)[0].view(4, 8)
+    assert changed[0, 0] > 0 and changed[1, 6] > 0
+    assert changed[0, 1] == 0 and changed[2, 7] == 0
+
+
+def test_global_tokens():
+    vars = tuple(["a", "b"])
+    model = ClimaX(vars, img_size=[16, 32], patch_size=4, embed_dim=32, depth=2, num_heads=4)
+    local_model = ClimaX(
+        vars,
+        img_size=[16, 32],
+        patch_size=4,
+        embed_dim=32,
+        depth=2,
+        num_heads=4,
+        local_attn_blocks=[1],
+        num_global_tokens=2,
+    )
+    # pretrained weights are compatible, only the global tokens are new
+    missing, unexpected = local_model.load_state_dict(model.state_dict(), strict=False)
+    assert missing == ["global_tokens"] and unexpected == []
+
+    x = torch.rand(2, len(vars), 16, 32)
+    _, preds = local_model.forward(x, None, torch.rand(2), vars, ["b"], None, None)
+    assert preds.shape == (2, 1, 16, 32)
+
+
+if __name__ == "__main__":
+    test_local_attention_full_window()
+    test_local_attention_neighborhood()
+    test_global_tokens()
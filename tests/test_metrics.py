@@ -0,0 +1,118 @@
+import numpy as np
+import torch
+from scipy import stats
+
+from climax.utils.metrics import (
+    ForecastMetricsAccumulator,
+    MetricsContext,
+    lat_weighted_acc,
+    lat_weighted_mse,
+    lat_weighted_mse_val,
+    lat_weighted_rmse,
+    pearson,
+)
+
+
+def test_metrics_context():
+    lat = np.linspace(-87.1875, 87.1875, 32)
+    context = MetricsContext(lat)
+    pred, y = torch.rand(2, 3, 32, 64), torch.rand(2, 3, 32, 64)
+    clim = torch.rand(3, 32, 64)
+    vars = ["a", "b", "c"]
+
+    # same values as with the latitudes, with weights computed once per dtype and device
+    results = [
+        (lat_weighted_mse(pred, y, vars, lat), lat_weighted_mse(pred, y, vars, context)),
+        (
+            lat_weighted_rmse(pred, y, lambda t: t, vars, lat, clim, "test"),
+            lat_weighted_rmse(pred, y, lambda t: t, vars, context, clim, "test"),
+        ),
+        (
+            lat_weighted_acc(pred, y, lambda t: t, vars, lat, clim, "test"),
+            lat_weighted_acc(pred, y, lambda t: t, vars, context, clim, "test"),
+        ),
+    ]
+    for expected, actual in results:
+        for k in expected.keys():
+            assert np.allclose(expected[k], actual[k], atol=1e-6)
+    assert context.lat_weights(torch.float32, pred.device) is context.lat_weights(torch.float32, pred.device)
+
+    # region slices are cached
+    region = context[4:10]
+    assert context[4:10] is region
+    assert np.allclose(region.lat, lat[4:10])
+
+    # weights created in inference mode can be used in training
+    context = MetricsContext(lat)
+    with torch.inference_mode():
+        lat_weighted_mse(pred, y, vars, context)
+    pred.requires_grad_(True)
+    lat_weighted_mse(pred, y, vars, context)["loss"].backward()
+
+
+def test_per_variable_metrics():
+    lat = np.linspace(-87.1875, 87.1875, 32)
+    pred, y = torch.rand(2, 3, 32, 64), torch.rand(2, 3, 32, 64)
+    clim = torch.rand(3, 32, 64)
+    mask = torch.rand(2, 32, 64) > 0.5
+    vars = ["a", "b", "c"]
+
+    # variables are reduced together, each one as if it was alone
+    loss_dict = lat_weighted_mse(pred, y, vars, lat, mask=mask)
+    for metric in [lat_weighted_mse_val, lat_weighted_rmse, lat_weighted_acc]:
+        metric_dict = metric(pred, y, lambda t: t, vars, lat, clim, "test")
+        for i, var in enumerate(vars):
+            single = metric(pred[:, i : i + 1], y[:, i : i + 1], lambda t: t, [var], lat, clim[i : i + 1], "test")
+            key = [k for k in single.keys() if var in k][0]
+            assert torch.allclose(metric_dict[key], single[key], atol=1e-6)
+    for i, var in enumerate(vars):
+        single = lat_weighted_mse(pred[:, i : i + 1], y[:, i : i + 1], [var], lat, mask=mask)
+        assert torch.allclose(loss_dict[var], single[var], atol=1e-6)
+    assert torch.allclose(loss_dict["loss"], torch.stack([loss_dict[var] for var in vars]).mean())
+
+
+def test_pearson():
+    lat = np.linspace(-87.1875, 87.1875, 16)
+    pred, y = torch.rand(4, 3, 2, 16, 32), torch.rand(4, 3, 2, 16, 32)
+    y = y + pred
+    pred[0, 1, 0, 2, 3] = float("nan")
+    y[2, 1, 0, 5, 5] = float("inf")
+    vars = ["a", "b"]
+
+    loss_dict = pearson(pred, y, lambda t: t, vars, lat, [1, 2], [1, 2], None)
+    for i, var in enumerate(vars):
+        for day, step in zip([1, 2], [1, 2]):
+            pred_, y_ = pred[:, step - 1, i].flatten(), y[:, step - 1, i].flatten()
+            valid = torch.isfinite(pred_) & torch.isfinite(y_)
+            expected = stats.pearsonr(pred_[valid].numpy(), y_[valid].numpy())[0]
+            assert np.isclose(loss_dict[f"pearsonr_{var}_day_{day}"].item(), expected, atol=1e-5)
+    assert loss_dict["pearsonr"].device == pred.device
+
+
+def test_forecast_metrics_accumulator():
+    lat = np.linspace(-87.1875, 87.1875, 16)
+    pred, y = torch.rand(7, 2, 16, 32), torch.rand(7, 2, 16, 32)
+    clim = torch.rand(2, 16, 32)
+    vars = ["a", "b"]
+
+    # batches of unequal sizes give the scores of the whole set
+    metrics = ForecastMetricsAccumulator()
+    for batch in [slice(0, 4), slice(4, 7)]:
+        metrics.update(pred[batch], y[batch], lambda t: t, vars, MetricsContext(lat), clim)
+    loss_dict = metrics.compute(["6_hours"])
+    for metric in [lat_weighted_mse_val, lat_weighted_rmse, lat_weighted_acc]:
+        expected = metric(pred, y, lambda t: t, vars, lat, clim, "6_hours")
+        for k in expected.keys():
+            assert torch.allclose(loss_dict[k], expected[k].float(), atol=1e-5)
+
+    # without any update, e.g. on a rank with an empty shard, the scores are NaN
+    metrics.reset()
+    loss_dict = metrics.compute(["6_hours"])
+    assert torch.isnan(loss_dict["w_rmse_a_6_hours"]) and torch.isnan(loss_dict["acc"])
+
+
+if __name__ == "__main__":
+    test_metrics_context()
+    test_per_variable_metrics()
+    test_pearson()
+    test_forecast_metrics_accumulator()
@@ -0,0 +1,35 @@
+import numpy as np
+import torch
+
+from climax.arch import ClimaX
+from climax.utils.metrics import lat_weighted_mse, lat_weighted_rmse
+
+
+def test_bf16_autocast():
+    torch.manual_seed(0)
+    vars = tuple([f"var_{i}" for i in range(48)])
+    model = ClimaX(vars, img_size=[16, 32], patch_size=4, embed_dim=64, depth=2, num_heads=4).eval()
+    x = torch.randn(2, len(vars), 16, 32)
+    y = torch.randn(2, 2, 16, 32)
+    lead_times = torch.rand(2)
+    lat = np.linspace(-84.375, 84.375, 16)
+
+    with torch.no_grad():
+        loss, preds = model.forward(x, y, lead_times, vars, vars[:2], [lat_weighted_mse], lat)
+        with torch.autocast(device_type="cpu", dtype=torch.bfloat16):
+            aggregated = model.aggregate_variables(model.embed_variables(x, vars))
+            bf16_loss, bf16_preds = model.forward(x, y, lead_times, vars, vars[:2], [lat_weighted_mse], lat)
+            bf16_rmse = model.evaluate(
+                x, y, lead_times, vars, vars[:2], lambda t: t, [lat_weighted_rmse], lat, None, "test"
+            )
+
+    assert aggregated.dtype == torch.float32
+    assert bf16_preds.dtype == torch.bfloat16
+    assert bf16_loss[0]["loss"].dtype == torch.float32
+    assert bf16_rmse[0]["w_rmse_var_0_test"].dtype == torch.float32
+    assert torch.allclose(bf16_preds.float(), preds, atol=5e-2)
+    assert torch.allclose(bf16_loss[0]["loss"], loss[0]["loss"], rtol=1e-2)
+
+
+if __name__ == "__main__":
+    test_bf16_autocast()
@@ -0,0 +1,30 @@
+import torch
+
+from climax.arch import ClimaX
+
+
+def test_predict_multi_lead():
+    vars = tuple(["a", "b", "c"])
+    out_vars = ["c", "a"]
+    model = ClimaX(vars, img_size=[32, 64], patch_size=4, embed_dim=128, depth=2)
+    model.eval()
+
+    x = torch.rand(2, len(vars), 32, 64)
+    lead_times = torch.tensor([0.06, 0.24, 0.72])
+
+    with torch.no_grad():
+        preds = model.predict_multi_lead(x, lead_times, vars, out_vars)
+        assert preds.shape == (2, len(lead_times), len(out_vars), 32, 64)
+        for i, lead_time in enumerate(lead_times):
+            _, single_preds = model.forward(x, None, lead_time.repeat(2), vars, out_vars, metric=None, lat=None)
+            assert torch.allclose(preds[:, i], single_preds, atol=1e-5)
+
+        # per-sample lead times
+        per_sample_lead_times = torch.stack([lead_times, lead_times.flip(0)])
+        preds = model.predict_multi_lead(x, per_sample_lead_times, vars, out_vars)
+        _, single_preds = model.forward(x, None, per_sample_lead_times[:, 0], vars, out_vars, metric=None, lat=None)
+        assert torch.allclose(preds[:, 0], single_preds, atol=1e-5)
+
+
+if __name__ == "__main__":
+    test_predict_multi_lead()
@@ -0,0 +1,52 @@
+import numpy as np
+import torch
+
+from climax.arch import ClimaX
+from climax.global_forecast.module import GlobalForecastModule
+from climax.pretrain.dataset import Forecast, MultiLeadForecast
+from climax.utils.metrics import ForecastMetricsAccumulator
+
+
+def test_multi_lead_forecast_dataset():
+    data = {"a": np.random.rand(10, 1, 4, 8), "b": np.random.rand(10, 1, 4, 8)}
+    reader = [(data, ["a", "b"], ["b"])]
+
+    inputs, outputs, lead_times, _, _ = next(iter(MultiLeadForecast(reader, predict_ranges=[1, 3])))
+    assert inputs.shape == (7, 2, 4, 8)
+    assert outputs.shape == (7, 2, 1, 4, 8)
+    assert torch.allclose(lead_times[0], torch.tensor([0.01, 0.03]))
+    # targets at each lead time are those of a single lead time forecast
+    for t, predict_range in enumerate([1, 3]):
+        _, single_outputs, _, _, _ = next(iter(Forecast(reader, max_predict_range=predict_range)))
+        assert torch.equal(outputs[:, t], single_outputs[: len(outputs)])
+
+
+def test_multi_lead_evaluation():
+    vars = ["a", "b"]
+    net = ClimaX(vars, img_size=[16, 32], patch_size=4, embed_dim=32, depth=1, num_heads=2).eval()
+    module = GlobalForecastModule(net)
+    module.set_lat_lon(np.linspace(-84.375, 84.375, 16), np.linspace(0, 348.75, 32))
+    module.set_denormalization([0.0, 0.0], [1.0, 1.0])
+    module.set_eval_pred_ranges([6, 24])
+    clim = torch.rand(2, 16, 32)
+
+    x, y = torch.rand(3, 2, 16, 32), torch.rand(3, 2, 2, 16, 32)
+    lead_times = torch.tensor([[0.06, 0.24]]).expand(3, -1)
+    with torch.no_grad():
+        module.evaluation_step((x, y, lead_times, vars, vars), module.test_metrics, clim)
+    loss_dict = module.test_metrics.compute(["6_hours", "1_days"])
+
+    # same scores as evaluating each lead time separately
+    for t, postfix in enumerate(["6_hours", "1_days"]):
+        metrics = ForecastMetricsAccumulator()
+        with torch.no_grad():
+            module.evaluation_step((x, y[:, t], lead_times[:, t], vars, vars), metrics, clim)
+        single = metrics.compute([postfix])
+        for var in vars:
+            key = f"w_rmse_{var}_{postfix}"
+            assert torch.allclose(loss_dict[key], single[key], atol=1e-5)
+
+
+if __name__ == "__main__":
+    test_multi_lead_forecast_dataset()
+    test_multi_lead_evaluation()
@@ -0,0 +1,37 @@
+import torch
+
+from climax.arch import ClimaX
+from climax.global_forecast.module import GlobalForecastModule
+
+
+def test_pretrained_vars(tmp_path):
+    pretrained_vars = ["a", "b", "c", "d"]
+    for parallel_patch_embed in [False, True]:
+        net_args = dict(img_size=[8, 16], patch_size=4, embed_dim=32, depth=1, num_heads=2)
+        net_args["parallel_patch_embed"] = parallel_patch_embed
+        pretrained = ClimaX(pretrained_vars, **net_args).eval()
+        checkpoint = str(tmp_path / "pretrained.ckpt")
+        torch.save({"state_dict": GlobalForecastModule(pretrained).state_dict()}, checkpoint)
+
+        # a subset of the variables in another order, and a variable which was not pretrained
+        vars = ["d", "b", "e"]
+        net = ClimaX(vars, **net_args).eval()
+        init_e = net.var_embed[0, 2].clone()
+        GlobalForecastModule(net, pretrained_path=checkpoint, pretrained_vars=pretrained_vars)
+        assert torch.equal(net.var_embed[0, :2], pretrained.var_embed[0, [3, 1]])
+        assert torch.equal(net.var_embed[0, 2], init_e)
+
+        x = torch.rand(2, 2, 8, 16)
+        lead_times = torch.rand(2)
+        with torch.no_grad():
+            _, ref = pretrained(x, None, lead_times, ["d", "b"], ["b", "d"], None, None)
+            _, preds = net(x, None, lead_times, ["d", "b"], ["b", "d"], None, None)
+        assert torch.allclose(preds, ref, atol=1e-6)
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_pretrained_vars(Path(tmp_dir))
@@ -0,0 +1,33 @@
+import numpy as np
+import torch
+from torch.ao.nn.quantized.dynamic import Linear as DynamicQuantizedLinear
+
+from climax.arch import ClimaX
+from climax.export import quantize_net
+from climax.utils.metrics import lat_weighted_rmse
+
+
+def test_quantize_net():
+    vars = ("a", "b", "c")
+    model = ClimaX(vars, img_size=[16, 32], patch_size=4, embed_dim=64, depth=2, num_heads=4).eval()
+    quantized = quantize_net(model)
+    assert isinstance(quantized.blocks[0].attn.qkv, DynamicQuantizedLinear)
+    assert isinstance(quantized.var_agg_kv, DynamicQuantizedLinear)
+    # the model is quantized on a copy
+    assert type(model.blocks[0].attn.qkv) is torch.nn.Linear and model.var_agg_kv is None
+    assert isinstance(quantized.head[0], DynamicQuantizedLinear)
+    # rows of the last head layer are selected by `decode`
+    assert type(quantized.head[-1]) is torch.nn.Linear
+
+    x = torch.randn(4, len(vars), 16, 32)
+    lead_times = torch.rand(4)
+    lat = np.linspace(-78.75, 78.75, 16)
+    with torch.no_grad():
+        _, ref = model(x, None, lead_times, vars, ["b", "c"], None, None)
+        _, preds = quantized(x, None, lead_times, vars, ["b", "c"], None, None)
+    rmse = lat_weighted_rmse(preds, ref, lambda t: t, ["b", "c"], lat, None, "")["w_rmse"]
+    assert rmse < 0.05 * ref.std()
+
+
+if __name__ == "__main__":
+    test_quantize_net()
@@ -0,0 +1,98 @@
+import numpy as np
+import torch
+
+from climax.regional_forecast.arch import RegionalClimaX
+from climax.regional_forecast.datamodule import collate_fn_regional
+from climax.utils.data_utils import crop_region, get_region_info, get_regions_info
+from climax.utils.metrics import lat_weighted_mse
+
+
+def test_regional_crop():
+    vars = tuple(["a", "b", "c"])
+    model = RegionalClimaX(vars, img_size=[32, 64], patch_size=2, embed_dim=64, depth=2, num_heads=4)
+    model.eval()
+    lat = np.linspace(-87.1875, 87.1875, 32)
+    lon = np.linspace(0, 354.375, 64)
+    region_info = get_region_info("Europe", lat, lon, model.patch_size)
+
+    x = torch.rand(2, len(vars), 32, 64)
+    lead_times = torch.rand(2)
+
+    with torch.no_grad():
+        # reference: tokenize the global grid and select the patches of the region afterwards
+        ref = model.embed_variables(x, vars)[:, :, region_info["patch_ids"]]
+        ref = model.aggregate_variables(ref) + model.pos_embed[:, region_info["patch_ids"]]
+        ref = model.forward_blocks(ref, lead_times)
+        h = region_info["max_h"] - region_info["min_h"] + 1
+        w = region_info["max_w"] - region_info["min_w"] + 1
+        ref = model.decode(ref, ["c"], h=h, w=w)
+
+        _, global_preds = model.forward(x, None, lead_times, vars, ["c"], None, lat, region_info)
+        _, cropped_preds = model.forward(
+            crop_region(x, region_info), None, lead_times, vars, ["c"], None, lat, region_info
+        )
+
+    assert cropped_preds.shape == (2, 1, h, w)
+    assert torch.allclose(global_preds, ref, atol=1e-5)
+    assert torch.allclose(cropped_preds, ref, atol=1e-5)
+
+
+def test_region_info():
+    lat = np.linspace(-87.1875, 87.1875, 32)
+    lon = np.linspace(0, 354.375, 64)
+    europe = get_region_info("Europe", lat, lon, 2)
+    assert (europe["max_h"] - europe["min_h"] + 1, europe["max_w"] - europe["min_w"] + 1) == (6, 8)
+    assert len(europe["patch_ids"]) == 3 * 4
+    # descriptors are cached and callers get copies, which cannot corrupt the cache
+    cached = get_region_info("Europe", lat, lon, 2)
+    assert cached["patch_ids"] is europe["patch_ids"]
+    cached["name"] = "Europe"
+    assert "name" not in get_region_info("Europe", lat, lon, 2)
+
+    # user-defined bounding boxes and multiple regions
+    box = {"lat_range": (30, 65), "lon_range": (0, 40)}
+    infos = get_regions_info([box, "NorthAmerica"], lat, lon, 2)
+    assert {k: v for k, v in infos[0].items() if k != "name"} == europe
+    assert infos[1]["name"] == "NorthAmerica"
+    assert len(infos[1]["patch_ids"]) == 4 * 7
+
+
+def test_packed_regions():
+    vars = tuple(["a", "b", "c"])
+    model = RegionalClimaX(vars, img_size=[32, 64], patch_size=2, embed_dim=64, depth=2, num_heads=4)
+    model.eval()
+    lat = np.linspace(-87.1875, 87.1875, 32)
+    lon = np.linspace(0, 354.375, 64)
+    regions = get_regions_info(["Europe", "NorthAmerica"], lat, lon, model.patch_size)
+
+    x = torch.rand(len(regions), len(vars), 32, 64)
+    y = torch.rand(len(regions), 1, 32, 64)
+    lead_times = torch.rand(len(regions))
+    batch = [
+        (crop_region(x[i], info), crop_region(y[i], info), lead_times[i], vars, ["c"], info)
+        for i, info in enumerate(regions)
+    ]
+    inp, out, _, _, out_vars, packed_info = collate_fn_regional(batch, packed=True)
+    # batches of a single region are packed as well when training on several regions
+    assert model.is_packed(collate_fn_regional(batch[:1], packed=True)[-1])
+    assert not model.is_packed(collate_fn_regional(batch[:1])[-1])
+
+    with torch.no_grad():
+        loss, preds = model.forward(inp, out, lead_times, vars, out_vars, [lat_weighted_mse], lat, packed_info)
+        for i, info in enumerate(regions):
+            _, ref = model.forward(x[i : i + 1], None, lead_times[i : i + 1], vars, out_vars, None, lat, info)
+            h, w = ref.shape[-2:]
+            assert torch.allclose(preds[i : i + 1, :, :h, :w], ref, atol=1e-5)
+
+    # padded grid cells do not contribute to the loss
+    out[~packed_info["mask"].unsqueeze(1).expand_as(out)] = 1e6
+    with torch.no_grad():
+        padded_loss, _ = model.forward(inp, out, lead_times, vars, out_vars, [lat_weighted_mse], lat, packed_info)
+    assert torch.isfinite(loss[0]["loss"])
+    assert torch.allclose(loss[0]["loss"], padded_loss[0]["loss"])
+
+
+if __name__ == "__main__":
+    test_regional_crop()
+    test_region_info()
+    test_packed_regions()
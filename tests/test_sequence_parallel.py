@@ -0,0 +1,72 @@
+import os
+import tempfile
+
+import numpy as np
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from climax.arch import ClimaX
+from climax.sequence_parallel import gather_rows
+from climax.utils.metrics import lat_weighted_mse
+
+
+def run_sequence_parallel(rank, world_size, init_file):
+    dist.init_process_group("gloo", init_method=f"file://{init_file}", rank=rank, world_size=world_size)
+    torch.manual_seed(0)
+    vars = ("a", "b", "c")
+    model = ClimaX(
+        vars,
+        img_size=[16, 32],
+        patch_size=2,
+        embed_dim=32,
+        depth=2,
+        num_heads=4,
+        drop_path=0,
+        drop_rate=0,
+        static_vars=["c"],
+    )
+    with torch.no_grad():
+        # sharp attention, so that tokens mixed up across ranks do not go unnoticed
+        for blk in model.blocks:
+            blk.attn.qkv.weight.mul_(20)
+    x = torch.rand(2, len(vars), 16, 32)
+    y = torch.rand(2, 2, 16, 32)
+    lead_times = torch.rand(2)
+    lat = np.linspace(-80, 80, 16)
+
+    loss, preds = model.forward(x, y, lead_times, vars, ["b", "c"], [lat_weighted_mse], lat)
+    loss[0]["loss"].backward()
+    ref_grads = {name: p.grad.clone() for name, p in model.named_parameters() if p.grad is not None}
+    model.zero_grad()
+
+    sp_loss, sp_preds = model.forward_sequence_parallel(x, y, lead_times, vars, ["b", "c"], [lat_weighted_mse], lat)
+    assert sp_preds.shape == (2, 2, 16 // world_size, 32)
+    assert torch.allclose(gather_rows(sp_preds.detach()), preds.detach(), atol=1e-5)
+    with torch.no_grad():
+        # static embeddings of the rows of the rank are cached under their extent in grid cells
+        _, cached_preds = model.forward_sequence_parallel(x, None, lead_times, vars, ["b", "c"], None, lat)
+    assert torch.allclose(cached_preds, sp_preds.detach(), atol=1e-6)
+    h = 16 // world_size
+    assert [key[1] for key in model._static_embeds_cache] == [(rank * h, (rank + 1) * h - 1, 0, 31)]
+
+    sp_loss[0]["loss"].backward()
+    total_loss = sp_loss[0]["loss"].detach().clone()
+    dist.all_reduce(total_loss)
+    assert torch.allclose(total_loss / world_size, loss[0]["loss"], atol=1e-6)
+    for name, p in model.named_parameters():
+        if name in ref_grads:
+            # gradients averaged across ranks, as with data parallel training
+            dist.all_reduce(p.grad)
+            assert torch.allclose(p.grad / world_size, ref_grads[name], atol=1e-5), name
+    dist.destroy_process_group()
+
+
+def test_sequence_parallel():
+    for world_size in [2, 4]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            mp.spawn(run_sequence_parallel, args=(world_size, os.path.join(tmp_dir, "init")), nprocs=world_size)
+
+
+if __name__ == "__main__":
+    test_sequence_parallel()
@@ -0,0 +1,29 @@
+import asyncio
+
+import torch
+
+from climax.arch import ClimaX
+from climax.serving import ForecastServer
+
+
+def test_serving():
+    vars = ("a", "b", "c")
+    model = ClimaX(vars, img_size=[8, 16], patch_size=4, embed_dim=32, depth=1, num_heads=2).eval()
+    x = torch.rand(5, len(vars), 8, 16)
+    lead_times = torch.rand(5)
+    requests = [(x[i], lead_times[i].item(), vars, ("b",)) for i in range(3)]
+    requests += [(x[i, :2], lead_times[i].item(), ("a", "c"), ("a", "c")) for i in range(3, 5)]
+
+    async def serve():
+        async with ForecastServer(model, max_batch_size=2, max_latency=0.05) as server:
+            return await asyncio.gather(*[server.predict(*request) for request in requests])
+
+    preds = asyncio.run(serve())
+    with torch.no_grad():
+        for (x_i, lead_time, variables, out_variables), pred in zip(requests, preds):
+            _, ref = model(x_i.unsqueeze(0), None, torch.tensor([lead_time]), variables, out_variables, None, None)
+            assert torch.allclose(pred, ref[0], atol=1e-5)
+
+
+if __name__ == "__main__":
+    test_serving()
@@ -0,0 +1,48 @@
+import torch
+
+from climax.arch import ClimaX
+
+
+def test_static_embeds():
+    vars = tuple(["a", "b", "c", "d"])
+    model = ClimaX(vars, img_size=[32, 64], patch_size=4, embed_dim=128, depth=2)
+    static_model = ClimaX(vars, img_size=[32, 64], patch_size=4, embed_dim=128, depth=2, static_vars=["a", "c"])
+    static_model.load_state_dict(model.state_dict())
+    model.eval()
+    static_model.eval()
+
+    x = torch.rand(4, len(vars), 32, 64)
+    # static variables are identical for all samples
+    x[:, 0] = x[0, 0]
+    x[:, 2] = x[0, 2]
+    lead_times = torch.rand(4)
+
+    with torch.no_grad():
+        out = model.forward_encoder(x, lead_times, vars)
+        static_out = static_model.forward_encoder(x, lead_times, vars)
+        assert torch.allclose(out, static_out, atol=1e-5)
+        assert len(static_model._static_embeds_cache) == 1
+
+        # the cached embeddings are reused
+        ((_, cached),) = static_model._static_embeds_cache.values()
+        static_model.forward_encoder(x, lead_times, vars)
+        ((_, reused),) = static_model._static_embeds_cache.values()
+        assert cached is reused
+
+        # updating the weights invalidates the cache
+        static_model.token_embeds[0].proj.weight.add_(1.0)
+        static_model.forward_encoder(x, lead_times, vars)
+        ((_, updated),) = static_model._static_embeds_cache.values()
+        assert updated is not cached
+        assert not torch.allclose(updated, cached)
+
+    # with gradients the static embeddings are not cached across steps
+    static_model.train()
+    static_model._static_embeds_cache.clear()
+    static_model.forward_encoder(x, lead_times, vars).sum().backward()
+    assert len(static_model._static_embeds_cache) == 0
+    assert static_model.token_embeds[0].proj.weight.grad is not None
+
+
+if __name__ == "__main__":
+    test_static_embeds()
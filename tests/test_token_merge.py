@@ -0,0 +1,38 @@
+import torch
+
+from climax.arch import ClimaX
+from climax.token_merge import get_polar_merge_ids, merge_tokens, unmerge_tokens
+
+
+def test_polar_merge_ids():
+    merge_ids, merge_counts = get_polar_merge_ids((16, 32))
+    assert merge_counts.sum() == 16 * 32
+    assert 0.25 <= 1 - len(merge_counts) / (16 * 32) <= 0.35
+    # polar rows are merged, equatorial rows are not, symmetrically
+    rows = merge_ids.view(16, 32)
+    assert len(rows[0].unique()) == len(rows[-1].unique()) < 32
+    assert len(rows[8].unique()) == 32
+
+    x = torch.rand(2, len(merge_counts), 8)
+    assert torch.allclose(merge_tokens(unmerge_tokens(x, merge_ids), merge_ids, merge_counts), x)
+
+
+def test_merge_polar_tokens():
+    vars = tuple(["a", "b"])
+    model = ClimaX(vars, img_size=[32, 64], patch_size=2, embed_dim=32, depth=1, num_heads=4, merge_polar_tokens=True)
+    model.eval()
+    x = torch.rand(2, len(vars), 32, 64)
+    lead_times = torch.rand(2)
+    with torch.no_grad():
+        out = model.forward_encoder(x, lead_times, vars)
+        multi_lead_out = model.forward_encoder_multi_lead(x, lead_times.unsqueeze(-1), vars)
+    assert out.shape == (2, model.num_patches, 32)
+    assert torch.allclose(multi_lead_out[:, 0], out, atol=1e-5)
+    # tokens of a merged group share their output
+    first_row = out[:, : 64 // 2]
+    assert torch.allclose(first_row[:, 0], first_row[:, 1])
+
+
+if __name__ == "__main__":
+    test_polar_merge_ids()
+    test_merge_polar_tokens()
@@ -0,0 +1,47 @@
+import gc
+import weakref
+
+import torch
+
+from climax.arch import ClimaX
+
+
+def test_models_are_released():
+    vars = tuple(["a", "b", "c"])
+    refs = []
+    for _ in range(100):
+        model = ClimaX(vars, img_size=[8, 16], patch_size=4, embed_dim=16, depth=1, decoder_depth=1, num_heads=2)
+        model.get_var_ids(vars, torch.device("cpu"))
+        model.get_var_ids(vars[:2], torch.device("cpu"))
+        refs.append(weakref.ref(model))
+        del model
+    gc.collect()
+    assert all(ref() is None for ref in refs)
+
+
+def test_var_ids_cache():
+    vars = tuple(["a", "b", "c"])
+    model = ClimaX(vars, img_size=[8, 16], patch_size=4, embed_dim=16, depth=1, num_heads=2, var_ids_cache_size=2)
+    device = torch.device("cpu")
+
+    ids = model.get_var_ids(("c", "a"), device)
+    assert ids.tolist() == [2, 0]
+    assert model.get_var_ids(("c", "a"), device) is ids
+    assert "var_ids_0" in dict(model.named_buffers())
+    assert "var_ids_0" not in model.state_dict()
+
+    # the cache is bounded
+    for var in vars:
+        assert model.get_var_ids((var,), device).tolist() == [model.var_map[var]]
+    assert len(model._var_ids_cache) == 2
+    assert len(list(model.buffers())) == 2
+
+    # loading weights clears the cache
+    model.load_state_dict(model.state_dict())
+    assert len(model._var_ids_cache) == 0
+    assert len(list(model.buffers())) == 0
+
+
+if __name__ == "__main__":
+    test_models_are_released()
+    test_var_ids_cache()
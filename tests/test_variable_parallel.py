@@ -0,0 +1,53 @@
+import os
+import tempfile
+
+import numpy as np
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from climax.arch import ClimaX
+from climax.utils.metrics import lat_weighted_mse
+
+
+def run_variable_parallel(rank, world_size, init_file):
+    dist.init_process_group("gloo", init_method=f"file://{init_file}", rank=rank, world_size=world_size)
+    torch.manual_seed(0)
+    vars = ("a", "b", "c", "d", "e")
+    model = ClimaX(vars, img_size=[8, 16], patch_size=2, embed_dim=32, depth=2, num_heads=4, static_vars=["e"])
+    model.eval()
+    with torch.no_grad():
+        # the query is zero-initialized, which gives uniform attention over the variables
+        model.var_query.normal_(std=5.0)
+    x = torch.rand(2, len(vars), 8, 16)
+    y = torch.rand(2, 2, 8, 16)
+    lead_times = torch.rand(2)
+    lat = np.linspace(-80, 80, 8)
+
+    loss, preds = model.forward(x, y, lead_times, vars, ["b", "c"], [lat_weighted_mse], lat)
+    loss[0]["loss"].backward()
+    ref_grads = {name: p.grad.clone() for name, p in model.named_parameters() if p.grad is not None}
+    model.zero_grad(set_to_none=True)
+
+    vp_loss, vp_preds = model.forward_variable_parallel(x, y, lead_times, vars, ["b", "c"], [lat_weighted_mse], lat)
+    assert torch.allclose(vp_preds, preds, atol=1e-5)
+    assert torch.allclose(vp_loss[0]["loss"], loss[0]["loss"], atol=1e-6)
+
+    vp_loss[0]["loss"].backward()
+    for name, p in model.named_parameters():
+        if name in ref_grads:
+            # gradients averaged across ranks, as with data parallel training
+            grad = p.grad if p.grad is not None else torch.zeros_like(p)
+            dist.all_reduce(grad)
+            assert torch.allclose(grad / world_size, ref_grads[name], atol=1e-5), name
+    dist.destroy_process_group()
+
+
+def test_variable_parallel():
+    for world_size in [2, 4]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            mp.spawn(run_variable_parallel, args=(world_size, os.path.join(tmp_dir, "init")), nprocs=world_size)
+
+
+if __name__ == "__main__":
+    test_variable_parallel()